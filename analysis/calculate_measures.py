@@ -2,9 +2,12 @@ import pandas as pd
 import numpy as np
 from utilities import (
     OUTPUT_DIR,
-    match_input_files_filtered,
-    get_date_input_file_filtered,
+    INDICATOR_E_F_NUMERATORS,
+    GroupSumAccumulator,
+    get_manifest,
     calculate_rate,
+    read_filtered,
+    require_filtered_columns,
     update_demographics,
 )
 from config import indicators_list, backend
@@ -19,102 +22,93 @@ demographics = ["age_band", "sex", "region", "imd", "ethnicity"]
 
 demographics_df = pd.DataFrame(columns=["patient_id"] + (demographics))
 
+numerators = {i: f"indicator_{i}_numerator" for i in indicators_list}
+
+# the same denominator is used for both mtx measures
+denominators = {
+    i: "indicator_me_denominator"
+    if i in ["me_no_fbc", "me_no_lft"]
+    else f"indicator_{i}_denominator"
+    for i in indicators_list
+}
+
+# every numerator and denominator, summed together for each demographic
+value_columns = list(dict.fromkeys([*numerators.values(), *denominators.values()]))
+
+# columns read from the monthly input_filtered files
+columns = (
+    ["patient_id", "practice"]
+    + demographics
+    + [c for c in value_columns if c not in INDICATOR_E_F_NUMERATORS]
+)
+
 
 if __name__ == "__main__":
-    df_dict = {}
-    df_dict_additional = {i: [] for i in additional_indicators}
-    for d in demographics:
-        df_dict[d] = {}
+    manifest = get_manifest()
+    require_filtered_columns(manifest, columns)
+    dates = manifest.dates("input_filtered")
+
+    additional_sums = GroupSumAccumulator(
+        "practice",
+        [numerators[i] for i in additional_indicators]
+        + [denominators[i] for i in additional_indicators],
+        dates,
+    )
+    demographic_sums = {
+        d: GroupSumAccumulator(d, value_columns, dates) for d in demographics
+    }
 
-        for i in indicators_list:
-            df_dict[d][i] = []
+    for date, input_file in manifest.iter_files("input_filtered"):
+        df = read_filtered(manifest, date, input_file, columns)
 
-    for file in OUTPUT_DIR.iterdir():
-        if match_input_files_filtered(file.name):
-            df = pd.read_feather(OUTPUT_DIR / file.name)
+        additional_sums.add(date, df)
 
-            date = get_date_input_file_filtered(file.name)
+        # update demographics data
+        if date == "2019-09-01":
+            demographics_df = update_demographics(demographics_df, df)
 
-            indicator_e_f = pd.read_feather(
-                OUTPUT_DIR / f"indicator_e_f_{date}.feather"
-            )
+        # group once per demographic rather than once per indicator
+        for d in demographics:
+            demographic_sums[d].add(date, df)
 
-            e_dict = dict(
-                zip(indicator_e_f["patient_id"], indicator_e_f["indicator_e_numerator"])
-            )
-            f_dict = dict(
-                zip(indicator_e_f["patient_id"], indicator_e_f["indicator_f_numerator"])
-            )
-            df["indicator_e_numerator"] = df["patient_id"].map(e_dict)
-            df["indicator_f_numerator"] = df["patient_id"].map(f_dict)
-
-            for additional_indicator in additional_indicators:
-                event = (
-                    df.groupby(by=["practice"])[
-                        [
-                            f"indicator_{additional_indicator}_numerator",
-                            f"indicator_{additional_indicator}_denominator",
-                        ]
-                    ]
-                    .sum()
-                    .reset_index()
-                )
-                event["value"] = event[
-                    f"indicator_{additional_indicator}_numerator"
-                ].div(
-                    event[f"indicator_{additional_indicator}_denominator"].where(
-                        event[f"indicator_{additional_indicator}_denominator"] != 0,
-                        np.nan,
-                    )
-                )
-                event["value"] = event["value"].replace({np.nan: 0})
+    for d in demographics:
+        for i in indicators_list:
+            events = []
+            for date, event in demographic_sums[d].iter_frames(
+                [numerators[i], denominators[i]]
+            ):
+                event["rate"] = calculate_rate(event, numerators[i], denominators[i], 1)
                 event["date"] = date
+                events.append(event)
+
+            df_combined = pd.concat(events, axis=0)
+            df_combined.to_csv(OUTPUT_DIR / f"indicator_measure_{i}_{d}.csv")
 
-                df_dict_additional[additional_indicator].append(event)
-
-            # update demographics data
-            if date == "2019-09-01":
-                demographics_df = update_demographics(demographics_df, df)
-
-            for d in demographics:
-                for i in indicators_list:
-                    if i in ["me_no_fbc", "me_no_lft"]:
-                        denominator = "indicator_me_denominator"
-
-                    else:
-                        denominator = f"indicator_{i}_denominator"
-
-                    event = (
-                        df.groupby(by=[d])[[f"indicator_{i}_numerator", denominator]]
-                        .sum()
-                        .reset_index()
-                    )
-                    event["rate"] = calculate_rate(
-                        event, f"indicator_{i}_numerator", denominator, 1
-                    )
-
-                    event["date"] = date
-                    df_dict[d][i].append(event)
-
-    for demographic_key, demographic_value in df_dict.items():
-        for indicator_key, indicator_value in df_dict[demographic_key].items():
-            df_combined = pd.concat(indicator_value, axis=0)
-            df_combined.to_csv(
-                OUTPUT_DIR / f"indicator_measure_{indicator_key}_{demographic_key}.csv"
+    for additional_indicator in additional_indicators:
+        events = []
+        for date, event in additional_sums.iter_frames(
+            [
+                f"indicator_{additional_indicator}_numerator",
+                f"indicator_{additional_indicator}_denominator",
+            ]
+        ):
+            event["value"] = event[f"indicator_{additional_indicator}_numerator"].div(
+                event[f"indicator_{additional_indicator}_denominator"].where(
+                    event[f"indicator_{additional_indicator}_denominator"] != 0,
+                    np.nan,
+                )
             )
+            event["value"] = event["value"].replace({np.nan: 0})
+            event["date"] = date
+            events.append(event)
 
-    for indicator_key, indicator_value in df_dict_additional.items():
-        df_combined = pd.concat(indicator_value, axis=0)
-        df_combined.to_csv(OUTPUT_DIR / f"measure_indicator_{indicator_key}_rate.csv")
+        df_combined = pd.concat(events, axis=0)
+        df_combined.to_csv(
+            OUTPUT_DIR / f"measure_indicator_{additional_indicator}_rate.csv"
+        )
 
     d_list = {}
     for d in demographics:
-        if d == "imd":
-            # map imd
-            df[d] = df[d].replace(
-                {"0": "Missing", "1": "Most deprived", "5": "Least deprived"}
-            )
-
         counts = demographics_df[d].value_counts()
 
         counts_df = pd.concat(
@@ -1,38 +1,28 @@
-import pandas as pd
 from utilities import (
     OUTPUT_DIR,
-    match_input_files_filtered,
-    co_prescription,
-    get_date_input_file_filtered,
+    INDICATOR_E_F_COLUMNS,
+    INDICATOR_E_F_NUMERATORS,
+    add_indicator_e_f,
+    get_manifest,
+    run_monthly,
+    write_feather,
 )
 
-for file in OUTPUT_DIR.iterdir():
-    if match_input_files_filtered(file.name):
-        df = pd.read_feather(OUTPUT_DIR / file.name)
-        date = get_date_input_file_filtered(file.name)
+COLUMNS = ["patient_id", "practice"] + INDICATOR_E_F_COLUMNS
 
-        # for indicator E
-        co_prescription(df, "anticoagulant", "antiplatelet_including_aspirin")
-        df["indicator_e_numerator"] = (
-            (df["anticoagulant"] == 1)
-            & (df["ppi"] == 0)
-            & (df["co_prescribed_anticoagulant_antiplatelet_including_aspirin"] == 1)
-        )
 
-        # for indicator F
-        co_prescription(df, "aspirin", "antiplatelet_excluding_aspirin")
-        df["indicator_f_numerator"] = (
-            (df["aspirin"] == 1)
-            & (df["ppi"] == 0)
-            & (df["co_prescribed_aspirin_antiplatelet_excluding_aspirin"] == 1)
-        )
+def calculate_numerators(date, input_file):
+    df = input_file.read(COLUMNS)
 
-        df.loc[
-            :,
-            [
-                "patient_id",
-                "indicator_e_numerator",
-                "indicator_f_numerator",
-                "practice",
-            ],
-        ].to_feather(OUTPUT_DIR / f"indicator_e_f_{date}.feather")
+    add_indicator_e_f(df)
+
+    write_feather(
+        df.loc[:, ["patient_id"] + INDICATOR_E_F_NUMERATORS + ["practice"]],
+        OUTPUT_DIR / f"indicator_e_f_{date}.feather",
+    )
+
+
+if __name__ == "__main__":
+    manifest = get_manifest()
+    manifest.require_columns("input_filtered", COLUMNS)
+    run_monthly(calculate_numerators, manifest.iter_files("input_filtered"))
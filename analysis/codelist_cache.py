@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parents[1]
+CODELIST_CACHE_DIR = BASE_DIR / ".codelist_cache"
+
+# codelists already loaded by this process
+_codelists = {}
+
+
+def get_codelist_key(codelist_from_csv, filename, kwargs):
+    """Returns a key that changes whenever the contents of filename, the arguments
+    or the module that parses it change."""
+    module = sys.modules[codelist_from_csv.__module__]
+    module_file = getattr(module, "__file__", None)
+
+    key = hashlib.sha256()
+    key.update(Path(filename).read_bytes())
+    key.update(repr(sorted(kwargs.items())).encode())
+    key.update(f"{module.__name__}.{codelist_from_csv.__qualname__}".encode())
+    if module_file is not None:
+        stat = os.stat(module_file)
+        key.update(f"{module_file}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return key.hexdigest()
+
+
+def load_codelist(codelist_from_csv, codelist, filename, directory=None, **kwargs):
+    """Returns `codelist_from_csv(filename, **kwargs)`.
+
+    The parsed codes (and their categories, if kwargs has a category_column) are
+    written as json to directory (defaults to `CODELIST_CACHE_DIR`), under a key
+    from `get_codelist_key`, so that other processes rebuild the codelist from there
+    with `codelist(codes, kwargs["system"])` instead of parsing the csv again.
+    Within a process each codelist is only loaded once.
+    """
+    memo_key = (codelist_from_csv, str(filename), tuple(sorted(kwargs.items())))
+    if memo_key in _codelists:
+        return _codelists[memo_key]
+
+    directory = Path(CODELIST_CACHE_DIR if directory is None else directory)
+    key = get_codelist_key(codelist_from_csv, filename, kwargs)
+    cache_path = directory / f"{Path(filename).stem}-{key}.json"
+    has_categories = kwargs.get("category_column") is not None
+
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        codes = cached["codes"]
+        if has_categories:
+            codes = list(zip(codes, cached["categories"]))
+        parsed = codelist(codes, kwargs["system"])
+    except (OSError, ValueError, KeyError):
+        parsed = codelist_from_csv(filename, **kwargs)
+        if has_categories:
+            cached = {
+                "codes": [code for code, _ in parsed],
+                "categories": [category for _, category in parsed],
+            }
+        else:
+            cached = {"codes": list(parsed)}
+        try:
+            data = json.dumps(cached)
+            directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError):
+            # the cache is only an optimisation
+            pass
+
+    _codelists[memo_key] = parsed
+    return parsed
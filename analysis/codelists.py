@@ -1,8 +1,14 @@
 from cohortextractor import (
+    codelist,
     codelist_from_csv,
 )
+from codelist_cache import load_codelist
 
-ethnicity_codes = codelist_from_csv(
+# each csv is parsed once and then loaded from the cache, see codelist_cache.py
+
+ethnicity_codes = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/opensafely-ethnicity.csv",
     system="ctv3",
     column="Code",
@@ -10,168 +16,216 @@ ethnicity_codes = codelist_from_csv(
 )
 
 # Used in AC
-acei_codelist = codelist_from_csv(
+acei_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-acei.csv",
     system="snomed",
     column="id",
 )
 
 # Used in AC
-loop_diuretics_codelist = codelist_from_csv(
+loop_diuretics_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-diur.csv",
     system="snomed",
     column="id",
 )
 
 # Used in AC
-renal_function_codelist = codelist_from_csv(
+renal_function_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-renal.csv",
     system="snomed",
     column="code",
 )
 
 # Used in AC
-electrolytes_test_codelist = codelist_from_csv(
+electrolytes_test_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-electro.csv",
     system="snomed",
     column="code",
 )
 
 # Used in ME
-methotrexate_codelist = codelist_from_csv(
+methotrexate_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-met.csv",
     system="snomed",
     column="id",
 )
 
 # Used in ME
-full_blood_count_codelist = codelist_from_csv(
+full_blood_count_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-fbc.csv",
     system="snomed",
     column="code",
 )
 
 # Used in ME
-liver_function_test_codelist = codelist_from_csv(
+liver_function_test_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-lft.csv",
     system="snomed",
     column="code",
 )
 
 # Used in LI
-lithium_codelist = codelist_from_csv(
+lithium_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-lith.csv",
     system="snomed",
     column="id",
 )
 
 # Used in LI
-lithium_level_codelist = codelist_from_csv(
+lithium_level_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-lith_lev.csv",
     system="snomed",
     column="code",
 )
 
 # Used in AM
-amiodarone_codelist = codelist_from_csv(
+amiodarone_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-amio.csv",
     system="snomed",
     column="id",
 )
 
 # Used in AM
-thyroid_function_test_codelist = codelist_from_csv(
+thyroid_function_test_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-tft.csv",
     system="snomed",
     column="code",
 )
 
 # Used in A, B, C, E, F
-ulcer_healing_drugs_codelist = codelist_from_csv(
+ulcer_healing_drugs_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-ppi.csv",
     system="snomed",
     column="id",
 )
 
 # Used in A, B, D, I, K
-oral_nsaid_codelist = codelist_from_csv(
+oral_nsaid_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-nsaid.csv",
     system="snomed",
     column="id",
 )
 
 # Used in B, C
-peptic_ulcer_codelist = codelist_from_csv(
+peptic_ulcer_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-pep.csv",
     system="snomed",
     column="code",
 )
 
 # Used in B, C
-gi_bleed_codelist = codelist_from_csv(
+gi_bleed_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-gi_bleed.csv",
     system="snomed",
     column="code",
 )
 
 # Used in C
-antiplatelet_excluding_aspirin_codelist = codelist_from_csv(
+antiplatelet_excluding_aspirin_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-non_asp_antiplate.csv",
     system="snomed",
     column="id",
 )
 
 # Used in C, F
-aspirin_codelist = codelist_from_csv(
+aspirin_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-aspirin.csv",
     system="snomed",
     column="id",
 )
 
 # Used in D, E
-anticoagulant_codelist = codelist_from_csv(
+anticoagulant_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-anticoag.csv",
     system="snomed",
     column="id",
 )
 
 # Used in G
-asthma_codelist = codelist_from_csv(
+asthma_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-ast.csv",
     system="snomed",
     column="code",
 )
 
 # Used in G
-asthma_resolved_codelist = codelist_from_csv(
+asthma_resolved_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-ast_res.csv",
     system="snomed",
     column="code",
 )
 
 # Used in G
-non_selective_bb_codelist = codelist_from_csv(
+non_selective_bb_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-nsbb.csv",
     system="snomed",
     column="id",
 )
 
 # Used in I
-heart_failure_codelist = codelist_from_csv(
+heart_failure_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-hf.csv",
     system="snomed",
     column="code",
 )
 
 # Used in K
-egfr_codelist = codelist_from_csv(
+egfr_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-egfr.csv",
     system="snomed",
     column="code",
 )
 
 # Used in E, F
-antiplatelet_including_aspirin_codelist = codelist_from_csv(
+antiplatelet_including_aspirin_codelist = load_codelist(
+    codelist_from_csv,
+    codelist,
     "codelists/pincer-antiplat.csv",
     system="snomed",
     column="id",
@@ -1,11 +1,9 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-from utilities import BASE_DIR, deciles_chart_subplots, deciles_chart
+from utilities import BASE_DIR, deciles_chart, deciles_chart_panels, run_figures
 from config import indicators_list
 import json
-import numpy as np
 
-additional_indicators = ["e", "f", "li"]
+additional_indicators = ["e", "f"]
 indicators_list.extend(additional_indicators)
 
 EMIS_DIR = BASE_DIR / "backend_outputs/emis"
@@ -46,206 +44,195 @@ title_mapping = {
 
 medians_dict = {}
 
-# set up plots for combined decile charts
-gi_bleed_x = np.arange(0, 2, 1)
-gi_bleed_y = np.arange(0, 3, 1)
-gi_bleed_axs_list = [(i, j) for i in gi_bleed_x for j in gi_bleed_y]
-gi_bleed_fig, gi_bleed_axs = plt.subplots(2, 3, figsize=(30, 20), sharex="col")
 gi_bleed_indicators = ["a", "b", "c", "d", "e", "f"]
-
-
-prescribing_y = np.arange(0, 3, 1)
-prescribing_axs_list = [i for i in prescribing_y]
-prescribing_fig, prescribing_axs = plt.subplots(1, 3, figsize=(30, 10), sharex="col")
 prescribing_indicators = ["g", "i", "k"]
-
-monitoring_x = np.arange(0, 2, 1)
-monitoring_y = np.arange(0, 3, 1)
-monitoring_axs_list = [(i, j) for i in monitoring_x for j in monitoring_y]
-monitoring_axs_list.remove((0, 2))
-monitoring_fig, monitoring_axs = plt.subplots(2, 3, figsize=(30, 20), sharex="col")
-monitoring_fig.delaxes(monitoring_axs[0, 2])
 monitoring_indicators = ["ac", "me_no_fbc", "me_no_lft", "li", "am"]
 
 
-for i in indicators_list:
-    if i == "k":
-        measures_combined = pd.read_csv(
-            TPP_DIR / f"measure_stripped_{i}.csv", parse_dates=["date"]
-        )
-
-    else:
-        measure_emis = pd.read_csv(
-            EMIS_DIR / f"measure_stripped_{i}.csv", parse_dates=["date"]
-        )
-        measure_tpp = pd.read_csv(
-            TPP_DIR / f"measure_stripped_{i}.csv", parse_dates=["date"]
-        )
-
-        measures_combined = pd.concat([measure_emis, measure_tpp], axis="index")
-    measures_combined.to_csv(BASE_DIR / f"backend_outputs/measure_combined_{i}.csv")
-
-    rate_df_pre = measures_combined.loc[
-        measures_combined["date"].isin(pre_q1), "rate"
-    ].mean()
-    rate_df_post = measures_combined.loc[
-        measures_combined["date"].isin(post_q1), "rate"
-    ].mean()
-
-    medians_dict[i] = {"pre": rate_df_pre, "post": rate_df_post}
-
-    deciles_chart(
-        measures_combined,
-        filename=f"backend_outputs/figures/plot_{i}.jpeg",
-        period_column="date",
-        column="rate",
-        title=title_mapping[i],
-        ylabel="Percentage",
-        time_window=time_period_mapping.get(i, ""),
-    )
-
-    # gi bleed
-    if i in gi_bleed_indicators:
-        ind = gi_bleed_indicators.index(i)
-
-        deciles_chart_subplots(
-            measures_combined,
-            period_column="date",
-            column="rate",
-            title=title_mapping[i],
-            ylabel="Percentage",
-            show_outer_percentiles=False,
-            show_legend=False,
-            ax=gi_bleed_axs[gi_bleed_axs_list[ind]],
-            time_window=time_period_mapping.get(i, ""),
-        )
-
-    # prescribing
-
-    elif i in prescribing_indicators:
-        ind = prescribing_indicators.index(i)
-
-        deciles_chart_subplots(
-            measures_combined,
-            period_column="date",
-            column="rate",
-            title=title_mapping[i],
-            ylabel="Percentage",
-            show_outer_percentiles=False,
-            show_legend=False,
-            ax=prescribing_axs[prescribing_axs_list[ind]],
-            time_window=time_period_mapping.get(i, ""),
+def main():
+    jobs = []
+    panels = {}
+    for i in indicators_list:
+        if i == "k":
+            measures_combined = pd.read_csv(
+                TPP_DIR / f"measure_stripped_{i}.csv", parse_dates=["date"]
+            )
+
+        else:
+            measure_emis = pd.read_csv(
+                EMIS_DIR / f"measure_stripped_{i}.csv", parse_dates=["date"]
+            )
+            measure_tpp = pd.read_csv(
+                TPP_DIR / f"measure_stripped_{i}.csv", parse_dates=["date"]
+            )
+
+            measures_combined = pd.concat([measure_emis, measure_tpp], axis="index")
+        measures_combined.to_csv(BASE_DIR / f"backend_outputs/measure_combined_{i}.csv")
+
+        rate_df_pre = measures_combined.loc[
+            measures_combined["date"].isin(pre_q1), "rate"
+        ].mean()
+        rate_df_post = measures_combined.loc[
+            measures_combined["date"].isin(post_q1), "rate"
+        ].mean()
+
+        medians_dict[i] = {"pre": rate_df_pre, "post": rate_df_post}
+
+        jobs.append(
+            (
+                deciles_chart,
+                (measures_combined,),
+                dict(
+                    filename=f"backend_outputs/figures/plot_{i}.jpeg",
+                    period_column="date",
+                    column="rate",
+                    title=title_mapping[i],
+                    ylabel="Percentage",
+                    time_window=time_period_mapping.get(i, ""),
+                ),
+            )
         )
 
-    # monitoring
-
-    elif i in monitoring_indicators:
-        ind = monitoring_indicators.index(i)
-
-        deciles_chart_subplots(
+        # combined gi bleed, prescribing and monitoring panels
+        panels[i] = (
             measures_combined,
-            period_column="date",
-            column="rate",
-            title=title_mapping[i],
-            ylabel="Percentage",
-            show_outer_percentiles=False,
-            show_legend=False,
-            ax=monitoring_axs[monitoring_axs_list[ind]],
-            time_window=time_period_mapping.get(i, ""),
+            dict(
+                period_column="date",
+                column="rate",
+                title=title_mapping[i],
+                ylabel="Percentage",
+                show_outer_percentiles=False,
+                show_legend=False,
+                time_window=time_period_mapping.get(i, ""),
+            ),
         )
-monitoring_fig.subplots_adjust(bottom=0.15)
-monitoring_fig.savefig("backend_outputs/figures/combined_plot_monitoring.png")
-plt.clf()
-gi_bleed_fig.subplots_adjust(bottom=0.15)
-gi_bleed_fig.savefig("backend_outputs/figures/combined_plot_gi_bleed.png")
-plt.clf()
-prescribing_fig.subplots_adjust(bottom=0.3)
-prescribing_fig.savefig("backend_outputs/figures/combined_plot_prescribing.png")
-plt.clf()
-
-
-with open("backend_outputs/medians.json", "w") as f:
-    json.dump({"summary": medians_dict}, f)
-
-
-# join practice count
-
-combined_practice_count = {}
-with open("backend_outputs/emis/practice_count_emis.json") as f:
-    patient_count_emis = json.load(f)
-
-with open("backend_outputs/tpp/practice_count_tpp.json") as f:
-    patient_count_tpp = json.load(f)
 
+    jobs.extend(
+        [
+            (
+                deciles_chart_panels,
+                (
+                    [panels[i] for i in monitoring_indicators],
+                    "backend_outputs/figures/combined_plot_monitoring.png",
+                    2,
+                    3,
+                    (30, 20),
+                    0.15,
+                ),
+                dict(removed_axes=[(0, 2)]),
+            ),
+            (
+                deciles_chart_panels,
+                (
+                    [panels[i] for i in gi_bleed_indicators],
+                    "backend_outputs/figures/combined_plot_gi_bleed.png",
+                    2,
+                    3,
+                    (30, 20),
+                    0.15,
+                ),
+                {},
+            ),
+            (
+                deciles_chart_panels,
+                (
+                    [panels[i] for i in prescribing_indicators],
+                    "backend_outputs/figures/combined_plot_prescribing.png",
+                    1,
+                    3,
+                    (30, 10),
+                    0.3,
+                ),
+                {},
+            ),
+        ]
+    )
+    run_figures(jobs)
 
-for key, value in patient_count_emis.items():
-    combined_practice_count[key] = value + patient_count_tpp[key]
+    with open("backend_outputs/medians.json", "w") as f:
+        json.dump({"summary": medians_dict}, f)
 
-with open("backend_outputs/combined_practice_count.json", "w") as f:
-    json.dump(combined_practice_count, f)
+    # join practice count
 
+    combined_practice_count = {}
+    with open("backend_outputs/emis/practice_count_emis.json") as f:
+        patient_count_emis = json.load(f)
 
-# join summary statistics
+    with open("backend_outputs/tpp/practice_count_tpp.json") as f:
+        patient_count_tpp = json.load(f)
 
-combined_summary_statistics = {}
-with open("backend_outputs/emis/indicator_summary_statistics_emis.json") as f:
-    summary_statistics_emis = json.load(f)["summary"]
+    for key, value in patient_count_emis.items():
+        combined_practice_count[key] = value + patient_count_tpp[key]
 
-with open("backend_outputs/tpp/indicator_summary_statistics_tpp.json") as f:
-    summary_statistics_tpp = json.load(f)["summary"]
+    with open("backend_outputs/combined_practice_count.json", "w") as f:
+        json.dump(combined_practice_count, f)
 
-with open("backend_outputs/emis/practice_count_emis.json") as f:
-    practice_count_emis = json.load(f)
+    # join summary statistics
 
-with open("backend_outputs/tpp/practice_count_tpp.json") as f:
-    practice_count_tpp = json.load(f)
+    combined_summary_statistics = {}
+    with open("backend_outputs/emis/indicator_summary_statistics_emis.json") as f:
+        summary_statistics_emis = json.load(f)["summary"]
 
-combined_practice_count = {}
-for key, value in practice_count_emis.items():
-    combined_practice_count[key] = value + practice_count_tpp[key]
+    with open("backend_outputs/tpp/indicator_summary_statistics_tpp.json") as f:
+        summary_statistics_tpp = json.load(f)["summary"]
 
-with open("backend_outputs/combined_practice_count.json", "w") as f:
-    json.dump(combined_practice_count, f)
+    with open("backend_outputs/emis/practice_count_emis.json") as f:
+        practice_count_emis = json.load(f)
 
-# combine demographics table
+    with open("backend_outputs/tpp/practice_count_tpp.json") as f:
+        practice_count_tpp = json.load(f)
 
-demographics_tpp = pd.read_csv("backend_outputs/tpp/demographics_summary_tpp.csv")
+    combined_practice_count = {}
+    for key, value in practice_count_emis.items():
+        combined_practice_count[key] = value + practice_count_tpp[key]
 
-demographics_emis = pd.read_csv("backend_outputs/emis/demographics_summary_emis.csv")
+    with open("backend_outputs/combined_practice_count.json", "w") as f:
+        json.dump(combined_practice_count, f)
 
+    # combine demographics table
 
-combined_demographics = (
-    pd.concat([demographics_tpp, demographics_emis])
-    .groupby(["demographic", "level"])
-    .sum()
-    .reset_index()
-)
-combined_demographics.to_csv("backend_outputs/combined_demographics.csv")
+    demographics_tpp = pd.read_csv("backend_outputs/tpp/demographics_summary_tpp.csv")
 
-for indicator_key, indicator_dict in summary_statistics_tpp.items():
-    if type(indicator_dict) is dict:
-        combined_summary_statistics[indicator_key] = {}
-        for key, value in indicator_dict.items():
-            if indicator_key == "k":
-                # only present in tpp
+    demographics_emis = pd.read_csv(
+        "backend_outputs/emis/demographics_summary_emis.csv"
+    )
 
-                combined_summary_statistics[indicator_key][
-                    key
-                ] = summary_statistics_tpp[indicator_key][key]
-            else:
-                if key == "percent_practice":
-                    combined_summary_statistics[indicator_key][key] = (
-                        value + summary_statistics_emis[indicator_key][key]
-                    ) / 2
+    combined_demographics = (
+        pd.concat([demographics_tpp, demographics_emis])
+        .groupby(["demographic", "level"])
+        .sum()
+        .reset_index()
+    )
+    combined_demographics.to_csv("backend_outputs/combined_demographics.csv")
+
+    for indicator_key, indicator_dict in summary_statistics_tpp.items():
+        if type(indicator_dict) is dict:
+            combined_summary_statistics[indicator_key] = {}
+            for key, value in indicator_dict.items():
+                if indicator_key == "k":
+                    # only present in tpp
+
+                    combined_summary_statistics[indicator_key][
+                        key
+                    ] = summary_statistics_tpp[indicator_key][key]
                 else:
-                    combined_summary_statistics[indicator_key][key] = (
-                        value + summary_statistics_emis[indicator_key][key]
-                    )
-    else:
-        combined_summary_statistics[indicator_key] = (
-            summary_statistics_tpp[indicator_key]
-            + summary_statistics_emis[indicator_key]
-        )
-
-with open(f"backend_outputs/combined_summary_statistics.json", "w") as f:
-    json.dump(combined_summary_statistics, f)
+                    if key == "percent_practice":
+                        combined_summary_statistics[indicator_key][key] = (
+                            value + summary_statistics_emis[indicator_key][key]
+                        ) / 2
+                    else:
+                        combined_summary_statistics[indicator_key][key] = (
+                            value + summary_statistics_emis[indicator_key][key]
+                        )
+        else:
+            combined_summary_statistics[indicator_key] = (
+                summary_statistics_tpp[indicator_key]
+                + summary_statistics_emis[indicator_key]
+            )
+
+    with open(f"backend_outputs/combined_summary_statistics.json", "w") as f:
+        json.dump(combined_summary_statistics, f)
+
+
+if __name__ == "__main__":
+    main()
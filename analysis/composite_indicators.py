@@ -2,9 +2,11 @@ import pandas as pd
 import numpy as np
 from utilities import (
     OUTPUT_DIR,
-    match_input_files_filtered,
-    get_date_input_file_filtered,
-    get_composite_indicator_counts,
+    INDICATOR_E_F_NUMERATORS,
+    get_manifest,
+    get_composite_counts,
+    read_filtered,
+    require_filtered_columns,
     group_low_values,
 )
 
@@ -35,57 +37,61 @@ all_numerators = (
     gi_bleed_numerators + other_prescribing_numerators + monitoring_numerators
 )
 
+denominators = [
+    "indicator_g_denominator",
+    "indicator_i_denominator",
+    "indicator_k_denominator",
+    "gi_bleed_composite_denominator",
+    "monitoring_composite_denominator",
+    "all_composite_denominator",
+]
+
+columns = (
+    ["patient_id"]
+    + [n for n in all_numerators if n not in INDICATOR_E_F_NUMERATORS]
+    + denominators
+)
 
 gi_bleed_counts = []
 other_prescribing_counts = []
 monitoring_counts = []
 all_counts = []
-
-for file in OUTPUT_DIR.iterdir():
-    if match_input_files_filtered(file.name):
-        df = pd.read_feather(OUTPUT_DIR / file.name)
-        date = get_date_input_file_filtered(file.name)
-        indicator_e_f = pd.read_feather(OUTPUT_DIR / f"indicator_e_f_{date}.feather")
-        e_dict = dict(
-            zip(indicator_e_f["patient_id"], indicator_e_f["indicator_e_numerator"])
-        )
-        f_dict = dict(
-            zip(indicator_e_f["patient_id"], indicator_e_f["indicator_f_numerator"])
-        )
-        df["indicator_e_numerator"] = df["patient_id"].map(e_dict)
-        df["indicator_f_numerator"] = df["patient_id"].map(f_dict)
-
-        df["other_prescribing_composite_denominator"] = np.where(
-            (df["indicator_g_denominator"] == 1)
-            | (df["indicator_i_denominator"] == 1)
-            | (df["indicator_k_denominator"] == 1),
-            1,
-            0,
-        )
-
-        gi_bleed_count = get_composite_indicator_counts(
-            df, gi_bleed_numerators, "gi_bleed_composite_denominator", date
-        )
-        gi_bleed_counts.append(gi_bleed_count)
-
-        other_prescribing_count = get_composite_indicator_counts(
-            df,
-            other_prescribing_numerators,
-            "other_prescribing_composite_denominator",
-            date,
-        )
-        other_prescribing_counts.append(other_prescribing_count)
-
-        monitoring_count = get_composite_indicator_counts(
-            df, monitoring_numerators, "monitoring_composite_denominator", date
-        )
-        monitoring_counts.append(monitoring_count)
-
-        all_count = get_composite_indicator_counts(
-            df, all_numerators, "all_composite_denominator", date
-        )
-        all_counts.append(all_count)
-
+composite_counts = {
+    "gi_bleed": gi_bleed_counts,
+    "other_prescribing": other_prescribing_counts,
+    "monitoring": monitoring_counts,
+    "all": all_counts,
+}
+
+manifest = get_manifest()
+require_filtered_columns(manifest, columns)
+for date, input_file in manifest.iter_files("input_filtered"):
+    df = read_filtered(manifest, date, input_file, columns)
+
+    df["other_prescribing_composite_denominator"] = np.where(
+        (df["indicator_g_denominator"] == 1)
+        | (df["indicator_i_denominator"] == 1)
+        | (df["indicator_k_denominator"] == 1),
+        1,
+        0,
+    )
+
+    month_counts = get_composite_counts(
+        df,
+        {
+            "gi_bleed": (gi_bleed_numerators, "gi_bleed_composite_denominator"),
+            "other_prescribing": (
+                other_prescribing_numerators,
+                "other_prescribing_composite_denominator",
+            ),
+            "monitoring": (monitoring_numerators, "monitoring_composite_denominator"),
+            "all": (all_numerators, "all_composite_denominator"),
+        },
+        date,
+    )
+
+    for composite, counts in composite_counts.items():
+        counts.append(month_counts[composite])
 
 gi_bleed_composite_measure = pd.concat(gi_bleed_counts, axis=0, ignore_index=True)
 group_low_values(
@@ -1,4 +1,5 @@
 from enum import Enum
+from functools import lru_cache
 
 from ehrql.codes import codelist_from_csv
 
@@ -32,7 +33,14 @@ class Codelists(Enum):
     def __init__(self, codelist_name: str, column: str) -> None:
         self.codelist_name = codelist_name
         self._column = column
-        self.codes = codelist_from_csv(
-            f"codelists/{self.codelist_name}.csv", column=self._column
-        )
+
+    @property
+    def codes(self):
+        # loaded when first used rather than when the module is imported
+        return _load_codes(self.codelist_name, self._column)
+
+
+@lru_cache(maxsize=None)
+def _load_codes(codelist_name: str, column: str):
+    return codelist_from_csv(f"codelists/{codelist_name}.csv", column=column)
 
@@ -12,6 +12,7 @@ from utils import (
     Measure,
     calculate_num_intervals,
 )
+from variable_registry import VariableRegistry
 
 BACKEND = os.getenv("OPENSAFELY_BACKEND", "expectations")
 
@@ -20,7 +21,12 @@ def parse_args():
     parser.add_argument("--start-date", type=str)
     parser.add_argument("--end-date", type=str)
     parser.add_argument("--population-size", type=int, default=500)
-    parser.add_argument("--measure", type=str)
+    parser.add_argument(
+        "--measures",
+        "--measure",
+        nargs="+",
+        help="indicators to define measures for, defaults to all of them",
+    )
     return parser.parse_args()
 
 args = parse_args()
@@ -35,10 +41,18 @@ if args.start_date and args.end_date:
 dataset = Dataset()
 
 dataset.configure_dummy_dataset(population_size=args.population_size)
+
+# the variables are added to the dataset at the end, once the measures are chosen.
+# Variables defined from others read them through the registry (with `derive`), so
+# the registry knows what each one needs. Internal variables are only read by other
+# variables and aren't added to the dataset
+variables = VariableRegistry()
+
 ### Population variables and filter
-dataset.age = patients.age_on(date=INTERVAL.start_date)
+variables.add("age", patients.age_on(date=INTERVAL.start_date))
 registered_practice = practice_registrations.for_patient_on(INTERVAL.start_date)
-dataset.registered_practice_id = registered_practice.practice_pseudo_id
+variables.add("registered_practice_id", registered_practice.practice_pseudo_id)
+variables.add("registered", registered_practice.exists_for_patient(), internal=True)
 
 # ### Indicator variables
 
@@ -51,10 +65,10 @@ hist_clinical = HistoricalEvent("clinical", interval=INTERVAL)
 # ###
 
 oral_nsaid = hist_med.fetch(Codelists.ORAL_NSAID.codes, 3)
-dataset.oral_nsaid = oral_nsaid.exists_for_patient()
+variables.add("oral_nsaid", oral_nsaid.exists_for_patient())
 
 ppi = hist_med.fetch(Codelists.ULCER_HEALING_DRUGS.codes, 3)
-dataset.ppi = ppi.exists_for_patient()
+variables.add("ppi", ppi.exists_for_patient())
 
 # ###
 # # GI BLEED INDICATORS
@@ -63,10 +77,10 @@ dataset.ppi = ppi.exists_for_patient()
 # # ppi from A
 
 peptic_ulcer = hist_clinical.fetch(Codelists.PEPTIC_ULCER.codes, 3)
-dataset.peptic_ulcer = peptic_ulcer.exists_for_patient()
+variables.add("peptic_ulcer", peptic_ulcer.exists_for_patient())
 
 gi_bleed = hist_clinical.fetch(Codelists.GI_BLEED.codes, 3)
-dataset.gi_bleed = gi_bleed.exists_for_patient()
+variables.add("gi_bleed", gi_bleed.exists_for_patient())
 
 # ###
 # # GI BLEED INDICATORS
@@ -80,7 +94,7 @@ dataset.gi_bleed = gi_bleed.exists_for_patient()
 
 
 cp_f = CoPrescribingVariableGenerator(
-    dataset,
+    variables,
     medications,
     (Codelists.ASPIRIN.codes, Codelists.ANTIPLATELET_EXCL_ASP.codes),
     ("aspirin", "antiplatelet_excluding_aspirin"),
@@ -88,8 +102,9 @@ cp_f = CoPrescribingVariableGenerator(
     months=3,
 )
 
-dataset.co_prescribed_aspirin_antiplatelet_excluding_aspirin = (
-    cp_f.generate_co_prescribing_variable()
+variables.derive(
+    "co_prescribed_aspirin_antiplatelet_excluding_aspirin",
+    cp_f.generate_co_prescribing_variable,
 )
 
 # ###
@@ -100,17 +115,17 @@ dataset.co_prescribed_aspirin_antiplatelet_excluding_aspirin = (
 # # oral_nsaid from A
 
 cp_e = CoPrescribingVariableGenerator(
-    dataset,
+    variables,
     medications,
     (Codelists.ANTICOAG.codes, Codelists.ANTIPLATELET_ASP.codes),
     ("anticoagulant", "antiplatelet_including_aspirin"),
     INTERVAL.start_date,
 )
 
-co_prescribed_anticoagulant_antiplatelet_including_aspirin = (
-    cp_e.generate_co_prescribing_variable()
+variables.derive(
+    "co_prescribed_anticoagulant_antiplatelet_including_aspirin",
+    cp_e.generate_co_prescribing_variable,
 )
-dataset.co_prescribed_anticoagulant_antiplatelet_including_aspirin = co_prescribed_anticoagulant_antiplatelet_including_aspirin
 
 
 # ###
@@ -135,16 +150,23 @@ dataset.co_prescribed_anticoagulant_antiplatelet_including_aspirin = co_prescrib
 # ###
 
 asthma = hist_clinical.fetch(Codelists.ASTHMA.codes, 3)
-dataset.asthma = asthma.exists_for_patient()
+variables.add("asthma", asthma.exists_for_patient())
 
 asthma_resolved = hist_clinical.fetch(Codelists.ASTHMA_RESOLVED.codes, ever=True)
-dataset.asthma_resolved = asthma_resolved.exists_for_patient()
+variables.add("asthma_resolved", asthma_resolved.exists_for_patient())
+
+variables.add("latest_asthma_date", asthma.date.maximum_for_patient(), internal=True)
+variables.add(
+    "latest_asthma_resolved_date",
+    asthma_resolved.date.maximum_for_patient(),
+    internal=True,
+)
 
 no_asthma_resolved = asthma.exists_for_patient() & ~asthma_resolved.exists_for_patient()
-dataset.no_asthma_resolved = no_asthma_resolved
+variables.add("no_asthma_resolved", no_asthma_resolved)
 
 non_selective_bb = hist_med.fetch(Codelists.NSBB.codes, 3)
-dataset.non_selective_bb = non_selective_bb.exists_for_patient()
+variables.add("non_selective_bb", non_selective_bb.exists_for_patient())
 
 # ###
 # # OTHER PRESCRIBING INDICATORS
@@ -153,7 +175,7 @@ dataset.non_selective_bb = non_selective_bb.exists_for_patient()
 # # oral_nsaid from A
 
 heart_failure = hist_clinical.fetch(Codelists.HF.codes, ever=True)
-dataset.heart_failure = heart_failure.exists_for_patient()
+variables.add("heart_failure", heart_failure.exists_for_patient())
 
 
 # ###
@@ -171,7 +193,7 @@ egfr_between_1_and_45 = (
     & (latest_egfr.numeric_value >= 1)
     & (latest_egfr.numeric_value < 45)
 )
-dataset.egfr_between_1_and_45 = egfr_between_1_and_45
+variables.add("egfr_between_1_and_45", egfr_between_1_and_45)
 
 
 
@@ -184,24 +206,27 @@ dataset.egfr_between_1_and_45 = egfr_between_1_and_45
 # ####
 
 acei = hist_med.fetch(Codelists.ACEI.codes, 15)
-dataset.acei = acei.exists_for_patient()
+variables.add("acei", acei.exists_for_patient())
 
 loop_diuretic = hist_med.fetch(Codelists.LOOP_DIURETICS.codes, 15)
-dataset.loop_diuretic = loop_diuretic.exists_for_patient()
+variables.add("loop_diuretic", loop_diuretic.exists_for_patient())
 
 acei_recent = hist_med.fetch(Codelists.ACEI.codes, 6)
-dataset.acei_recent = acei_recent.exists_for_patient()
+variables.add("acei_recent", acei_recent.exists_for_patient())
 
 loop_diuretic_recent = hist_med.fetch(Codelists.LOOP_DIURETICS.codes, 6)
-dataset.loop_diuretic_recent = loop_diuretic_recent.exists_for_patient()
+variables.add("loop_diuretic_recent", loop_diuretic_recent.exists_for_patient())
 
 renal_function_test = hist_med.fetch(Codelists.RENAL_FUNCTION.codes, 15)
-dataset.renal_function_test = renal_function_test.exists_for_patient()
+variables.add("renal_function_test", renal_function_test.exists_for_patient())
 
 electrolytes_test = hist_med.fetch(Codelists.ELECTROLYTES_TEST.codes, 15)
-dataset.electrolytes_test = electrolytes_test.exists_for_patient()
+variables.add("electrolytes_test", electrolytes_test.exists_for_patient())
 
-dataset.age_gt_75 = (dataset.age >= 75) & (dataset.age <= 120)
+variables.derive(
+    "age_gt_75",
+    lambda v: (v.age >= 75) & (v.age <= 120),
+)
 
 
 # ###
@@ -210,16 +235,16 @@ dataset.age_gt_75 = (dataset.age >= 75) & (dataset.age <= 120)
 # ####
 
 methotrexate_6_3_month = hist_med.fetch(Codelists.METHOTREXATE.codes, 6, 3)
-dataset.methotrexate_6_3_month = methotrexate_6_3_month.exists_for_patient()
+variables.add("methotrexate_6_3_month", methotrexate_6_3_month.exists_for_patient())
 
 methotrexate_3_month = hist_med.fetch(Codelists.METHOTREXATE.codes, 3)
-dataset.methotrexate_3_month = methotrexate_3_month.exists_for_patient()
+variables.add("methotrexate_3_month", methotrexate_3_month.exists_for_patient())
 
 full_blood_count = hist_med.fetch(Codelists.FULL_BLOOD_COUNT.codes, 3)
-dataset.full_blood_count = full_blood_count.exists_for_patient()
+variables.add("full_blood_count", full_blood_count.exists_for_patient())
 
 liver_function_test = hist_med.fetch(Codelists.FULL_BLOOD_COUNT.codes, 3)
-dataset.liver_function_test = liver_function_test.exists_for_patient()
+variables.add("liver_function_test", liver_function_test.exists_for_patient())
 
 
 # ###
@@ -228,13 +253,13 @@ dataset.liver_function_test = liver_function_test.exists_for_patient()
 # ####
 
 lithiumm_6_3_month = hist_med.fetch(Codelists.LITHIUM.codes, 6, 3)
-dataset.lithiumm_6_3_month = lithiumm_6_3_month.exists_for_patient()
+variables.add("lithiumm_6_3_month", lithiumm_6_3_month.exists_for_patient())
 
 lithium_3_month = hist_med.fetch(Codelists.LITHIUM.codes, 3)
-dataset.lithium_3_month = lithium_3_month.exists_for_patient()
+variables.add("lithium_3_month", lithium_3_month.exists_for_patient())
 
 lithium_level_3_month = hist_med.fetch(Codelists.LITHIUM_LEVEL.codes, 3)
-dataset.lithium_level_3_month = lithium_level_3_month.exists_for_patient()
+variables.add("lithium_level_3_month", lithium_level_3_month.exists_for_patient())
 
 # ###
 # # MONITORING COMPOSITE INDICATOR
@@ -242,144 +267,219 @@ dataset.lithium_level_3_month = lithium_level_3_month.exists_for_patient()
 # ####
 
 amiodarone_12_6_month = hist_med.fetch(Codelists.AMIODARONE.codes, 12, 6)
-dataset.amiodarone_12_6_month = amiodarone_12_6_month.exists_for_patient()
+variables.add("amiodarone_12_6_month", amiodarone_12_6_month.exists_for_patient())
 
 amiodarone_6_month = hist_med.fetch(Codelists.AMIODARONE.codes, 6)
-dataset.amiodarone_6_month = amiodarone_6_month.exists_for_patient()
+variables.add("amiodarone_6_month", amiodarone_6_month.exists_for_patient())
 
 thyroid_function_test = hist_clinical.fetch(Codelists.TFT.codes, 6)
-dataset.thyroid_function_test = thyroid_function_test.exists_for_patient()
-
-dataset.population_filter = (
-    ((dataset.age >= 18) & (dataset.age < 120))
-    & registered_practice.exists_for_patient()
-    & ~(
-        patients.date_of_death.is_not_null()
-        & patients.date_of_death.is_before(INTERVAL.start_date)
-    ) &
-    patients.sex.is_in(["male", "female"])
+variables.add("thyroid_function_test", thyroid_function_test.exists_for_patient())
+
+variables.derive(
+    "population_filter",
+    lambda v: (
+        ((v.age >= 18) & (v.age < 120))
+        & v.registered
+        & ~(
+            patients.date_of_death.is_not_null()
+            & patients.date_of_death.is_before(INTERVAL.start_date)
+        ) &
+        patients.sex.is_in(["male", "female"])
+    ),
 )
 
 ## Indicator definitions
 
-dataset.indicator_a_denominator = dataset.population_filter & ~dataset.ppi
+variables.derive(
+    "indicator_a_denominator",
+    lambda v: v.population_filter & ~v.ppi,
+)
 
-dataset.indicator_a_numerator = dataset.indicator_a_denominator & dataset.oral_nsaid
+variables.derive(
+    "indicator_a_numerator",
+    lambda v: v.indicator_a_denominator & v.oral_nsaid,
+)
 
-dataset.indicator_b_denominator = dataset.population_filter & ~dataset.ppi & (
-    dataset.gi_bleed | dataset.peptic_ulcer
+variables.derive(
+    "indicator_b_denominator",
+    lambda v: v.population_filter & ~v.ppi & (
+        v.gi_bleed | v.peptic_ulcer
+    ),
 )
 
-dataset.indicator_b_numerator = dataset.indicator_b_denominator & dataset.oral_nsaid
+variables.derive(
+    "indicator_b_numerator",
+    lambda v: v.indicator_b_denominator & v.oral_nsaid,
+)
 
-dataset.indicator_c_denominator = dataset.population_filter & ~dataset.ppi & (
-    dataset.gi_bleed | dataset.peptic_ulcer
+variables.derive(
+    "indicator_c_denominator",
+    lambda v: v.population_filter & ~v.ppi & (
+        v.gi_bleed | v.peptic_ulcer
+    ),
 )
 
-dataset.indicator_c_numerator = dataset.indicator_c_denominator & (
-    dataset.antiplatelet_excluding_aspirin | dataset.aspirin
+variables.derive(
+    "indicator_c_numerator",
+    lambda v: v.indicator_c_denominator & (
+        v.antiplatelet_excluding_aspirin | v.aspirin
+    ),
 )
 
-dataset.indicator_d_denominator = dataset.population_filter & dataset.anticoagulant
+variables.derive(
+    "indicator_d_denominator",
+    lambda v: v.population_filter & v.anticoagulant,
+)
 
-dataset.indicator_d_numerator = dataset.indicator_d_denominator & dataset.oral_nsaid
+variables.derive(
+    "indicator_d_numerator",
+    lambda v: v.indicator_d_denominator & v.oral_nsaid,
+)
 
 
-dataset.indicator_e_denominator = dataset.population_filter & dataset.anticoagulant & ~dataset.ppi
+variables.derive(
+    "indicator_e_denominator",
+    lambda v: v.population_filter & v.anticoagulant & ~v.ppi,
+)
 
-dataset.indicator_e_numerator = (
-    dataset.indicator_e_denominator & dataset.co_prescribed_anticoagulant_antiplatelet_including_aspirin
+variables.derive(
+    "indicator_e_numerator",
+    lambda v: v.indicator_e_denominator & v.co_prescribed_anticoagulant_antiplatelet_including_aspirin,
 )
 
-dataset.indicator_f_denominator = dataset.population_filter & dataset.aspirin & ~dataset.ppi
+variables.derive(
+    "indicator_f_denominator",
+    lambda v: v.population_filter & v.aspirin & ~v.ppi,
+)
 
-dataset.indicator_f_numerator = (
-    dataset.indicator_f_denominator & dataset.co_prescribed_aspirin_antiplatelet_excluding_aspirin
+variables.derive(
+    "indicator_f_numerator",
+    lambda v: v.indicator_f_denominator & v.co_prescribed_aspirin_antiplatelet_excluding_aspirin,
 )
 
-dataset.indicator_g_denominator = dataset.population_filter & dataset.asthma & (
-    asthma_resolved.date.maximum_for_patient() < asthma.date.maximum_for_patient()
+variables.derive(
+    "indicator_g_denominator",
+    lambda v: v.population_filter & v.asthma & (
+        v.latest_asthma_resolved_date < v.latest_asthma_date
+    ),
 )
 
-dataset.indicator_g_denominator_alternative = (
-    dataset.population_filter &
-    dataset.asthma & ~dataset.asthma_resolved
-) | (asthma_resolved.date.maximum_for_patient() <= asthma.date.maximum_for_patient())
+variables.derive(
+    "indicator_g_denominator_alternative",
+    lambda v: (
+        v.population_filter &
+        v.asthma & ~v.asthma_resolved
+    ) | (v.latest_asthma_resolved_date <= v.latest_asthma_date),
+)
 
-dataset.indicator_g_numerator = dataset.indicator_g_denominator & dataset.non_selective_bb
+variables.derive(
+    "indicator_g_numerator",
+    lambda v: v.indicator_g_denominator & v.non_selective_bb,
+)
 
-dataset.indicator_i_denominator = dataset.population_filter & dataset.heart_failure
+variables.derive(
+    "indicator_i_denominator",
+    lambda v: v.population_filter & v.heart_failure,
+)
 
-dataset.indicator_i_numerator = dataset.indicator_i_denominator & dataset.oral_nsaid
+variables.derive(
+    "indicator_i_numerator",
+    lambda v: v.indicator_i_denominator & v.oral_nsaid,
+)
 
-dataset.indicator_k_denominator = dataset.population_filter & dataset.egfr_between_1_and_45
+variables.derive(
+    "indicator_k_denominator",
+    lambda v: v.population_filter & v.egfr_between_1_and_45,
+)
 
-dataset.indicator_k_numerator = dataset.indicator_k_denominator & dataset.oral_nsaid
+variables.derive(
+    "indicator_k_numerator",
+    lambda v: v.indicator_k_denominator & v.oral_nsaid,
+)
 
 
-dataset.indicator_ac_denominator = dataset.population_filter & dataset.age_gt_75 & (
-    dataset.acei & dataset.acei_recent
-) | (dataset.loop_diuretic & dataset.loop_diuretic_recent)
+variables.derive(
+    "indicator_ac_denominator",
+    lambda v: v.population_filter & v.age_gt_75 & (
+        v.acei & v.acei_recent
+    ) | (v.loop_diuretic & v.loop_diuretic_recent),
+)
 
-dataset.indicator_ac_numerator = dataset.indicator_ac_denominator & (
-    ~dataset.renal_function_test | ~dataset.electrolytes_test
+variables.derive(
+    "indicator_ac_numerator",
+    lambda v: v.indicator_ac_denominator & (
+        ~v.renal_function_test | ~v.electrolytes_test
+    ),
 )
 
-dataset.indicator_me_denominator = (
-    dataset.population_filter &
-    dataset.methotrexate_6_3_month
-    & dataset.methotrexate_3_month
+variables.derive(
+    "indicator_me_denominator",
+    lambda v: (
+        v.population_filter &
+        v.methotrexate_6_3_month
+        & v.methotrexate_3_month
+    ),
 )
 
-dataset.indicator_me_no_fbc_numerator = (
-    dataset.indicator_me_denominator & ~dataset.full_blood_count
+variables.derive(
+    "indicator_me_no_fbc_numerator",
+    lambda v: v.indicator_me_denominator & ~v.full_blood_count,
 )
 
-dataset.indicator_me_no_lft_numerator = (
-    dataset.indicator_me_denominator & ~dataset.liver_function_test
+variables.derive(
+    "indicator_me_no_lft_numerator",
+    lambda v: v.indicator_me_denominator & ~v.liver_function_test,
 )
 
-dataset.indicator_li_denominator = (
-    dataset.population_filter &
-    dataset.lithiumm_6_3_month & dataset.lithium_3_month
+variables.derive(
+    "indicator_li_denominator",
+    lambda v: (
+        v.population_filter &
+        v.lithiumm_6_3_month & v.lithium_3_month
+    ),
 )
 
-dataset.indicator_li_numerator = (
-    dataset.indicator_li_denominator & ~dataset.lithium_level_3_month
+variables.derive(
+    "indicator_li_numerator",
+    lambda v: v.indicator_li_denominator & ~v.lithium_level_3_month,
 )
 
-dataset.indicator_am_denominator = (
-    dataset.population_filter &
-    dataset.amiodarone_12_6_month & dataset.amiodarone_6_month
+variables.derive(
+    "indicator_am_denominator",
+    lambda v: (
+        v.population_filter &
+        v.amiodarone_12_6_month & v.amiodarone_6_month
+    ),
 )
 
-dataset.indicator_am_numerator = (
-    dataset.indicator_am_denominator & dataset.thyroid_function_test
+variables.derive(
+    "indicator_am_numerator",
+    lambda v: v.indicator_am_denominator & v.thyroid_function_test,
 )
 
 
 
 
 any_denominator = (
-    dataset.indicator_a_denominator |
-    dataset.indicator_b_denominator |
-    dataset.indicator_c_denominator |
-    dataset.indicator_d_denominator |
-    dataset.indicator_e_denominator |
-    dataset.indicator_f_denominator |
-    dataset.indicator_g_denominator |
-    dataset.indicator_i_denominator |
-    dataset.indicator_k_denominator |
-    dataset.indicator_ac_denominator |
-    dataset.indicator_me_denominator |
-    dataset.indicator_li_denominator |
-    dataset.indicator_am_denominator
+    variables.indicator_a_denominator |
+    variables.indicator_b_denominator |
+    variables.indicator_c_denominator |
+    variables.indicator_d_denominator |
+    variables.indicator_e_denominator |
+    variables.indicator_f_denominator |
+    variables.indicator_g_denominator |
+    variables.indicator_i_denominator |
+    variables.indicator_k_denominator |
+    variables.indicator_ac_denominator |
+    variables.indicator_me_denominator |
+    variables.indicator_li_denominator |
+    variables.indicator_am_denominator
 )
 
 
 if AS_DATASET:
     dataset.define_population(
-        dataset.population_filter
+        variables.population_filter
         & any_denominator
         )
 
@@ -391,30 +491,43 @@ if BACKEND == "expectations":
 else:
     num_intervals = calculate_num_intervals(start_date)
 
+# the numerator and denominator variables of each measure
+measure_variables = {
+    "a": ("indicator_a_numerator", "indicator_a_denominator"),
+    "b": ("indicator_b_numerator", "indicator_b_denominator"),
+    "c": ("indicator_c_numerator", "indicator_c_denominator"),
+    "d": ("indicator_d_numerator", "indicator_d_denominator"),
+    "e": ("indicator_e_numerator", "indicator_e_denominator"),
+    "f": ("indicator_f_numerator", "indicator_f_denominator"),
+    "k": ("indicator_k_numerator", "indicator_k_denominator"),
+    "g": ("indicator_g_numerator", "indicator_g_denominator"),
+    "i": ("indicator_i_numerator", "indicator_i_denominator"),
+    "ac": ("indicator_ac_numerator", "indicator_ac_denominator"),
+    "me_no_fbc": ("indicator_me_no_fbc_numerator", "indicator_me_denominator"),
+    "me_no_lft": ("indicator_me_no_lft_numerator", "indicator_me_denominator"),
+    "li": ("indicator_li_numerator", "indicator_li_denominator"),
+    "am": ("indicator_am_numerator", "indicator_am_denominator"),
+}
+
 # Initialize the measures
 all_measures = {
-    "a": Measure("a", dataset.indicator_a_numerator, dataset.indicator_a_denominator),
-    "b": Measure("b", dataset.indicator_b_numerator, dataset.indicator_b_denominator),
-    "c": Measure("c", dataset.indicator_c_numerator, dataset.indicator_c_denominator),
-    "d": Measure("d", dataset.indicator_d_numerator, dataset.indicator_d_denominator),
-    "e": Measure("e", dataset.indicator_e_numerator, dataset.indicator_e_denominator),
-    "f": Measure("f", dataset.indicator_f_numerator, dataset.indicator_f_denominator),
-    "k": Measure("k", dataset.indicator_k_numerator, dataset.indicator_k_denominator),
-    "g": Measure("g", dataset.indicator_g_numerator, dataset.indicator_g_denominator),
-    "i": Measure("i", dataset.indicator_i_numerator, dataset.indicator_i_denominator),
-    "ac": Measure("ac", dataset.indicator_ac_numerator, dataset.indicator_ac_denominator),
-    "me_no_fbc": Measure("me_no_fbc", dataset.indicator_me_no_fbc_numerator, dataset.indicator_me_denominator),
-    "me_no_lft": Measure("me_no_lft", dataset.indicator_me_no_lft_numerator, dataset.indicator_me_denominator),
-    "li": Measure("li", dataset.indicator_li_numerator, dataset.indicator_li_denominator),
-    "am": Measure("am", dataset.indicator_am_numerator, dataset.indicator_am_denominator),
+    name: Measure(name, getattr(variables, numerator), getattr(variables, denominator))
+    for name, (numerator, denominator) in measure_variables.items()
 }
 
 
 measures = Measures()
 
-if args.measure:
+# the selected measures are defined together, so that they share one query of the
+# tables rather than one per measure; split_measures.py writes them to separate files
+selected_measures = args.measures or list(all_measures)
 
-    measure = all_measures[args.measure]
+unknown_measures = [name for name in selected_measures if name not in all_measures]
+if unknown_measures:
+    raise ValueError(f"Unknown measures: {', '.join(unknown_measures)}")
+
+for name in selected_measures:
+    measure = all_measures[name]
 
     measures.define_measure(
         name=f"indicator_{measure.name}",
@@ -422,19 +535,22 @@ if args.measure:
         denominator=measure.denominator,
         intervals=months(num_intervals).starting_on(start_date),
         group_by={
-            "practice": dataset.registered_practice_id,
+            "practice": variables.registered_practice_id,
         },
     )
 
+# only the variables that the selected measures depend on are added to the dataset,
+# or every variable (including the co-prescribing ones used for checking) if none
+# are selected
+if args.measures:
+    variables.update_dataset(
+        dataset,
+        ["registered_practice_id"]
+        + [
+            variable
+            for name in selected_measures
+            for variable in measure_variables[name]
+        ],
+    )
 else:
-    for _, measure in all_measures.items():
-    
-        measures.define_measure(
-            name=f"indicator_{measure.name}",
-            numerator=measure.numerator,
-            denominator=measure.denominator,
-            intervals=months(num_intervals).starting_on(start_date),
-            group_by={
-                "practice": dataset.registered_practice_id,
-            },
-        )
+    variables.update_dataset(dataset)
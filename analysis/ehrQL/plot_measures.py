@@ -1,4 +1,6 @@
 import os
+import sys
+from pathlib import Path
 
 import pandas as pd
 import seaborn as sns
@@ -8,6 +10,10 @@ import matplotlib.pyplot as plt
 
 from stripped_measures import indicators_list, OUTPUT_DIR
 
+# the percentile engine is shared with the cohort-extractor charts in analysis/
+sys.path.append(str(Path(__file__).parents[1]))
+from utilities import DECILES, compute_percentiles, plot_percentiles, run_figures
+
 BEST = 0
 UPPER_RIGHT = 1
 UPPER_LEFT = 2
@@ -55,32 +61,6 @@ title_mapping = {
     "li": "Lithium and no level recording",
     "am": "Amiodarone and no TFT",  # "Amiodarone without thyroid function test",
 }
-def compute_deciles(measure_table, groupby_col, values_col, has_outer_percentiles=True):
-    """Computes deciles.
-    Args:
-        measure_table: A measure table.
-        groupby_col: The name of the column to group by.
-        values_col: The name of the column for which deciles are computed.
-        has_outer_percentiles: Whether to compute the nine largest and nine smallest
-            percentiles as well as the deciles.
-    Returns:
-        A data frame with `groupby_col`, `values_col`, and `percentile` columns.
-    """
-    quantiles = np.arange(0.1, 1, 0.1)
-    if has_outer_percentiles:
-        quantiles = np.concatenate(
-            [quantiles, np.arange(0.01, 0.1, 0.01), np.arange(0.91, 1, 0.01)]
-        )
-
-    percentiles = (
-        measure_table.groupby(groupby_col)[values_col]
-        .quantile(pd.Series(quantiles))
-        .reset_index()
-    )
-    percentiles["percentile"] = percentiles["level_1"].apply(lambda x: int(x * 100))
-    percentiles = percentiles.drop(columns=["level_1"])
-
-    return percentiles
 
 def deciles_chart(
     df,
@@ -101,73 +81,31 @@ def deciles_chart(
     practice_numbers = df.groupby(period_column).count()
     
     practice_numbers = practice_numbers.apply(lambda x: round(x / 5) * 5)
-    df = compute_deciles(df, period_column, column, has_outer_percentiles=False)
+    deciles = compute_percentiles(df, period_column, column, DECILES)
 
 
     sns.set_style("whitegrid", {"grid.color": ".9"})
 
     fig, ax = plt.subplots(1, 1, figsize=(15, 8))
 
-    linestyles = {
-        "decile": {
-            "line": "b--",
-            "linewidth": 1,
-            "label": "Decile",
-        },
-        "median": {
-            "line": "b-",
-            "linewidth": 1.5,
-            "label": "Median",
-        },
-        "percentile": {
-            "line": "b:",
-            "linewidth": 0.8,
-            "label": "1st-9th, 91st-99th percentile",
-        },
-    }
-    label_seen = []
-    for percentile in range(1, 100):  # plot each decile line
-        data = df[df["percentile"] == percentile]
-        add_label = False
-
-        if percentile == 50:
-            style = linestyles["median"]
-            add_label = True
-
-        else:
-            style = linestyles["decile"]
-            if "decile" not in label_seen:
-                label_seen.append("decile")
-                add_label = True
-        if add_label:
-            label = style["label"]
-        else:
-            label = "_nolegend_"
-
-        ax.plot(
-            data[period_column],
-            data[column],
-            style["line"],
-            linewidth=style["linewidth"],
-            label=label,
-        )
+    plot_percentiles(ax, deciles)
     ax.set_ylabel(ylabel, size=15, alpha=0.6)
     if title:
         ax.set_title(title, size=14, wrap=True)
     # set ymax across all subplots as largest value across dataset
 
     ax.set_ylim(
-        [0, 100 if df[column].isnull().values.all() else df[column].max() * 1.05]
+        [0, 100 if deciles.isnull().values.all() else deciles.max().max() * 1.05]
     )
     ax.tick_params(labelsize=12)
     ax.set_xlim(
-        [df[period_column].min(), df[period_column].max()]
+        [deciles.index.min(), deciles.index.max()]
     )  # set x axis range as full date range
 
     plt.setp(ax.xaxis.get_majorticklabels(), rotation=90)
     ax.xaxis.set_major_formatter(matplotlib.dates.DateFormatter("%B %Y"))
 
-    plt.xticks(sorted(df[period_column].unique()), rotation=90)
+    plt.xticks(deciles.index, rotation=90)
 
     plt.vlines(
         x=[pd.to_datetime("2020-03-01")],
@@ -212,19 +150,28 @@ def deciles_chart(
     plt.savefig(filename)
     plt.clf()
 
-for i in indicators_list:
-    # indicator plots
-    df = pd.read_csv(
-        OUTPUT_DIR / f"{i}/measure_stripped.csv", parse_dates=["interval_start"]
-    )
+if __name__ == "__main__":
+    jobs = []
+    for i in indicators_list:
+        # indicator plots
+        df = pd.read_csv(
+            OUTPUT_DIR / f"{i}/measure_stripped.csv", parse_dates=["interval_start"]
+        )
 
-    deciles_chart(
-        df,
-        filename=f"output/figures_ehrql/plot_{i}.jpeg",
-        period_column="interval_start",
-        column="rate",
-        title=title_mapping[i],
-        ylabel="Percentage",
-        time_window=time_period_mapping.get(i, ""),
-        add_proportions=True,
-    )
+        jobs.append(
+            (
+                deciles_chart,
+                (df,),
+                dict(
+                    filename=f"output/figures_ehrql/plot_{i}.jpeg",
+                    period_column="interval_start",
+                    column="rate",
+                    title=title_mapping[i],
+                    ylabel="Percentage",
+                    time_window=time_period_mapping.get(i, ""),
+                    add_proportions=True,
+                ),
+            )
+        )
+
+    run_figures(jobs)
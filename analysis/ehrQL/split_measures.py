@@ -0,0 +1,63 @@
+import argparse
+import csv
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parents[2]
+OUTPUT_DIR = BASE_DIR / "output"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--input",
+        type=Path,
+        default=OUTPUT_DIR / "measures.csv",
+        help="measures file written by generate-measures for several indicators",
+    )
+    return parser.parse_args()
+
+
+def split_measures(input_path, output_dir):
+    """Splits a measures file into one 'measures.csv' per measure, in a directory
+    named after its indicator (e.g. 'a' for 'indicator_a'), as if each measure had
+    been generated on its own.
+
+    Rows are streamed through a single csv reader, so quoted values that span lines
+    are kept whole, and values are written as strings, exactly as generate-measures
+    wrote them. Returns the names of the indicators.
+    """
+    output_files = {}
+    writers = {}
+    try:
+        with open(input_path, newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            measure_column = header.index("measure")
+
+            for row in reader:
+                measure = row[measure_column]
+                if measure not in writers:
+                    indicator_dir = output_dir / measure[len("indicator_") :]
+                    indicator_dir.mkdir(parents=True, exist_ok=True)
+                    output_files[measure] = open(
+                        indicator_dir / "measures.csv", "w", newline=""
+                    )
+                    writers[measure] = csv.writer(
+                        output_files[measure], lineterminator="\n"
+                    )
+                    writers[measure].writerow(header)
+                writers[measure].writerow(row)
+    finally:
+        for output_file in output_files.values():
+            output_file.close()
+
+    return [measure[len("indicator_") :] for measure in output_files]
+
+
+def main():
+    args = parse_args()
+    split_measures(args.input, OUTPUT_DIR)
+
+
+if __name__ == "__main__":
+    main()
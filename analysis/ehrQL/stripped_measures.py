@@ -4,12 +4,15 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 
+from synthetic_measures import generate_measures
 
 BASE_DIR = Path(__file__).parents[2]
 OUTPUT_DIR = BASE_DIR / "output"
 
 BACKEND = os.getenv("OPENSAFELY_BACKEND", "expectations")
 
+MOCK_MEASURES_SEED = 0
+
 indicators_list = [
     "a",
     "b",
@@ -61,51 +64,19 @@ def main():
 
     measures_dict = {}
 
+    if BACKEND == "expectations":
+        # mock measures for 100 practices, in the format that generate-measures writes
+        rng = np.random.default_rng(MOCK_MEASURES_SEED)
+        practice_ids = rng.choice(range(1, 1000), size=100, replace=False)
+        months = pd.date_range('2019-01-01', '2021-01-01', freq='MS')
+        mock_measures = generate_measures(
+            months, practice_ids, indicators_list, seed=MOCK_MEASURES_SEED
+        )
+        mock_measures = dict(list(mock_measures.groupby('measure', sort=False)))
+
     for indicator in indicators_list:
         if BACKEND == "expectations":
-        # make a mock data frame with the following columns - measure,interval_start,interval_end,ratio,numerator,denominator
-     
-            measure_df = pd.DataFrame({
-                'measure': pd.Series([], dtype='str'),
-                'interval_start': pd.Series([], dtype='datetime64[ns]'),
-                'interval_end': pd.Series([], dtype='datetime64[ns]'),
-                'ratio': pd.Series([], dtype='float64'),
-                'numerator': pd.Series([], dtype='int64'),
-                'denominator': pd.Series([], dtype='int64'),
-                'practice': pd.Series([], dtype='int64')
-            })
-
-            start_date = pd.to_datetime('2019-01-01')
-            end_date = pd.to_datetime('2021-01-01')
-            months = pd.date_range(start_date, end_date, freq='MS').strftime("%Y-%m-%d").tolist()
-            
-            practice_ids = np.random.choice(range(1, 1000), size=100, replace=False)
-
-            df_data = []
-            for month in months:
-                for practice_id in practice_ids:
-                    denominator = np.random.randint(0, 1000)
-                    if denominator == 0:
-                        numerator = 0
-                        ratio = 0
-                    else:
-                        numerator = np.random.randint(0, denominator)
-                        ratio = numerator / denominator
-                    interval_end = pd.to_datetime(month) + pd.DateOffset(months=1) - pd.DateOffset(days=1)
-
-                    df_data.append(pd.DataFrame({
-                        'measure': f"indicator_{indicator}",
-                        'interval_start': month,
-                        'interval_end': interval_end,
-                        'ratio': ratio,
-                        'numerator': numerator,
-                        'denominator': denominator,
-                        'practice': practice_id
-                    }, index=[0]))
-            measure_df = pd.concat(df_data)
-            
-            measure_df = measure_df.sort_values(by=['measure', 'interval_start', 'practice']).reset_index(drop=True)
-        
+            measure_df = mock_measures[f"indicator_{indicator}"].reset_index(drop=True)
 
         else:
             measure_df = pd.read_csv(OUTPUT_DIR / f'{indicator}/measures.csv')
@@ -118,4 +89,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,134 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).parents[2]
+OUTPUT_DIR = BASE_DIR / "output"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Writes synthetic practice-level measures to <output-dir>/<indicator>/"
+            "measures.csv, as split_measures.py does, e.g. to load-test "
+            "stripped_measures.py (run with OPENSAFELY_BACKEND set to anything but "
+            "'expectations' so that it reads them) and plot_measures.py"
+        )
+    )
+    parser.add_argument("--start-date", default="2019-01-01")
+    parser.add_argument("--months", type=int, default=25)
+    parser.add_argument("--practices", type=int, default=6500)
+    parser.add_argument(
+        "--indicators",
+        nargs="+",
+        default=None,
+        help="indicators to generate (defaults to all of them)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--realistic",
+        action="store_true",
+        help="draw list sizes and rates that vary by practice, not uniformly",
+    )
+    parser.add_argument(
+        "--zero-inflation",
+        type=float,
+        default=0.0,
+        help="probability that a practice has no events in a month",
+    )
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR)
+    return parser.parse_args()
+
+
+def generate_measures(
+    months, practices, indicators, seed=None, realistic=False, zero_inflation=0.0
+):
+    """Returns a synthetic measure table for every month, practice and indicator, with
+    the columns that generate-measures writes (measure, interval_start, interval_end,
+    ratio, numerator, denominator and practice), sorted by measure, interval_start
+    and practice.
+
+    By default each denominator is uniform in [0, 1000) and each numerator uniform in
+    [0, denominator). When realistic is True each practice instead has a list size,
+    from a log-normal distribution, and a rate for each indicator, from a beta
+    distribution, that it keeps across months: denominators are Poisson around the
+    list size and numerators binomial at the rate. zero_inflation is the probability
+    that a practice's numerator is 0 in a month, whatever it would have been.
+
+    Args:
+        months: The first day of each month.
+        practices: The practice ids.
+        indicators: The indicators, e.g. "a" for "indicator_a".
+        seed: The seed of the random number generator.
+        realistic: Whether to draw realistic rather than uniform values.
+        zero_inflation: The probability of a numerator of 0.
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.DatetimeIndex(pd.to_datetime(months)).sort_values()
+    practices = np.sort(np.asarray(practices, dtype=np.int64))
+    shape = (len(indicators), len(months), len(practices))
+
+    if realistic:
+        # practices keep their list size and their rate of each indicator
+        list_size = rng.lognormal(np.log(500), 0.7, size=(1, 1, len(practices)))
+        denominator = rng.poisson(np.broadcast_to(list_size, shape))
+        rate = rng.beta(2, 40, size=(len(indicators), 1, len(practices)))
+        numerator = rng.binomial(denominator, np.broadcast_to(rate, shape))
+    else:
+        denominator = rng.integers(0, 1000, size=shape)
+        numerator = (rng.random(shape) * denominator).astype(np.int64)
+
+    if zero_inflation:
+        numerator[rng.random(shape) < zero_inflation] = 0
+
+    ratio = np.divide(
+        numerator, denominator, out=np.zeros(shape), where=denominator > 0
+    )
+
+    rows_per_indicator = len(months) * len(practices)
+    return pd.DataFrame(
+        {
+            "measure": pd.Categorical.from_codes(
+                np.repeat(np.arange(len(indicators)), rows_per_indicator),
+                categories=[f"indicator_{indicator}" for indicator in indicators],
+            ),
+            "interval_start": np.tile(
+                np.repeat(months.to_numpy(), len(practices)), len(indicators)
+            ),
+            "interval_end": np.tile(
+                np.repeat((months + pd.offsets.MonthEnd(0)).to_numpy(), len(practices)),
+                len(indicators),
+            ),
+            "ratio": ratio.ravel(),
+            "numerator": numerator.ravel().astype(np.int64),
+            "denominator": denominator.ravel().astype(np.int64),
+            "practice": np.tile(practices, len(indicators) * len(months)),
+        }
+    )
+
+
+def main():
+    from stripped_measures import indicators_list
+
+    args = parse_args()
+    indicators = indicators_list if args.indicators is None else args.indicators
+    months = pd.date_range(args.start_date, periods=args.months, freq="MS")
+
+    measures = generate_measures(
+        months,
+        np.arange(1, args.practices + 1),
+        indicators,
+        seed=args.seed,
+        realistic=args.realistic,
+        zero_inflation=args.zero_inflation,
+    )
+    for indicator, measure_df in measures.groupby("measure", sort=False):
+        indicator_dir = args.output_dir / indicator[len("indicator_") :]
+        indicator_dir.mkdir(parents=True, exist_ok=True)
+        measure_df.to_csv(indicator_dir / "measures.csv", index=False)
+
+
+if __name__ == "__main__":
+    main()
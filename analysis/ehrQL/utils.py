@@ -75,7 +75,7 @@ class CoPrescribingVariableGenerator:
         Initialize the CoPrescribingVariableGenerator based on the given parameters.
 
         Args:
-        - dataset: Dataset object.
+        - dataset: VariableRegistry to add the variables to.
         - medications: List of medication codes.
         - codelists: Tuple of two codelists.
         - codelist_names: Tuple of two codelist names.
@@ -124,7 +124,8 @@ class CoPrescribingVariableGenerator:
     def _get_earliest_date(self, prescriptions: Any) -> Any:
         return prescriptions.date.minimum_for_patient()
 
-    def _get_earliest_and_latest_dates(self, codelist: List[str], codelist_name) -> Dict[int, Dict[str, Any]]:
+    def _get_earliest_and_latest_dates(self, codelist: List[str], codelist_name) -> Dict[int, Dict[str, str]]:
+        # the names of the registered earliest and latest dates of each month
         dates = {}
         for month in range(1, self.months + 1):
             prescriptions = self._get_medications_month(codelist, month)
@@ -132,14 +133,14 @@ class CoPrescribingVariableGenerator:
                 self.dataset, prescriptions.exists_for_patient(), f"{codelist_name}_{month}"
             )
             dates[month] = {
-                "earliest": self._get_earliest_date(prescriptions),
-                "latest": self._get_latest_date(prescriptions),
+                "earliest": f"{codelist_name}_earliest_{month}",
+                "latest": f"{codelist_name}_latest_{month}",
             }
             self._update_dataset(
-                self.dataset, dates[month]["earliest"], f"{codelist_name}_earliest_{month}"
+                self.dataset, self._get_earliest_date(prescriptions), dates[month]["earliest"]
             )
             self._update_dataset(
-                self.dataset, dates[month]["latest"], f"{codelist_name}_latest_{month}"
+                self.dataset, self._get_latest_date(prescriptions), dates[month]["latest"]
             )
         return dates
 
@@ -161,24 +162,33 @@ class CoPrescribingVariableGenerator:
         return within_28_days
 
     def _update_dataset(self, dataset: Any, variable, variable_name: str) -> Any:
-        
-        setattr(
-            dataset,
+        # none of these depend on other registered variables
+        dataset.add(variable_name, variable)
+        return self.dataset
+
+    def _add_within_28_days(self, variables: Any, variable_name: str, date1: str, date2: str) -> Any:
+        # defined from the registered dates and read back through variables, so the
+        # registry knows what each flag is built from
+        self.dataset.derive(
             variable_name,
-            variable,
+            lambda v: self._within_28_days(getattr(v, date1), getattr(v, date2)),
         )
-        return self.dataset
+        return getattr(variables, variable_name)
 
-    def generate_co_prescribing_variable(self):
-        medication_1_flag = self.medication_1.exists_for_patient()
-        medication_2_flag = self.medication_2.exists_for_patient()
+    def generate_co_prescribing_variable(self, variables: Any) -> Any:
+        """
+        Add the co-prescribing variables to the registry and return the co-prescribing
+        flag, for `VariableRegistry.derive`.
 
+        Args:
+        - variables: The registry to read the variables the flag is defined from.
+        """
         self._update_dataset(
-            self.dataset, medication_1_flag, self.codelist_name_1
+            self.dataset, self.medication_1.exists_for_patient(), self.codelist_name_1
             )
         
         self._update_dataset(
-            self.dataset, medication_2_flag, self.codelist_name_2
+            self.dataset, self.medication_2.exists_for_patient(), self.codelist_name_2
             )
         
         
@@ -186,64 +196,55 @@ class CoPrescribingVariableGenerator:
         variables_codelist_1 = self._get_earliest_and_latest_dates(self.codelist_1, self.codelist_name_1)
         variables_codelist_2 = self._get_earliest_and_latest_dates(self.codelist_2, self.codelist_name_2)
 
+        medication_1_flag = getattr(variables, self.codelist_name_1)
+        medication_2_flag = getattr(variables, self.codelist_name_2)
+
         monthly_flags = []
         for month in range(self.months, 0, -1):
-            within_28_days_1_earliest_2_earliest = self._within_28_days(
-                    variables_codelist_1[month]["earliest"],
-                    variables_codelist_2[month]["earliest"],
-                )
-            
-            self._update_dataset(
-                self.dataset, within_28_days_1_earliest_2_earliest, f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_earliest_2_earliest_{month}"
+            within_28_days_1_earliest_2_earliest = self._add_within_28_days(
+                variables,
+                f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_earliest_2_earliest_{month}",
+                variables_codelist_1[month]["earliest"],
+                variables_codelist_2[month]["earliest"],
             )
 
-            within_28_days_1_earliest_2_latest = self._within_28_days(
+            within_28_days_1_earliest_2_latest = self._add_within_28_days(
+                variables,
+                f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_earliest_2_latest_{month}",
                 variables_codelist_1[month]["earliest"],
                 variables_codelist_2[month]["latest"],
             )
 
-            self._update_dataset(
-                self.dataset, within_28_days_1_earliest_2_latest, f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_earliest_2_latest_{month}"
-            )
-
-            within_28_days_1_latest_2_earliest = self._within_28_days(
+            within_28_days_1_latest_2_earliest = self._add_within_28_days(
+                variables,
+                f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_latest_2_earliest_{month}",
                 variables_codelist_1[month]["latest"],
                 variables_codelist_2[month]["earliest"],
             )
 
-            self._update_dataset(
-                self.dataset, within_28_days_1_latest_2_earliest, f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_latest_2_earliest_{month}"
-            )
-
-            within_28_days_1_latest_2_latest = self._within_28_days(
+            within_28_days_1_latest_2_latest = self._add_within_28_days(
+                variables,
+                f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_latest_2_latest_{month}",
                 variables_codelist_1[month]["latest"],
                 variables_codelist_2[month]["latest"],
             )
-
-            self._update_dataset(
-                self.dataset, within_28_days_1_latest_2_latest, f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_latest_2_latest_{month}"
-            )
             
             if month > 1:
                 
-                within_28_days_1_latest_2_earliest_prev_month = self._within_28_days(
+                within_28_days_1_latest_2_earliest_prev_month = self._add_within_28_days(
+                    variables,
+                    f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_latest_2_earliest_prev_month_{month}",
                     variables_codelist_1[month]["latest"],
                     variables_codelist_2[month - 1]["earliest"],
                 )
 
-                self._update_dataset(
-                    self.dataset, within_28_days_1_latest_2_earliest_prev_month, f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_latest_2_earliest_prev_month_{month}"
-                )
-
-                within_28_days_1_earliest_2_latest_prev_month = self._within_28_days(
+                within_28_days_1_earliest_2_latest_prev_month = self._add_within_28_days(
+                    variables,
+                    f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_earliest_2_latest_prev_month_{month}",
                     variables_codelist_1[month - 1]["earliest"],
                     variables_codelist_2[month]["latest"],
                 )
 
-                self._update_dataset(
-                    self.dataset, within_28_days_1_earliest_2_latest_prev_month, f"{self.codelist_name_1}_{self.codelist_name_2}_within_28_days_1_earliest_2_latest_prev_month_{month}"
-                )
-
                 monthly_flags.append(
                     medication_1_flag
                     & medication_2_flag
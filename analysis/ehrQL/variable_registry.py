@@ -0,0 +1,105 @@
+from typing import Any, Callable, List, Optional
+
+
+class VariableRegistry:
+    def __init__(self) -> None:
+        """
+        Records the dataset variables and the variables that each one is defined
+        from, so that a dataset only needs the variables used by the selected
+        measures.
+
+        Variables are added with `add` or `derive` and read back as attributes,
+        e.g. `variables.ppi`.
+        """
+        self._variables = {}
+        self._dependencies = {}
+        self._internal = set()
+
+    def add(self, name: str, variable: Any, internal: bool = False) -> Any:
+        """
+        Add a variable that isn't defined from other registered variables.
+
+        Args:
+        - name: Name of the variable in the dataset.
+        - variable: The variable's series.
+        - internal: Whether the variable is only used to define others, and is never
+            added to the dataset.
+
+        Returns:
+        - The variable.
+        """
+        self._variables[name] = variable
+        self._dependencies[name] = ()
+        if internal:
+            self._internal.add(name)
+        return variable
+
+    def derive(self, name: str, definition: Callable[[Any], Any]) -> Any:
+        """
+        Add a variable defined from other registered variables. The variables that
+        definition reads are recorded as its dependencies, so they can't get out of
+        step with the definition.
+
+        Args:
+        - name: Name of the variable in the dataset.
+        - definition: Function of the registry that returns the variable's series,
+            e.g. `lambda v: v.population_filter & ~v.ppi`.
+
+        Returns:
+        - The variable.
+        """
+        reads = _RecordingView(self)
+        variable = definition(reads)
+        self._variables[name] = variable
+        self._dependencies[name] = tuple(reads.names)
+        return variable
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self.__dict__["_variables"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def get_dependencies(self, names: List[str]) -> List[str]:
+        """
+        Get the names of the variables and everything they depend on, directly or
+        through other variables, in the order the variables were added.
+        """
+        required = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in required:
+                required.add(name)
+                pending.extend(self._dependencies[name])
+        return [name for name in self._variables if name in required]
+
+    def update_dataset(self, dataset: Any, names: Optional[List[str]] = None) -> None:
+        """
+        Add the variables in names and their dependencies to the dataset, apart from
+        the internal ones.
+
+        Args:
+        - dataset: Dataset object.
+        - names: Names of the variables the dataset needs. Defaults to every variable.
+        """
+        if names is None:
+            names = list(self._variables)
+        for name in self.get_dependencies(names):
+            if name not in self._internal:
+                setattr(dataset, name, self._variables[name])
+
+
+class _RecordingView:
+    def __init__(self, registry: VariableRegistry) -> None:
+        """
+        Reads the variables of registry, recording the name of each one read.
+        """
+        self._registry = registry
+        self.names = []
+
+    def __getattr__(self, name: str) -> Any:
+        variable = getattr(self._registry, name)
+        if name not in self.names:
+            self.names.append(name)
+        return variable
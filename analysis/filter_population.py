@@ -1,50 +1,78 @@
-import pandas as pd
-from utilities import OUTPUT_DIR, match_input_files, get_date_input_file
-
-counts = {}
-for file in OUTPUT_DIR.iterdir():
-    if match_input_files(file.name):
-        df = pd.read_feather(OUTPUT_DIR / file.name)
-
-        date = get_date_input_file(file.name)
-
-        df_filtered = df[
-            (
-                (df["registered"] == 1)
-                & (df["died"] == 0)
-                & ((df["age"] >= 18) & (df["age"] <= 120))
-                & (df["sex"].isin(["F", "M"]))
-                & (
-                    ((df["age"] >= 65) & (df["ppi"] == 0))
-                    | (
-                        (df["methotrexate_6_3_months"] == 1)
-                        & (df["methotrexate_3_months"] == 1)
-                    )
-                    | ((df["lithium_6_3_months"] == 1) & (df["lithium_3_months"] == 1))
-                    | (
-                        (df["amiodarone_12_6_months"] == 1)
-                        & (df["amiodarone_6_months"] == 1)
-                    )
-                    | (
-                        ((df["gi_bleed"] == 1) | (df["peptic_ulcer"] == 1))
-                        & (df["ppi"] == 0)
-                    )
-                    | (df["anticoagulant"] == 1)
-                    | ((df["aspirin"] == 1) & (df["ppi"] == 0))
-                    | (
-                        ((df["asthma"] == 1) & (df["asthma_resolved"] == 0))
-                        | (df["asthma_resolved_date"] < df["asthma_date"])
-                    )
-                    | (df["heart_failure"] == 1)
-                    | (df["egfr_between_1_and_45"] == 1)
-                    | ((df["age"] >= 75) & (df["acei"] == 1) & (df["acei_recent"] == 1))
-                    | (
-                        (df["age"] >= 75)
-                        & (df["loop_diuretic"] == 1)
-                        & (df["loop_diuretic_recent"] == 1)
-                    )
+import argparse
+from functools import partial
+from utilities import (
+    OUTPUT_DIR,
+    add_indicator_e_f,
+    get_manifest,
+    run_monthly,
+    write_feather,
+)
+
+
+def filter_population(date, input_file, fused=False):
+    # every column is kept, the later stages read their own subset of them
+    df = input_file.read()
+
+    df_filtered = df[
+        (
+            (df["registered"] == 1)
+            & (df["died"] == 0)
+            & ((df["age"] >= 18) & (df["age"] <= 120))
+            & (df["sex"].isin(["F", "M"]))
+            & (
+                ((df["age"] >= 65) & (df["ppi"] == 0))
+                | (
+                    (df["methotrexate_6_3_months"] == 1)
+                    & (df["methotrexate_3_months"] == 1)
+                )
+                | ((df["lithium_6_3_months"] == 1) & (df["lithium_3_months"] == 1))
+                | (
+                    (df["amiodarone_12_6_months"] == 1)
+                    & (df["amiodarone_6_months"] == 1)
+                )
+                | (
+                    ((df["gi_bleed"] == 1) | (df["peptic_ulcer"] == 1))
+                    & (df["ppi"] == 0)
+                )
+                | (df["anticoagulant"] == 1)
+                | ((df["aspirin"] == 1) & (df["ppi"] == 0))
+                | (
+                    ((df["asthma"] == 1) & (df["asthma_resolved"] == 0))
+                    | (df["asthma_resolved_date"] < df["asthma_date"])
+                )
+                | (df["heart_failure"] == 1)
+                | (df["egfr_between_1_and_45"] == 1)
+                | ((df["age"] >= 75) & (df["acei"] == 1) & (df["acei_recent"] == 1))
+                | (
+                    (df["age"] >= 75)
+                    & (df["loop_diuretic"] == 1)
+                    & (df["loop_diuretic_recent"] == 1)
                 )
             )
-        ].reset_index()
+        )
+    ].reset_index()
+
+    if fused:
+        # calculate the indicator E and F numerators in the same pass, so that
+        # calculate_numerators doesn't need to run
+        add_indicator_e_f(df_filtered)
+
+    write_feather(df_filtered, OUTPUT_DIR / f"input_filtered_{date}.feather")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="add the indicator E and F numerators to the filtered files",
+    )
+    return parser.parse_args()
+
 
-        df_filtered.to_feather(OUTPUT_DIR / f"input_filtered_{date}.feather")
+if __name__ == "__main__":
+    args = parse_args()
+    run_monthly(
+        partial(filter_population, fused=args.fused),
+        get_manifest().iter_files("input_joined"),
+    )
@@ -0,0 +1,107 @@
+"""Brings the monthly files in output/ up to date for a local run, only processing
+the months that are new or have changed since the last run.
+
+The project.yaml actions always process every month. Locally, the cohort can be
+extracted with `--skip-existing`, so that months that already have an input file
+aren't extracted again:
+
+    cohortextractor generate_cohort --study-definition study_definition \\
+        --index-date-range "2019-09-01 to 2023-05-01 by month" \\
+        --output-format feather --skip-existing
+
+Then `python analysis/incremental.py` does what the join_ethnicity_region,
+filter_population and calculate_numerators actions do, for the months whose outputs
+are out of date. The later actions read every month and are run as usual.
+
+What each month's outputs were written from is recorded in output/ (see
+`IncrementalStage`). Input files that were extracted with an earlier version of the
+study definition raise an error naming the files to delete and extract again.
+"""
+import argparse
+from functools import partial
+from pathlib import Path
+from utilities import (
+    ANALYSIS_DIR,
+    BASE_DIR,
+    OUTPUT_DIR,
+    IncrementalStage,
+    InputManifest,
+    check_extracted_inputs,
+    get_definition_hash,
+    join_ethnicity_region,
+    run_monthly,
+)
+from filter_population import filter_population
+from calculate_numerators import COLUMNS, calculate_numerators
+
+# the files that the monthly input files are extracted with
+EXTRACTION_DEFINITION = [
+    ANALYSIS_DIR / "study_definition.py",
+    ANALYSIS_DIR / "codelists.py",
+    ANALYSIS_DIR / "codelist_cache.py",
+    ANALYSIS_DIR / "co_prescribing_variables.py",
+    ANALYSIS_DIR / "config.py",
+    BASE_DIR / "codelists",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="add the indicator E and F numerators to the filtered files, instead of "
+        "writing the indicator_e_f files",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    utilities = Path(__file__).with_name("utilities.py")
+
+    check_extracted_inputs(
+        InputManifest(OUTPUT_DIR, save_cache=True).iter_files("input"),
+        get_definition_hash(EXTRACTION_DEFINITION),
+    )
+
+    joined = IncrementalStage(
+        "input_joined",
+        "input_joined_{date}.feather",
+        get_definition_hash(
+            [
+                utilities,
+                ANALYSIS_DIR / "ONS_MSOA_to_region_map.csv",
+                OUTPUT_DIR / "input_ethnicity.feather",
+            ]
+        ),
+    ).update(
+        InputManifest(OUTPUT_DIR, save_cache=True).iter_files("input"),
+        partial(join_ethnicity_region, OUTPUT_DIR),
+    )
+    print(f"Joined: {', '.join(joined) or 'none'}")
+
+    definition = get_definition_hash([ANALYSIS_DIR / "filter_population.py", utilities])
+    filtered = IncrementalStage(
+        "input_filtered",
+        "input_filtered_{date}.feather",
+        # fused and unfused outputs have different columns
+        f"{definition}-fused" if args.fused else definition,
+    ).update(
+        InputManifest(OUTPUT_DIR, save_cache=True).iter_files("input_joined"),
+        partial(run_monthly, partial(filter_population, fused=args.fused)),
+    )
+    print(f"Filtered: {', '.join(filtered) or 'none'}")
+
+    if not args.fused:
+        manifest = InputManifest(OUTPUT_DIR, save_cache=True)
+        manifest.require_columns("input_filtered", COLUMNS)
+        calculated = IncrementalStage(
+            "indicator_e_f",
+            "indicator_e_f_{date}.feather",
+            get_definition_hash([ANALYSIS_DIR / "calculate_numerators.py", utilities]),
+        ).update(
+            manifest.iter_files("input_filtered"),
+            partial(run_monthly, calculate_numerators),
+        )
+        print(f"Numerators calculated: {', '.join(calculated) or 'none'}")
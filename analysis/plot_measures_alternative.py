@@ -4,11 +4,13 @@ import os
 import json
 from config import indicators_list
 
-from utilities import OUTPUT_DIR, drop_irrelevant_practices
+from utilities import OUTPUT_DIR, drop_irrelevant_practices, run_figures
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
+import seaborn as sns
 
-additional_indicators = ["e", "f", "li"]
+additional_indicators = ["e", "f"]
 indicators_list.extend(additional_indicators)
 
 
@@ -76,7 +78,7 @@ def deciles_chart(
     )
     
     practice_numbers = practice_numbers.apply(lambda x: round(x / 5) * 5)
-    df = compute_deciles(df, period_column, column, has_outer_percentiles=False)
+    deciles = compute_percentiles(df, period_column, column, DECILES)
     
     # calculate monthyl proportion of practices with non zero values
 
@@ -84,66 +86,24 @@ def deciles_chart(
 
     fig, ax = plt.subplots(1, 1, figsize=(15, 8))
 
-    linestyles = {
-        "decile": {
-            "line": "b--",
-            "linewidth": 1,
-            "label": "Decile",
-        },
-        "median": {
-            "line": "b-",
-            "linewidth": 1.5,
-            "label": "Median",
-        },
-        "percentile": {
-            "line": "b:",
-            "linewidth": 0.8,
-            "label": "1st-9th, 91st-99th percentile",
-        },
-    }
-    label_seen = []
-    for percentile in range(1, 100):  # plot each decile line
-        data = df[df["percentile"] == percentile]
-        add_label = False
-
-        if percentile == 50:
-            style = linestyles["median"]
-            add_label = True
-
-        else:
-            style = linestyles["decile"]
-            if "decile" not in label_seen:
-                label_seen.append("decile")
-                add_label = True
-        if add_label:
-            label = style["label"]
-        else:
-            label = "_nolegend_"
-
-        ax.plot(
-            data[period_column],
-            data[column],
-            style["line"],
-            linewidth=style["linewidth"],
-            label=label,
-        )
+    plot_percentiles(ax, deciles)
     ax.set_ylabel(ylabel, size=15, alpha=0.6)
     if title:
         ax.set_title(title, size=14, wrap=True)
     # set ymax across all subplots as largest value across dataset
 
     ax.set_ylim(
-        [0, 100 if df[column].isnull().values.all() else df[column].max() * 1.05]
+        [0, 100 if deciles.isnull().values.all() else deciles.max().max() * 1.05]
     )
     ax.tick_params(labelsize=12)
     ax.set_xlim(
-        [df[period_column].min(), df[period_column].max()]
+        [deciles.index.min(), deciles.index.max()]
     )  # set x axis range as full date range
 
     plt.setp(ax.xaxis.get_majorticklabels(), rotation=90)
     ax.xaxis.set_major_formatter(matplotlib.dates.DateFormatter("%B %Y"))
 
-    plt.xticks(sorted(df[period_column].unique()), rotation=90)
+    plt.xticks(deciles.index, rotation=90)
 
     plt.vlines(
         x=[pd.to_datetime("2020-03-01")],
@@ -189,23 +149,30 @@ def deciles_chart(
     plt.clf()
 
 
-for i in indicators_list:
-    # indicator plots
-    df = pd.read_csv(
-        OUTPUT_DIR / f"measure_indicator_{i}_rate.csv", parse_dates=["date"]
-    )
-
-    # Need this for dummy data
-    df = df.replace(np.inf, np.nan)
-
+if __name__ == "__main__":
+    jobs = []
+    for i in indicators_list:
+        # indicator plots
+        df = pd.read_csv(
+            OUTPUT_DIR / f"measure_indicator_{i}_rate.csv", parse_dates=["date"]
+        )
 
-    deciles_chart(
-        df,
-        filename=f"output/figures/plot_{i}_alternative.jpeg",
-        period_column="date",
-        column="value",
-        title=title_mapping[i],
-        ylabel="Percentage",
-        time_window=time_period_mapping.get(i, ""),
-    )
+        # Need this for dummy data
+        df = df.replace(np.inf, np.nan)
+
+        jobs.append(
+            (
+                deciles_chart,
+                (df,),
+                dict(
+                    filename=f"output/figures/plot_{i}_alternative.jpeg",
+                    period_column="date",
+                    column="value",
+                    title=title_mapping[i],
+                    ylabel="Percentage",
+                    time_window=time_period_mapping.get(i, ""),
+                ),
+            )
+        )
 
+    run_figures(jobs)
@@ -3,8 +3,11 @@ import numpy as np
 import json
 from utilities import (
     OUTPUT_DIR,
-    match_input_files_filtered,
-    get_date_input_file_filtered,
+    PatientSet,
+    get_indicator_matrix,
+    get_manifest,
+    read_filtered,
+    require_filtered_columns,
     get_number_patients,
     get_number_events,
     get_percentage_practices,
@@ -15,62 +18,61 @@ from config import indicators_list, backend
 additional_indicators = ["e", "f"]
 indicators_list.extend(additional_indicators)
 
+# columns read from the monthly input_filtered files
+columns = (
+    ["patient_id", "practice", "indicator_me_denominator"]
+    + [
+        f"indicator_{i}_numerator"
+        for i in indicators_list
+        if i not in additional_indicators
+    ]
+    + [
+        f"indicator_{i}_denominator"
+        for i in indicators_list
+        if i not in ["me_no_fbc", "me_no_lft"]
+    ]
+)
+
 practice_list = []
 practice_list_event = []
 patient_counts_dict = {"numerator": {}, "denominator": {}}
-patient_dict = {"numerator": {}, "denominator": {}}
+patient_sets = {
+    "numerator": {indicator: PatientSet() for indicator in indicators_list},
+    "denominator": {indicator: PatientSet() for indicator in indicators_list},
+}
 num_events_total = 0
 
-for file in OUTPUT_DIR.iterdir():
-    if match_input_files_filtered(file.name):
-        df = pd.read_feather(OUTPUT_DIR / file.name)
-        date = get_date_input_file_filtered(file.name)
-        practice_list.extend(np.unique(df["practice"]))
-
-        for indicator in indicators_list:
-            if indicator in ["e", "f"]:
-                df_e_f = pd.read_feather(OUTPUT_DIR / f"indicator_e_f_{date}.feather")
-
-                df_subset_numerator = df_e_f[
-                    df_e_f[f"indicator_{indicator}_numerator"] == 1
-                ]
-
-            else:
-                df_subset_numerator = df[df[f"indicator_{indicator}_numerator"] == 1]
-                # get unique patients
-
-            # keep running count of total events
-            num_events_total += df_subset_numerator[
-                f"indicator_{indicator}_numerator"
-            ].sum()
-
-            # the same denominator is used for both mtx measures
-            if indicator in ["me_no_fbc", "me_no_lft"]:
-                df_subset_denominator = df[df[f"indicator_me_denominator"] == 1]
-            else:
-                df_subset_denominator = df[
-                    df[f"indicator_{indicator}_denominator"] == 1
-                ]
-
-            # get all practices that experience an event
-            practice_list_event.extend(np.unique(df_subset_numerator["practice"]))
+numerator_columns = [f"indicator_{i}_numerator" for i in indicators_list]
+# the same denominator is used for both mtx measures
+denominator_columns = [
+    "indicator_me_denominator"
+    if i in ["me_no_fbc", "me_no_lft"]
+    else f"indicator_{i}_denominator"
+    for i in indicators_list
+]
 
-            patients_numerator = list(df_subset_numerator["patient_id"])
-            patients_denominator = list(df_subset_denominator["patient_id"])
+manifest = get_manifest()
+require_filtered_columns(manifest, columns)
+for date, input_file in manifest.iter_files("input_filtered"):
+    df = read_filtered(manifest, date, input_file, columns)
+    patient_ids = df["patient_id"].to_numpy()
+    practices = df["practice"].to_numpy()
+    practice_list.extend(np.unique(practices))
 
-            if indicator not in patient_dict["numerator"]:
-                # create key
-                patient_dict["numerator"][indicator] = patients_numerator
+    # which patients are in each indicator's numerator and denominator, found in one
+    # pass over the month rather than one per indicator
+    numerators = get_indicator_matrix(df, numerator_columns)
+    denominators = get_indicator_matrix(df, denominator_columns)
 
-            else:
-                patient_dict["numerator"][indicator].extend(patients_numerator)
+    # keep running count of total events
+    num_events_total += numerators.sum()
 
-            if indicator not in patient_dict["denominator"]:
-                # create key
-                patient_dict["denominator"][indicator] = patients_denominator
+    # get all practices that experience an event
+    practice_list_event.extend(np.unique(practices[numerators.any(axis=1)]))
 
-            else:
-                patient_dict["denominator"][indicator].extend(patients_denominator)
+    for i, indicator in enumerate(indicators_list):
+        patient_sets["numerator"][indicator].add(patient_ids[numerators[:, i]])
+        patient_sets["denominator"][indicator].add(patient_ids[denominators[:, i]])
 
 
 num_practices = int(len(np.unique(practice_list)))
@@ -83,61 +85,16 @@ with open(f"output/practice_count_{backend}.json", "w") as f:
     )
 
 
-unique_patients_total = []
-unique_patients_total_denominator = []
-unique_patients_categories = {
-    "gi_bleed": {"numerator": [], "denominator": []},
-    "monitoring": {"numerator": [], "denominator": []},
-    "other": {"numerator": [], "denominator": []},
+categories = {
+    "gi_bleed": ["a", "b", "c", "d", "e", "f"],
+    "monitoring": ["ac", "me_no_fbc", "me_no_lft", "li", "am"],
+    "other": ["g", "i", "k"],
 }
 
-for key, value in patient_dict["numerator"].items():
-    # get unique patients
-    unique_patients_numerator = len(np.unique(patient_dict["numerator"][key]))
-    unique_patients_total.extend(np.unique(patient_dict["numerator"][key]))
-
-    if key in ["a", "b", "c", "d", "e", "f"]:
-        unique_patients_categories["gi_bleed"]["numerator"].extend(
-            np.unique(patient_dict["numerator"][key])
-        )
-
-    elif key in ["g", "i", "k"]:
-        unique_patients_categories["other"]["numerator"].extend(
-            np.unique(patient_dict["numerator"][key])
-        )
-
-    elif key in ["ac", "me_no_fbc", "me_no_lft", "li", "am"]:
-        unique_patients_categories["monitoring"]["numerator"].extend(
-            np.unique(patient_dict["numerator"][key])
-        )
-
-    # add to dictionary as num(mil)
-    patient_counts_dict["numerator"][key] = unique_patients_numerator
-
-for key, value in patient_dict["denominator"].items():
-    # get unique patients
-    unique_patients_denominator = len(np.unique(patient_dict["denominator"][key]))
-    unique_patients_total_denominator.extend(
-        np.unique(patient_dict["denominator"][key])
-    )
-
-    if key in ["a", "b", "c", "d", "e", "f"]:
-        unique_patients_categories["gi_bleed"]["denominator"].extend(
-            np.unique(patient_dict["denominator"][key])
-        )
-
-    elif key in ["g", "i", "k"]:
-        unique_patients_categories["other"]["denominator"].extend(
-            np.unique(patient_dict["denominator"][key])
-        )
-
-    elif key in ["ac", "me_no_fbc", "me_no_lft", "li", "am"]:
-        unique_patients_categories["monitoring"]["denominator"].extend(
-            np.unique(patient_dict["denominator"][key])
-        )
-
-    # add to dictionary as num(mil)
-    patient_counts_dict["denominator"][key] = unique_patients_denominator
+for key in ["numerator", "denominator"]:
+    for indicator, patient_set in patient_sets[key].items():
+        # add to dictionary as num(mil)
+        patient_counts_dict[key][indicator] = len(patient_set)
 
 
 with open(f"output/patient_count_{backend}.json", "w") as f:
@@ -178,32 +135,23 @@ for indicator in indicators_list:
         practices_monitoring.extend(unique_practices)
 
 
-counts_dict["total_patients"] = len(np.unique(unique_patients_total))
+counts_dict["total_patients"] = len(
+    PatientSet.union(patient_sets["numerator"].values())
+)
 counts_dict["total_patients_denominator"] = len(
-    np.unique(unique_patients_total_denominator)
+    PatientSet.union(patient_sets["denominator"].values())
 )
 counts_dict["total_events"] = float(num_events_total)
 
-counts_dict["gi_bleed"]["patients_numerator"] = len(
-    np.unique(unique_patients_categories["gi_bleed"]["numerator"])
-)
-counts_dict["gi_bleed"]["patients_denominator"] = len(
-    np.unique(unique_patients_categories["gi_bleed"]["denominator"])
-)
-
-counts_dict["monitoring"]["patients_numerator"] = len(
-    np.unique(unique_patients_categories["monitoring"]["numerator"])
-)
-counts_dict["monitoring"]["patients_denominator"] = len(
-    np.unique(unique_patients_categories["monitoring"]["denominator"])
-)
-
-counts_dict["other"]["patients_numerator"] = len(
-    np.unique(unique_patients_categories["other"]["numerator"])
-)
-counts_dict["other"]["patients_denominator"] = len(
-    np.unique(unique_patients_categories["other"]["denominator"])
-)
+for category, category_indicators in categories.items():
+    for key in ["numerator", "denominator"]:
+        counts_dict[category][f"patients_{key}"] = len(
+            PatientSet.union(
+                patient_sets[key][indicator]
+                for indicator in category_indicators
+                if indicator in patient_sets[key]
+            )
+        )
 
 
 counts_dict["monitoring"]["num_practices"] = len(np.unique(practices_monitoring))
@@ -0,0 +1,504 @@
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+BASE_DIR = Path(__file__).parents[1]
+OUTPUT_DIR = BASE_DIR / "output"
+
+# the share of patients with each flag. A flag with a condition is instead given to
+# the share in the first value of the patients with the condition, and to the share
+# in the second value of those without it
+FLAG_PREVALENCE = {
+    "registered": 0.98,
+    "died": 0.01,
+    "oral_nsaid": 0.05,
+    "ppi": 0.15,
+    "peptic_ulcer": 0.02,
+    "gi_bleed": 0.01,
+    "non_selective_bb": 0.01,
+    "heart_failure": 0.02,
+    "asthma": 0.12,
+    "asthma_resolved": ("asthma", 0.2, 0.005),
+    "acei": 0.12,
+    "loop_diuretic": 0.05,
+    "acei_recent": ("acei", 0.6, 0.01),
+    "loop_diuretic_recent": ("loop_diuretic", 0.6, 0.01),
+    "renal_function_test": 0.4,
+    "electrolytes_test": ("renal_function_test", 0.9, 0.05),
+    "methotrexate_6_3_months": 0.005,
+    "methotrexate_3_months": ("methotrexate_6_3_months", 0.9, 0.0005),
+    "full_blood_count": 0.2,
+    "liver_function_test": ("full_blood_count", 0.7, 0.05),
+    "lithium_6_3_months": 0.002,
+    "lithium_3_months": ("lithium_6_3_months", 0.9, 0.0002),
+    "lithium_level_3_months": ("lithium_3_months", 0.6, 0.0),
+    "amiodarone_12_6_months": 0.002,
+    "amiodarone_6_months": ("amiodarone_12_6_months", 0.9, 0.0002),
+    "thyroid_function_test": 0.1,
+}
+
+# the medications of `create_co_prescribing_variables`, and the share of patients
+# prescribed each of them in the last 3 months
+CO_PRESCRIBING_PREVALENCE = {
+    "anticoagulant": 0.03,
+    "antiplatelet_including_aspirin": 0.06,
+    "aspirin": 0.04,
+    "antiplatelet_excluding_aspirin": 0.02,
+}
+CO_PRESCRIBING_PAIRS = [
+    ("anticoagulant", "antiplatelet_including_aspirin"),
+    ("aspirin", "antiplatelet_excluding_aspirin"),
+]
+# the probability that a patient prescribed one of them is prescribed it in each month
+MONTHLY_PRESCRIPTION = 0.8
+
+CATEGORY_RATIOS = {
+    "sex": {"M": 0.495, "F": 0.495, "U": 0.01},
+    "msoa": {
+        "E02002488": 0.1,
+        "E02002586": 0.1,
+        "E02002677": 0.1,
+        "E02002814": 0.1,
+        "E02002915": 0.1,
+        "E02003251": 0.1,
+        "E02000003": 0.2,
+        "E02003334": 0.1,
+        "E02002986": 0.1,
+    },
+    "imd": {0: 0.05, 1: 0.19, 2: 0.19, 3: 0.19, 4: 0.19, 5: 0.19},
+    "egfr_comparator": {
+        None: 0.10,
+        "~": 0.05,
+        "=": 0.65,
+        ">=": 0.05,
+        ">": 0.05,
+        "<": 0.05,
+        "<=": 0.05,
+    },
+    "ethnicity": {
+        "White": 0.8,
+        "Mixed": 0.03,
+        "South Asian": 0.08,
+        "Black": 0.04,
+        "Other": 0.02,
+        "Missing": 0.03,
+    },
+}
+AGE_BANDS = [
+    ("0-19", 0, 20),
+    ("20-29", 20, 30),
+    ("30-39", 30, 40),
+    ("40-49", 40, 50),
+    ("50-59", 50, 60),
+    ("60-69", 60, 70),
+    ("70-79", 70, 80),
+    ("80+", 80, 121),
+]
+EGFR_INCIDENCE = 0.3
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Writes synthetic input_YYYY-MM-DD.feather files with the columns of "
+            "study_definition.py, and input_ethnicity.feather, for running the "
+            "pipeline at scale without a backend"
+        )
+    )
+    parser.add_argument("--start-date", default="2019-09-01")
+    parser.add_argument("--months", type=int, default=1)
+    parser.add_argument("--patients", type=int, default=1_000_000)
+    parser.add_argument(
+        "--practices",
+        type=int,
+        default=None,
+        help="defaults to one practice for every 8,000 patients",
+    )
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR)
+    return parser.parse_args()
+
+
+def to_date_strings(rng, start, end, has_date):
+    """Returns a string array of "YYYY-MM-DD" dates in [start, end), and nulls where
+    has_date is False."""
+    start, end = np.datetime64(start, "D"), np.datetime64(end, "D")
+    days = np.arange(start, end).astype(str)
+    indices = rng.integers(0, len(days), size=len(has_date))
+    return dates_from_indices(days, indices, has_date)
+
+
+def dates_from_indices(days, indices, has_date):
+    """Returns a string array of days[indices], with nulls where has_date is False."""
+    return pa.DictionaryArray.from_arrays(
+        pa.array(indices, type=pa.int32(), mask=~has_date), pa.array(days)
+    ).dictionary_decode()
+
+
+def choose_categories(rng, ratios, size):
+    """Returns an array of the keys of ratios, drawn in proportion to the values."""
+    categories = list(ratios)
+    p = np.array(list(ratios.values()), dtype=np.float64)
+    codes = rng.choice(len(categories), size=size, p=p / p.sum())
+    if all(isinstance(category, int) for category in categories):
+        return pa.array(np.array(categories, dtype=np.int64)[codes])
+    has_category = np.array([category is not None for category in categories])
+    return pa.DictionaryArray.from_arrays(
+        pa.array(codes, type=pa.int32(), mask=~has_category[codes]),
+        pa.array([str(category) for category in categories]),
+    ).dictionary_decode()
+
+
+def generate_chunk(rng, index_date, patient_ids, practice_sizes):
+    """Returns a RecordBatch of the study_definition.py columns, in the same order,
+    for patient_ids at index_date. Patients are registered at practice i + 1 in
+    proportion to practice_sizes[i].
+
+    The flags are drawn with the prevalence in `FLAG_PREVALENCE` and the variables
+    that study_definition.py derives from them (e.g. the indicators) are derived from
+    them in the same way, so the indicators have a realistic prevalence and agree
+    with the variables they're defined by.
+    """
+    n = len(patient_ids)
+    index_date = pd.Timestamp(index_date)
+    columns = {"patient_id": pa.array(patient_ids, type=pa.int64())}
+    values = {}
+
+    def flag(name, value):
+        values[name] = value
+        columns[name] = pa.array(value.astype(np.int64))
+
+    def draw_flag(name):
+        prevalence = FLAG_PREVALENCE[name]
+        if isinstance(prevalence, tuple):
+            condition, p_with, p_without = prevalence
+            p = np.where(values[condition], p_with, p_without)
+        else:
+            p = prevalence
+        flag(name, rng.random(n) < p)
+
+    def months_before(months):
+        return (index_date - pd.DateOffset(months=months)).date()
+
+    draw_flag("registered")
+    draw_flag("died")
+
+    practice = rng.choice(
+        len(practice_sizes), size=n, p=practice_sizes / practice_sizes.sum()
+    )
+    columns["practice"] = pa.array(practice.astype(np.int64) + 1)
+
+    # ages are roughly uniform up to 60, then fewer at each age up to 105
+    ages = np.arange(106)
+    age_weights = np.clip((105 - ages) / 45, 0, 1)
+    age = rng.choice(ages, size=n, p=age_weights / age_weights.sum())
+    values["age"] = age
+    columns["age"] = pa.array(age.astype(np.int64))
+
+    bands = [band for band, _, _ in AGE_BANDS] + ["missing"]
+    age_band = np.full(n, len(AGE_BANDS))
+    for i, (_, lower, upper) in enumerate(AGE_BANDS):
+        age_band[(age >= lower) & (age < upper)] = i
+    columns["age_band"] = pa.DictionaryArray.from_arrays(
+        pa.array(age_band, type=pa.int32()), pa.array(bands)
+    ).dictionary_decode()
+
+    flag("practice_population", (age <= 120) & values["registered"])
+    for name in ["sex", "msoa", "imd"]:
+        columns[name] = choose_categories(rng, CATEGORY_RATIOS[name], n)
+
+    days = np.arange(
+        np.datetime64(months_before(3), "D"), np.datetime64(index_date.date(), "D")
+    )
+    day_strings = days.astype(str)
+    month_starts = [np.datetime64(months_before(m), "D") for m in (3, 2, 1, 0)]
+    for pair in CO_PRESCRIBING_PAIRS:
+        dates = {}
+        for name in pair:
+            prescribed = rng.random(n) < CO_PRESCRIBING_PREVALENCE[name]
+            monthly = prescribed[:, None] & (rng.random((n, 3)) < MONTHLY_PRESCRIPTION)
+            # patients prescribed it in the last 3 months were in at least one month
+            monthly[prescribed & ~monthly.any(axis=1), 2] = True
+
+            earliest, latest = [], []
+            for i in range(3):
+                start = (month_starts[i] - days[0]).astype(np.int64)
+                length = (month_starts[i + 1] - month_starts[i]).astype(np.int64)
+                first = start + rng.integers(0, length, size=n)
+                last = first + (rng.random(n) * (start + length - first)).astype(
+                    np.int64
+                )
+                earliest.append(first)
+                latest.append(last)
+
+            last_prescribed = np.where(
+                monthly[:, 2], latest[2], np.where(monthly[:, 1], latest[1], latest[0])
+            )
+            flag(name, prescribed)
+            columns[f"{name}_date"] = dates_from_indices(
+                day_strings, last_prescribed, prescribed
+            )
+            for i, month in enumerate((3, 2, 1)):
+                dates[f"earliest_{name}_month_{month}"] = dates_from_indices(
+                    day_strings, earliest[i], monthly[:, i]
+                )
+            for i, month in enumerate((3, 2, 1)):
+                dates[f"latest_{name}_month_{month}"] = dates_from_indices(
+                    day_strings, latest[i], monthly[:, i]
+                )
+        columns.update(dates)
+
+    draw_flag("oral_nsaid")
+    draw_flag("ppi")
+    no_ppi = ~values["ppi"]
+    age_65 = (age >= 65) & (age <= 120)
+    flag("indicator_a_denominator", no_ppi & age_65)
+    flag("indicator_a_numerator", no_ppi & age_65 & values["oral_nsaid"])
+
+    draw_flag("peptic_ulcer")
+    draw_flag("gi_bleed")
+    ulcer_or_bleed = values["gi_bleed"] | values["peptic_ulcer"]
+    flag("indicator_b_denominator", no_ppi & ulcer_or_bleed)
+    flag("indicator_b_numerator", no_ppi & ulcer_or_bleed & values["oral_nsaid"])
+    flag("indicator_c_denominator", no_ppi & ulcer_or_bleed)
+    flag(
+        "indicator_c_numerator",
+        no_ppi
+        & ulcer_or_bleed
+        & (values["antiplatelet_excluding_aspirin"] | values["aspirin"]),
+    )
+    flag("indicator_d_denominator", values["anticoagulant"])
+    flag("indicator_d_numerator", values["anticoagulant"] & values["oral_nsaid"])
+    flag("indicator_e_denominator", values["anticoagulant"] & no_ppi)
+    flag("indicator_f_denominator", values["aspirin"] & no_ppi)
+
+    # dates of the last asthma and asthma resolved codes, up to 10 years ago
+    draw_flag("asthma")
+    columns["asthma_date"] = to_date_strings(
+        rng, months_before(120), months_before(3), values["asthma"]
+    )
+    draw_flag("asthma_resolved")
+    columns["asthma_resolved_date"] = to_date_strings(
+        rng, months_before(120), index_date.date(), values["asthma_resolved"]
+    )
+    # missing dates compare as False, as NULLs do in the study definition
+    asthma_date = pd.to_datetime(columns["asthma_date"].to_pandas())
+    asthma_resolved_date = pd.to_datetime(columns["asthma_resolved_date"].to_pandas())
+    resolved_before = (asthma_resolved_date < asthma_date).to_numpy()
+    resolved_on_or_before = (asthma_resolved_date <= asthma_date).to_numpy()
+
+    flag("no_asthma_resolved", values["asthma"] & ~values["asthma_resolved"])
+    draw_flag("non_selective_bb")
+    flag("indicator_g_denominator", values["asthma"] & resolved_before)
+    flag(
+        "indicator_g_denominator_alternative",
+        values["no_asthma_resolved"] | resolved_on_or_before,
+    )
+    flag(
+        "indicator_g_numerator",
+        values["asthma"] & resolved_before & values["non_selective_bb"],
+    )
+
+    draw_flag("heart_failure")
+    flag("indicator_i_denominator", values["heart_failure"])
+    flag("indicator_i_numerator", values["heart_failure"] & values["oral_nsaid"])
+
+    has_egfr = rng.random(n) < EGFR_INCIDENCE
+    egfr = np.where(has_egfr, rng.normal(45.0, 20, size=n), np.nan)
+    columns["egfr"] = pa.array(egfr, type=pa.float64())
+    # only patients with an egfr have a comparator
+    columns["egfr_comparator"] = pc.if_else(
+        has_egfr, choose_categories(rng, CATEGORY_RATIOS["egfr_comparator"], n), None
+    )
+    comparator = np.asarray(
+        columns["egfr_comparator"].to_numpy(zero_copy_only=False), dtype=object
+    )
+    egfr_less_than_45 = (egfr >= 0) & (egfr < 45)
+    egfr_between_1_and_45 = (
+        (egfr >= 1)
+        & (egfr < 45)
+        & ~np.isin(comparator, [">", ">=", "~"])
+        & ~((egfr == 1) & (comparator == "<"))
+    )
+    flag("egfr_less_than_45", egfr_less_than_45)
+    flag("egfr_between_1_and_45", egfr_between_1_and_45)
+    flag("indicator_k_denominator", egfr_between_1_and_45)
+    flag("indicator_k_numerator", egfr_between_1_and_45 & values["oral_nsaid"])
+
+    for name in [
+        "acei",
+        "loop_diuretic",
+        "acei_recent",
+        "loop_diuretic_recent",
+        "renal_function_test",
+        "electrolytes_test",
+    ]:
+        draw_flag(name)
+    age_75 = (age >= 75) & (age <= 120)
+    acei = values["acei"] & values["acei_recent"]
+    loop_diuretic = values["loop_diuretic"] & values["loop_diuretic_recent"]
+    flag("indicator_ac_denominator", (age_75 & acei) | loop_diuretic)
+    flag(
+        "indicator_ac_numerator",
+        age_75
+        & (loop_diuretic | acei)
+        & (~values["renal_function_test"] | ~values["electrolytes_test"]),
+    )
+
+    for name in [
+        "methotrexate_6_3_months",
+        "methotrexate_3_months",
+        "full_blood_count",
+        "liver_function_test",
+    ]:
+        draw_flag(name)
+    methotrexate = values["methotrexate_6_3_months"] & values["methotrexate_3_months"]
+    flag("indicator_me_denominator", methotrexate)
+    flag("indicator_me_no_fbc_numerator", methotrexate & ~values["full_blood_count"])
+    flag("indicator_me_no_lft_numerator", methotrexate & ~values["liver_function_test"])
+
+    for name in ["lithium_6_3_months", "lithium_3_months", "lithium_level_3_months"]:
+        draw_flag(name)
+    lithium = values["lithium_6_3_months"] & values["lithium_3_months"]
+    flag("indicator_li_denominator", lithium)
+    flag("indicator_li_numerator", lithium & ~values["lithium_level_3_months"])
+
+    for name in [
+        "amiodarone_12_6_months",
+        "amiodarone_6_months",
+        "thyroid_function_test",
+    ]:
+        draw_flag(name)
+    amiodarone = values["amiodarone_12_6_months"] & values["amiodarone_6_months"]
+    flag("indicator_am_denominator", amiodarone)
+    flag("indicator_am_numerator", amiodarone & ~values["thyroid_function_test"])
+
+    def any_of(*names):
+        return np.logical_or.reduce([values[name] for name in names])
+
+    flag(
+        "gi_bleed_composite_denominator",
+        any_of(*[f"indicator_{i}_denominator" for i in ["a", "b", "c", "d", "e", "f"]]),
+    )
+    flag(
+        "other_prescribing_composite_denominator",
+        any_of(*[f"indicator_{i}_denominator" for i in ["g", "i", "k"]]),
+    )
+    flag(
+        "monitoring_composite_denominator",
+        any_of(*[f"indicator_{i}_denominator" for i in ["ac", "me", "li", "am"]]),
+    )
+    flag(
+        "all_composite_denominator",
+        any_of(
+            "gi_bleed_composite_denominator",
+            "other_prescribing_composite_denominator",
+            "monitoring_composite_denominator",
+        ),
+    )
+
+    return pa.RecordBatch.from_pydict(columns)
+
+
+def write_batches(path, batches):
+    """Writes batches to a feather file at path, one at a time, so only one of them
+    is held in memory. The file is written atomically, as `write_feather` does."""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    options = pa.ipc.IpcWriteOptions(compression="lz4")
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pa.ipc.new_file(str(tmp_path), batch.schema, options=options)
+            writer.write_batch(batch)
+        writer.close()
+        writer = None
+        os.replace(tmp_path, path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def iter_chunks(num_patients, chunk_size):
+    """Yields the patient ids of each chunk, from 1 to num_patients."""
+    for start in range(1, num_patients + 1, chunk_size):
+        yield np.arange(start, min(start + chunk_size, num_patients + 1))
+
+
+def generate_cohort(
+    index_dates,
+    num_patients,
+    output_dir,
+    num_practices=None,
+    chunk_size=1_000_000,
+    seed=0,
+):
+    """Writes an input_YYYY-MM-DD.feather file for each of index_dates, with
+    num_patients patients and the columns of study_definition.py, and
+    input_ethnicity.feather with the ethnicity of each patient.
+
+    Each file is generated and written chunk_size patients at a time. The patients
+    are the same each month, but their variables are drawn again for every month.
+    The files are the same for the same seed and chunk_size.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if num_practices is None:
+        num_practices = max(1, num_patients // 8000)
+
+    seeds = np.random.SeedSequence(seed).spawn(len(index_dates) + 1)
+    rng = np.random.default_rng(seeds[0])
+    # practices have a range of list sizes
+    practice_sizes = rng.lognormal(0, 0.5, size=num_practices)
+
+    for index_date, month_seed in zip(index_dates, seeds[1:]):
+        index_date = pd.Timestamp(index_date).strftime("%Y-%m-%d")
+        month_rng = np.random.default_rng(month_seed)
+        write_batches(
+            output_dir / f"input_{index_date}.feather",
+            (
+                generate_chunk(month_rng, index_date, patient_ids, practice_sizes)
+                for patient_ids in iter_chunks(num_patients, chunk_size)
+            ),
+        )
+
+    write_batches(
+        output_dir / "input_ethnicity.feather",
+        (
+            pa.RecordBatch.from_pydict(
+                {
+                    "patient_id": pa.array(patient_ids, type=pa.int64()),
+                    "ethnicity": choose_categories(
+                        rng, CATEGORY_RATIOS["ethnicity"], len(patient_ids)
+                    ),
+                }
+            )
+            for patient_ids in iter_chunks(num_patients, chunk_size)
+        ),
+    )
+
+
+def main():
+    args = parse_args()
+    index_dates = pd.date_range(args.start_date, periods=args.months, freq="MS")
+    generate_cohort(
+        index_dates,
+        args.patients,
+        args.output_dir,
+        num_practices=args.practices,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
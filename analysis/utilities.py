@@ -1,17 +1,40 @@
 import re
 import json
 import os
+import hashlib
+import inspect
 from pathlib import Path
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-import seaborn as sns
+import pyarrow as pa
+from pyarrow import feather
 from collections import Counter
-from datetime import timedelta as td
+from pandas.api.extensions import take
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
+from concurrent.futures import ProcessPoolExecutor
+import importlib
+
+# matplotlib and seaborn take longer to import than everything else here, so they
+# are only imported by the functions that plot, which most stages never call
+PLOTTING_MODULES = {
+    "plt": "matplotlib.pyplot",
+    "matplotlib": "matplotlib",
+    "sns": "seaborn",
+}
+
+
+def __getattr__(name):
+    # keeps utilities.plt etc. available to callers
+    if name in PLOTTING_MODULES:
+        return importlib.import_module(PLOTTING_MODULES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 backend = os.getenv("OPENSAFELY_BACKEND", "expectations")
 
+# number of processes used for per-month stages, defaults to the number of cpus
+MAX_WORKERS = os.getenv("PINCER_MAX_WORKERS")
+
 
 BASE_DIR = Path(__file__).parents[1]
 OUTPUT_DIR = BASE_DIR / "output"
@@ -94,15 +117,687 @@ def validate_directory(dirpath):
         raise ValueError(f"Not a directory")
 
 
-def join_ethnicity_region(directory: str) -> None:
-    """Finds 'input_ethnicity.feather' in directory and combines with each input file."""
+# monthly files tracked by the input manifest, keyed by the kind of file
+_DATE_PATTERN = r"(20\d\d-(?:0[1-9]|1[012])-(?:0[1-9]|[12][0-9]|3[01]))"
+MONTHLY_FILE_PATTERNS = {
+    "input": re.compile(rf"^input_{_DATE_PATTERN}\.feather$"),
+    "input_joined": re.compile(rf"^input_joined_{_DATE_PATTERN}\.feather$"),
+    "input_filtered": re.compile(rf"^input_filtered_{_DATE_PATTERN}\.feather$"),
+    "indicator_e_f": re.compile(rf"^indicator_e_f_{_DATE_PATTERN}\.feather$"),
+}
+MANIFEST_FILE = ".input_manifest.json"
+FIGURE_CACHE_FILE = ".figure_cache.json"
+INCREMENTAL_STATE_FILE = ".incremental_state.json"
+
+
+def read_feather_metadata(path):
+    """Reads the row count and schema of a feather file without loading it.
+
+    Only the first column is decompressed to count the rows.
+
+    Returns:
+        A tuple of the number of rows and a dict mapping column name to arrow type.
+    """
+    with pa.memory_map(str(path)) as source:
+        schema = pa.ipc.open_file(source).schema
+    num_rows = 0
+    if schema.names:
+        num_rows = feather.read_table(
+            path, columns=schema.names[:1], memory_map=True
+        ).num_rows
+    return num_rows, {field.name: str(field.type) for field in schema}
+
+
+class MonthlyFile:
+    """A monthly feather file recorded in an `InputManifest`."""
+
+    def __init__(self, path, kind, date, size, mtime, num_rows, schema):
+        self.path = Path(path)
+        self.kind = kind
+        self.date = date
+        self.size = size
+        self.mtime = mtime
+        self.num_rows = num_rows
+        self.schema = schema
+
+    @property
+    def columns(self):
+        return list(self.schema)
+
+    def missing_columns(self, columns):
+        """Returns the columns that are not in this file, in the order given."""
+        return [column for column in columns if column not in self.schema]
+
+    def read(self, columns=None):
+        """Reads the file into a dataframe, loading only `columns` if given.
+
+        Raises:
+            ValueError: if any of `columns` are not in the file.
+        """
+        if columns is None:
+            return pd.read_feather(self.path)
+
+        missing = self.missing_columns(columns)
+        if missing:
+            raise ValueError(
+                f"{self.path.name} is missing columns: {', '.join(missing)}"
+            )
+        return pd.read_feather(self.path, columns=list(columns))
+
+    def estimated_memory(self, overhead=3):
+        """Rough estimate of the peak bytes needed to process this file in pandas,
+        assuming 8 bytes per value and `overhead` copies of the frame."""
+        return self.num_rows * len(self.schema) * 8 * overhead
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "date": self.date,
+            "size": self.size,
+            "mtime": self.mtime,
+            "num_rows": self.num_rows,
+            "schema": self.schema,
+        }
+
+
+class InputManifest:
+    """Scans a directory once for the monthly `input_*.feather`,
+    `input_joined_*.feather`, `input_filtered_*.feather` and
+    `indicator_e_f_*.feather` files.
+
+    Row counts and schemas are read from `MANIFEST_FILE`, if there is one, and only
+    re-read for files whose size or modification time has changed since it was
+    written. The job-runner only keeps an action's declared outputs, so a manifest
+    written by an action is never read again; it's only written when save_cache is
+    set, for local runs where output/ is kept between runs (see
+    analysis/incremental.py).
+
+    Args:
+        directory: Directory containing the monthly files.
+        save_cache: Whether to write `MANIFEST_FILE` when it's out of date.
+    """
+
+    def __init__(self, directory, save_cache=False):
+        self.directory = Path(directory)
+        self.save_cache = save_cache
+        validate_directory(self.directory)
+        self.refresh()
+
+    def refresh(self):
+        """Rescans the directory, reusing cached metadata for unchanged files."""
+        cached = self._load_cache()
+        files = {kind: {} for kind in MONTHLY_FILE_PATTERNS}
+        changed = False
+
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                for kind, pattern in MONTHLY_FILE_PATTERNS.items():
+                    match = pattern.match(entry.name)
+                    if match:
+                        break
+                else:
+                    continue
+
+                stat = entry.stat()
+                record = cached.get(entry.name)
+                if (
+                    record is None
+                    or record["size"] != stat.st_size
+                    or record["mtime"] != stat.st_mtime_ns
+                ):
+                    num_rows, schema = read_feather_metadata(entry.path)
+                    record = {
+                        "kind": kind,
+                        "date": match.group(1),
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime_ns,
+                        "num_rows": num_rows,
+                        "schema": schema,
+                    }
+                    changed = True
+
+                files[kind][record["date"]] = MonthlyFile(entry.path, **record)
+
+        self.files = {kind: dict(sorted(f.items())) for kind, f in files.items()}
+
+        if self.save_cache and (
+            changed or len(cached) != sum(len(f) for f in files.values())
+        ):
+            self._save_cache()
+
+    def _load_cache(self):
+        try:
+            with open(self.directory / MANIFEST_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        records = {
+            monthly_file.path.name: monthly_file.to_dict()
+            for files in self.files.values()
+            for monthly_file in files.values()
+        }
+        tmp_path = self.directory / f"{MANIFEST_FILE}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(records, f)
+            os.replace(tmp_path, self.directory / MANIFEST_FILE)
+        except OSError:
+            # the cache is only an optimisation
+            pass
+
+    def dates(self, kind="input"):
+        """Returns the sorted dates for which a file of the given kind exists."""
+        return list(self.files[kind])
+
+    def get(self, kind, date):
+        """Returns the `MonthlyFile` of the given kind for date, or None."""
+        return self.files[kind].get(date)
+
+    def iter_files(self, kind="input"):
+        """Yields (date, MonthlyFile) pairs of the given kind in date order."""
+        yield from self.files[kind].items()
+
+    def require_columns(self, kind, columns, dates=None):
+        """Checks every file of the given kind (or only those for `dates`) has
+        `columns`, so that a stage fails before processing any month rather than
+        part way through.
+
+        Raises:
+            ValueError: listing the missing columns of each file.
+        """
+        errors = []
+        for date, monthly_file in self.files[kind].items():
+            if dates is not None and date not in dates:
+                continue
+            missing = monthly_file.missing_columns(columns)
+            if missing:
+                errors.append(f"{monthly_file.path.name}: {', '.join(missing)}")
+        if errors:
+            raise ValueError("Missing columns in " + "; ".join(errors))
+
+
+_manifests = {}
+
+
+def get_manifest(directory=None, refresh=False):
+    """Returns the `InputManifest` for directory (defaults to `OUTPUT_DIR`),
+    scanning it only on first use within a process or when refresh is set."""
+    dirpath = Path(OUTPUT_DIR if directory is None else directory).resolve()
+    if refresh or dirpath not in _manifests:
+        _manifests[dirpath] = InputManifest(dirpath)
+    return _manifests[dirpath]
+
+
+def get_definition_hash(paths):
+    """Returns a hash of the contents of paths, which identifies the version of the
+    code and files that a stage's outputs are derived from. Directories are hashed
+    with all of the files inside them."""
+    definition_hash = hashlib.sha256()
+    for path in sorted(Path(path) for path in paths):
+        if path.is_dir():
+            files = sorted(p for p in path.rglob("*") if p.is_file())
+        else:
+            files = [path]
+        for file in files:
+            definition_hash.update(file.name.encode())
+            definition_hash.update(file.read_bytes())
+    return definition_hash.hexdigest()
+
+
+def get_file_identity(path):
+    """Returns the size and modification time of path, which change whenever the
+    file is written."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class IncrementalStage:
+    """Records the months that a per-month stage has processed, so that a local
+    incremental run (see analysis/incremental.py) only processes the months that are
+    new or have changed.
+
+    A month is up to date when its output exists and was written from the same input
+    files (by size and modification time) and the same definition. Records are kept
+    in `INCREMENTAL_STATE_FILE`, under the name of the stage.
+
+    Args:
+        name: The name of the stage.
+        output: The path of a month's output relative to directory, with a `{date}`
+            field, e.g. "input_filtered_{date}.feather".
+        definition: Identifies the version of the stage, e.g. from
+            `get_definition_hash`.
+        directory: The directory of the outputs (defaults to `OUTPUT_DIR`).
+    """
+
+    def __init__(self, name, output, definition, directory=None):
+        self.name = name
+        self.output = output
+        self.definition = definition
+        self.directory = Path(OUTPUT_DIR if directory is None else directory)
+        self.records = self._load_state().get(name, {})
+
+    def _load_state(self):
+        try:
+            with open(self.directory / INCREMENTAL_STATE_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def output_path(self, date):
+        return self.directory / self.output.format(date=date)
+
+    def is_current(self, date, inputs):
+        """Returns True if the output for date exists and was written from inputs
+        with this definition."""
+        record = self.records.get(date)
+        return (
+            record is not None
+            and record["definition"] == self.definition
+            and record["inputs"] == [get_file_identity(path) for path in inputs]
+            and self.output_path(date).exists()
+        )
+
+    def record(self, date, inputs):
+        """Records that the output for date has been written from inputs."""
+        self.records[date] = {
+            "definition": self.definition,
+            "inputs": [get_file_identity(path) for path in inputs],
+        }
+
+    def save(self):
+        # other stages' records are re-read, in case they ran since this one started
+        state = self._load_state()
+        state[self.name] = self.records
+        tmp_path = self.directory / f"{INCREMENTAL_STATE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.directory / INCREMENTAL_STATE_FILE)
+
+    def update(self, monthly_files, run):
+        """Calls run with the (date, MonthlyFile) pairs of monthly_files whose outputs
+        aren't up to date, e.g. to process them with `run_monthly`, and records them.
+
+        Returns:
+            The dates of the months that were processed.
+        """
+        stale = [
+            (date, monthly_file)
+            for date, monthly_file in monthly_files
+            if not self.is_current(date, [monthly_file.path])
+        ]
+        if stale:
+            run(stale)
+        for date, monthly_file in stale:
+            self.record(date, [monthly_file.path])
+        self.save()
+        return [date for date, _ in stale]
+
+
+def check_extracted_inputs(monthly_files, definition, directory=None):
+    """Records the definition that each monthly input file was extracted with, and
+    raises a ValueError if a file was extracted with a different definition.
+
+    When running incrementally the cohort is extracted with `--skip-existing`, so
+    that months that already have an input file aren't extracted again, and those
+    files must be deleted when the study definition changes. A file that has been
+    written since it was recorded is assumed to have been extracted with the current
+    definition.
+    """
+    stage = IncrementalStage("extract", "input_{date}.feather", definition, directory)
+    stale = []
+    for date, monthly_file in monthly_files:
+        record = stage.records.get(date)
+        if record is not None and record["inputs"] == [
+            get_file_identity(monthly_file.path)
+        ]:
+            if record["definition"] != definition:
+                stale.append(monthly_file.path.name)
+        else:
+            stage.record(date, [monthly_file.path])
+    stage.save()
+
+    if stale:
+        raise ValueError(
+            "Extracted with an earlier study definition, delete to extract again: "
+            + ", ".join(stale)
+        )
+
+
+def get_available_memory():
+    """Returns the bytes of memory available to this process, taking any cgroup
+    (container) limit into account. Returns None if it can't be determined."""
+    limits = []
+    try:
+        limits.append(os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE"))
+    except (ValueError, OSError, AttributeError):
+        pass
+
+    for limit_file, usage_file in [
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        (
+            "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+            "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+        ),
+    ]:
+        try:
+            with open(limit_file) as f:
+                limit = f.read().strip()
+            with open(usage_file) as f:
+                usage = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        if limit.isdigit():
+            limits.append(int(limit) - usage)
+        break
+
+    return min(limits) if limits else None
+
+
+def get_worker_count(monthly_files, max_workers=None):
+    """Returns how many months can be processed concurrently.
+
+    This is the smallest of max_workers (defaults to `MAX_WORKERS` or the number of
+    cpus), the number of months and the number of the largest month that fit into
+    the available memory.
+    """
+    if max_workers is None:
+        max_workers = int(MAX_WORKERS) if MAX_WORKERS else os.cpu_count() or 1
+
+    workers = min(max_workers, len(monthly_files))
+
+    available_memory = get_available_memory()
+    largest_month = max(
+        (monthly_file.estimated_memory() for _, monthly_file in monthly_files),
+        default=0,
+    )
+    if available_memory is not None and largest_month > 0:
+        workers = min(workers, available_memory // largest_month)
+
+    return max(1, workers)
+
+
+def run_monthly(func, monthly_files, max_workers=None, initializer=None, initargs=()):
+    """Runs func(date, monthly_file) for each month, in parallel where possible.
+
+    Months are independent, so they are spread over a process pool whose size is
+    capped by `get_worker_count`. With a single worker everything runs in this
+    process. func (and initializer) must be defined at module level.
+
+    Args:
+        func: Function to call for each month.
+        monthly_files: Iterable of (date, MonthlyFile) pairs, e.g. from
+            `InputManifest.iter_files`.
+        max_workers: Maximum number of processes to use.
+        initializer: Function called once in each worker before any months are
+            processed, e.g. to set up lookups shared by all months.
+        initargs: Arguments passed to initializer.
+    Returns:
+        A list of the results of func, in the same order as monthly_files.
+    """
+    monthly_files = list(monthly_files)
+    workers = get_worker_count(monthly_files, max_workers)
+
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(date, monthly_file) for date, monthly_file in monthly_files]
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as executor:
+        futures = [
+            executor.submit(func, date, monthly_file)
+            for date, monthly_file in monthly_files
+        ]
+        return [future.result() for future in futures]
+
+
+def _use_agg_backend():
+    import matplotlib.pyplot as plt
+
+    plt.switch_backend("Agg")
+
+
+def _render_figure(func, args, kwargs):
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    figures = set(plt.get_fignums())
+    with matplotlib.rc_context():
+        result = func(*args, **kwargs)
+    for figure in set(plt.get_fignums()) - figures:
+        plt.close(figure)
+    return result
+
+
+def _update_figure_hash(figure_hash, value):
+    if isinstance(value, pd.DataFrame):
+        # charts don't depend on the order of rows, which stripped measures shuffle
+        rows = pd.util.hash_pandas_object(value, index=False).to_numpy()
+        figure_hash.update(repr(value.dtypes.to_dict()).encode())
+        figure_hash.update(np.sort(rows).tobytes())
+    elif isinstance(value, (list, tuple)):
+        figure_hash.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update_figure_hash(figure_hash, item)
+    elif isinstance(value, dict):
+        figure_hash.update(f"dict{len(value)}".encode())
+        for key in sorted(value):
+            _update_figure_hash(figure_hash, key)
+            _update_figure_hash(figure_hash, value[key])
+    else:
+        figure_hash.update(repr(value).encode())
+
+
+def _get_figure_style():
+    """Returns the chart styles and the source of the shared drawing code that the
+    figures are drawn with."""
+    return (
+        [
+            inspect.getsource(shared)
+            for shared in [
+                compute_percentiles,
+                plot_percentiles,
+                deciles_chart_subplots,
+            ]
+        ],
+        DECILES.tolist(),
+        OUTER_PERCENTILES.tolist(),
+        PERCENTILE_LINESTYLES,
+    )
+
+
+def get_figure_key(func, args, kwargs):
+    """Returns a hash of everything that determines the figure drawn by
+    func(*args, **kwargs): the data, the chart parameters, the source of func, the
+    shared chart styles (see `_get_figure_style`) and the matplotlib version. Other
+    changes to func's module or this one don't change the key."""
+    import matplotlib
+
+    figure_hash = hashlib.sha256()
+    figure_hash.update(inspect.getsource(func).encode())
+    figure_hash.update(matplotlib.__version__.encode())
+    _update_figure_hash(
+        figure_hash, (func.__qualname__, args, kwargs, _get_figure_style())
+    )
+    return figure_hash.hexdigest()
+
+
+class FigureCache:
+    """Records the key (see `get_figure_key`) of the job that drew each figure in a
+    directory, in `FIGURE_CACHE_FILE`, so that figures whose key hasn't changed don't
+    need to be drawn again.
+
+    Args:
+        directory: Directory containing the figures.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        try:
+            with open(self.directory / FIGURE_CACHE_FILE) as f:
+                self.keys = json.load(f)
+        except (OSError, ValueError):
+            self.keys = {}
+
+    def is_current(self, filename, key):
+        """Returns True if filename exists and was drawn by a job with key."""
+        filename = Path(filename)
+        return self.keys.get(filename.name) == key and filename.exists()
+
+    def add(self, filename, key):
+        self.keys[Path(filename).name] = key
+
+    def save(self):
+        tmp_path = self.directory / f"{FIGURE_CACHE_FILE}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.keys, f)
+            os.replace(tmp_path, self.directory / FIGURE_CACHE_FILE)
+        except OSError:
+            # the cache is only an optimisation
+            pass
+
+
+def run_figures(jobs, max_workers=None, use_cache=True):
+    """Runs each figure job, in parallel where possible.
+
+    A job is a (func, args, kwargs) tuple, where func draws and saves one figure.
+    Figures are independent, so they are spread over a process pool (of at most
+    max_workers, which defaults to `MAX_WORKERS` or the number of cpus) that draws
+    with the Agg backend. Each job runs with the matplotlib settings it started with
+    and closes the figures it opened, so a figure is the same whichever process draws
+    it and whatever was drawn before it. func must be defined at module level.
+
+    If use_cache is True, a job whose func takes a `filename` argument is skipped
+    when that file was drawn before from the same data and parameters (see
+    `FigureCache`).
+
+    Returns:
+        A list of the results of func, in the same order as jobs, with None for the
+        jobs that were skipped.
+    """
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+    caches = {}
+    pending = []
+    for index, (func, args, kwargs) in enumerate(jobs):
+        filename = None
+        if use_cache:
+            arguments = inspect.signature(func).bind(*args, **kwargs).arguments
+            filename = arguments.get("filename")
+        if filename is None:
+            pending.append((index, None, None))
+            continue
+
+        key = get_figure_key(func, args, kwargs)
+        directory = Path(filename).parent
+        if directory not in caches:
+            caches[directory] = FigureCache(directory)
+        if not caches[directory].is_current(filename, key):
+            pending.append((index, filename, key))
+
+    if max_workers is None:
+        max_workers = int(MAX_WORKERS) if MAX_WORKERS else os.cpu_count() or 1
+    workers = max(1, min(max_workers, len(pending)))
+
+    try:
+        if workers == 1:
+            for index, filename, key in pending:
+                results[index] = _render_figure(*jobs[index])
+                if filename is not None:
+                    caches[Path(filename).parent].add(filename, key)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_use_agg_backend
+            ) as executor:
+                futures = [
+                    executor.submit(_render_figure, *jobs[index])
+                    for index, _, _ in pending
+                ]
+                for future, (index, filename, key) in zip(futures, pending):
+                    results[index] = future.result()
+                    if filename is not None:
+                        caches[Path(filename).parent].add(filename, key)
+    finally:
+        for cache in caches.values():
+            cache.save()
+
+    return results
+
+
+def write_feather(df, path):
+    """Writes df to path atomically, so an interrupted or failed run never leaves
+    a partially written file that later stages would pick up."""
+    path = Path(path)
+    # the leading "." stops the manifest matching the temporary file
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        df.to_feather(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class SortedLookup:
+    """Maps keys to values in the same way as `Series.map(dict(zip(keys, values)))`
+    but without building a dict.
+
+    The keys are sorted once and looked up with a binary search, so a lookup can be
+    built from millions of keys and reused for every month. Where a key is repeated
+    the last value is used, as it would be by a dict, and keys that aren't found map
+    to NaN.
+    """
+
+    def __init__(self, keys, values):
+        lookup = (
+            pd.DataFrame({"key": np.asarray(keys), "value": np.asarray(values)})
+            .drop_duplicates(subset="key", keep="last")
+            .sort_values("key")
+        )
+        self.keys = lookup["key"].to_numpy()
+        self.values = lookup["value"].to_numpy()
+
+    def get_indexer(self, keys):
+        """Returns the position in `values` of each of keys, or -1 if not found."""
+        keys = np.asarray(keys)
+        if len(self.keys) == 0:
+            return np.full(len(keys), -1)
+        positions = np.searchsorted(self.keys, keys)
+        positions[positions == len(self.keys)] = 0
+        return np.where(self.keys[positions] == keys, positions, -1)
+
+    def map(self, series):
+        """Returns a Series of the values for the keys in series."""
+        if is_numeric_dtype(series):
+            indexer = self.get_indexer(series.to_numpy())
+        else:
+            # look up each distinct key (such as an MSOA code) once
+            codes, uniques = pd.factorize(series)
+            unique_indexer = np.append(self.get_indexer(np.asarray(uniques)), -1)
+            indexer = unique_indexer[codes]
+        return pd.Series(
+            take(self.values, indexer, allow_fill=True),
+            index=series.index,
+            name=series.name,
+        )
+
+
+def join_ethnicity_region(directory: str, monthly_files=None) -> None:
+    """Finds 'input_ethnicity.feather' in directory and combines with each input file
+    (or each of monthly_files), writing the result to 'input_joined_XX-XX-XX.feather'.
+    """
 
     dirpath = Path(directory)
     validate_directory(dirpath)
-    filelist = dirpath.iterdir()
 
     # get ethnicity input file
-    ethnicity_df = pd.read_feather(dirpath / "input_ethnicity.feather")
+    ethnicity_df = pd.read_feather(
+        dirpath / "input_ethnicity.feather", columns=["patient_id", "ethnicity"]
+    )
 
     # ONS MSOA to region map from here:
     # https://geoportal.statistics.gov.uk/datasets/fe6c55f0924b4734adf1cf7104a0173e_0/data
@@ -112,16 +807,41 @@ def join_ethnicity_region(directory: str) -> None:
         dtype={"MSOA11CD": "category", "RGN11NM": "category"},
     )
 
-    ethnicity_dict = dict(zip(ethnicity_df["patient_id"], ethnicity_df["ethnicity"]))
-    msoa_dict = dict(zip(msoa_to_region["MSOA11CD"], msoa_to_region["RGN11NM"]))
+    ethnicity_lookup = SortedLookup(
+        ethnicity_df["patient_id"], ethnicity_df["ethnicity"]
+    )
+    region_lookup = SortedLookup(
+        msoa_to_region["MSOA11CD"].astype(str), msoa_to_region["RGN11NM"].astype(str)
+    )
+
+    if monthly_files is None:
+        monthly_files = InputManifest(dirpath).iter_files("input")
+
+    run_monthly(
+        _join_ethnicity_region_month,
+        monthly_files,
+        initializer=_set_join_lookups,
+        initargs=(ethnicity_lookup, region_lookup),
+    )
+
+
+# lookups shared by the join_ethnicity_region workers
+_join_lookups = {}
+
+
+def _set_join_lookups(ethnicity_lookup, region_lookup):
+    _join_lookups["ethnicity"] = ethnicity_lookup
+    _join_lookups["region"] = region_lookup
 
-    for file in filelist:
-        if match_input_files(file.name):
-            df = pd.read_feather(dirpath / file.name)
 
-            df["ethnicity"] = df["patient_id"].map(ethnicity_dict)
-            df["region"] = df["msoa"].map(msoa_dict)
-            df.to_feather(dirpath / file.name)
+def _join_ethnicity_region_month(date, input_file):
+    df = input_file.read()
+
+    df["ethnicity"] = _join_lookups["ethnicity"].map(df["patient_id"])
+    df["region"] = _join_lookups["region"].map(df["msoa"])
+
+    # the cohortextractor output is left untouched so that the join can be rerun
+    write_feather(df, input_file.path.with_name(f"input_joined_{date}.feather"))
 
 
 def count_comparator_value_pairs(directory: str) -> None:
@@ -207,6 +927,58 @@ def calculate_rate(df, value_col: str, population_col: str, rate_per: int):
     return rate
 
 
+def get_suppression(values, groups, n):
+    """Finds the values to redact so that the redacted values in each group total more
+    than n.
+
+    Within each group every value of n or less is redacted, then the smallest of the
+    remaining values (the first of any ties) until the redacted total is more than n.
+    Groups whose values of n or less total 0 are left alone. The values are sorted once
+    and the cut-off found with a cumulative sum, rather than repeatedly taking the
+    minimum.
+
+    Args:
+        values: float array of counts, with NaN for missing values.
+        groups: int array of the group of each value, numbered from 0.
+        n: threshold for low number suppression
+
+    Returns:
+        A tuple of a bool array of the values to redact, a bool array of the groups
+        with redacted values and the redacted total of each group.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    num_groups = groups.max() + 1 if len(groups) else 0
+
+    small = values <= n
+    small_totals = np.bincount(
+        groups, weights=np.where(small, values, 0), minlength=num_groups
+    )
+    redacted_groups = small_totals != 0
+    redact = small & redacted_groups[groups]
+
+    # the other values of the redacted groups sorted by group, value and position
+    remaining = np.flatnonzero(~small & ~np.isnan(values) & redacted_groups[groups])
+    remaining = remaining[np.lexsort((remaining, values[remaining], groups[remaining]))]
+    remaining_groups = groups[remaining]
+    remaining_values = values[remaining]
+
+    # the redacted total before each value is considered
+    totals_before = np.cumsum(remaining_values) - remaining_values
+    is_first = np.ones(len(remaining), dtype=bool)
+    is_first[1:] = remaining_groups[1:] != remaining_groups[:-1]
+    totals_before -= totals_before[is_first][np.cumsum(is_first) - 1]
+    totals_before += small_totals[remaining_groups]
+
+    also_redact = totals_before <= n
+    redact[remaining[also_redact]] = True
+    totals = small_totals + np.bincount(
+        remaining_groups[also_redact],
+        weights=remaining_values[also_redact],
+        minlength=num_groups,
+    )
+    return redact, redacted_groups, totals
+
+
 def redact_small_numbers(df, n, numerator, denominator, rate_column, date_column):
     """
     Takes counts df as input and suppresses low numbers.  Sequentially redacts
@@ -219,38 +991,23 @@ def redact_small_numbers(df, n, numerator, denominator, rate_column, date_column
     denominator: denominator column to be redacted
     """
 
-    def suppress_column(column):
-        suppressed_count = column[column <= n].sum()
-
-        # if 0 dont need to suppress anything
-        if suppressed_count == 0:
-            pass
-
-        else:
-            column[column <= n] = np.nan
-
-            while suppressed_count <= n:
-                suppressed_count += column.min()
-
-                column[column.idxmin()] = np.nan
-        return column
-
-    df_list = []
+    # group the rows by date, in the order the dates first appear
+    dates = pd.factorize(df[date_column])[0]
+    rows = np.flatnonzero(dates >= 0)
+    rows = rows[np.argsort(dates[rows], kind="stable")]
+    df = df.take(rows)
+    dates = dates[rows]
 
-    dates = df[date_column].unique()
-
-    for d in dates:
-        df_subset = df.loc[df[date_column] == d, :]
-
-        for column in [numerator, denominator]:
-            df_subset[column] = suppress_column(df_subset[column])
+    for column in [numerator, denominator]:
+        redact, redacted_dates, _ = get_suppression(
+            df[column].to_numpy(dtype=np.float64), dates, n
+        )
+        if redacted_dates.any():
+            df.loc[redact, column] = np.nan
 
-        df_subset.loc[
-            (df_subset[numerator].isna()) | (df_subset[denominator].isna()), rate_column
-        ] = np.nan
-        df_list.append(df_subset)
+    df.loc[(df[numerator].isna()) | (df[denominator].isna()), rate_column] = np.nan
 
-    return pd.concat(df_list, axis=0)
+    return df
 
 
 def plot_measures(
@@ -272,6 +1029,8 @@ def plot_measures(
         as_bar: Boolean indicating if bar chart should be plotted instead of line chart. Only valid if no categories.
         category: Name of column indicating different categories
     """
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(15, 8))
     if category:
         for unique_category in sorted(df[category].unique()):
@@ -321,69 +1080,30 @@ def deciles_chart_ebm(
     ax=None,
 ):
     """period_column must be dates / datetimes"""
+    import matplotlib
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     sns.set_style("whitegrid", {"grid.color": ".9"})
     if not ax:
         fig, ax = plt.subplots(1, 1, figsize=(15, 8))
 
-    df = compute_deciles(df, period_column, count_column, column)
-    linestyles = {
-        "decile": {
-            "line": "b--",
-            "linewidth": 1,
-            "label": "decile",
-        },
-        "median": {
-            "line": "b-",
-            "linewidth": 1.5,
-            "label": "median",
-        },
-        "percentile": {
-            "line": "b:",
-            "linewidth": 0.8,
-            "label": "1st-9th, 91st-99th percentile",
-        },
-    }
-    label_seen = []
-    for percentile in range(1, 100):  # plot each decile line
-        data = df[df["percentile"] == percentile]
-        add_label = False
-
-        if percentile == 50:
-            style = linestyles["median"]
-            add_label = True
-        elif show_outer_percentiles and (percentile < 10 or percentile > 90):
-            style = linestyles["percentile"]
-            if "percentile" not in label_seen:
-                label_seen.append("percentile")
-                add_label = True
-        else:
-            style = linestyles["decile"]
-            if "decile" not in label_seen:
-                label_seen.append("decile")
-                add_label = True
-        if add_label:
-            label = style["label"]
-        else:
-            label = "_nolegend_"
-
-        ax.plot(
-            data[period_column],
-            data[column],
-            style["line"],
-            linewidth=style["linewidth"],
-            label=label,
-        )
+    quantiles = DECILES
+    if show_outer_percentiles:
+        quantiles = np.sort(np.concatenate([quantiles, OUTER_PERCENTILES]))
+    deciles = compute_percentiles(df, period_column, column, quantiles)
+    plot_percentiles(ax, deciles, show_outer_percentiles)
     ax.set_ylabel(ylabel, size=15, alpha=0.6)
     if title:
         ax.set_title(title, size=14, wrap=True)
     # set ymax across all subplots as largest value across dataset
 
     ax.set_ylim(
-        [0, 100 if df[column].isnull().values.all() else df[column].max() * 1.05]
+        [0, 100 if deciles.isnull().values.all() else deciles.max().max() * 1.05]
     )
     ax.tick_params(labelsize=12)
     ax.set_xlim(
-        [df[period_column].min(), df[period_column].max()]
+        [deciles.index.min(), deciles.index.max()]
     )  # set x axis range as full date range
 
     plt.setp(ax.xaxis.get_majorticklabels(), rotation=90)
@@ -400,11 +1120,71 @@ def deciles_chart_ebm(
         )  # padding between the axes and legend
         #  specified in font-size units
 
-    plt.xticks(sorted(df[period_column].unique()), rotation=90)
+    plt.xticks(deciles.index, rotation=90)
 
     return plt
 
 
+DECILES = np.arange(0.1, 1, 0.1)
+OUTER_PERCENTILES = np.concatenate(
+    [np.arange(0.01, 0.1, 0.01), np.arange(0.91, 1, 0.01)]
+)
+
+
+def compute_percentiles(measure_table, groupby_col, values_col, quantiles):
+    """Computes quantiles of a column for every group in a single pass.
+
+    The values are sorted once by group and value, and each quantile of each group is
+    then read off the sorted array, interpolating linearly between the two nearest
+    values as `groupby().quantile()` does. Missing values are ignored, and groups with
+    no values get missing quantiles.
+
+    Args:
+        measure_table: A measure table.
+        groupby_col: The name of the column to group by.
+        values_col: The name of the column for which quantiles are computed.
+        quantiles: The quantiles to compute, between 0 and 1.
+    Returns:
+        A data frame with a row for each value of `groupby_col`, in sorted order, and
+        a column for each quantile, labelled by its percentile.
+    """
+    codes, groups = pd.factorize(measure_table[groupby_col], sort=True)
+    values = measure_table[values_col].to_numpy(dtype=np.float64)
+    has_value = (codes >= 0) & ~np.isnan(values)
+    codes = codes[has_value]
+    values = values[has_value]
+    # sorting by value and then stably by group is faster than a lexsort
+    order = np.argsort(values)
+    order = order[np.argsort(codes[order], kind="stable")]
+    values = values[order]
+
+    counts = np.bincount(codes, minlength=len(groups))
+    starts = np.cumsum(counts) - counts
+    quantiles = np.asarray(quantiles, dtype=np.float64)
+
+    positions = quantiles * (counts[:, np.newaxis] - 1).astype(np.float64)
+    fractions = positions % 1
+    lower = starts[:, np.newaxis] + positions.astype(np.int64)
+    is_empty = counts == 0
+    lower[is_empty] = 0
+    upper = np.minimum(lower + 1, max(len(values) - 1, 0))
+
+    if len(values):
+        below = values[lower]
+        result = np.where(
+            fractions == 0, below, below + (values[upper] - below) * fractions
+        )
+    else:
+        result = np.empty(lower.shape)
+    result[is_empty] = np.nan
+
+    return pd.DataFrame(
+        result,
+        index=pd.Index(groups, name=groupby_col),
+        columns=pd.Index([int(q * 100) for q in quantiles], name="percentile"),
+    )
+
+
 def compute_deciles(measure_table, groupby_col, values_col, has_outer_percentiles=True):
     """Computes deciles.
     Args:
@@ -416,29 +1196,102 @@ def compute_deciles(measure_table, groupby_col, values_col, has_outer_percentile
     Returns:
         A data frame with `groupby_col`, `values_col`, and `percentile` columns.
     """
-    quantiles = np.arange(0.1, 1, 0.1)
+    quantiles = DECILES
     if has_outer_percentiles:
-        quantiles = np.concatenate(
-            [quantiles, np.arange(0.01, 0.1, 0.01), np.arange(0.91, 1, 0.01)]
-        )
+        quantiles = np.concatenate([quantiles, OUTER_PERCENTILES])
 
-    percentiles = (
-        measure_table.groupby(groupby_col)[values_col]
-        .quantile(pd.Series(quantiles))
-        .reset_index()
+    percentiles = compute_percentiles(measure_table, groupby_col, values_col, quantiles)
+    num_groups, num_quantiles = percentiles.shape
+
+    return pd.DataFrame(
+        {
+            groupby_col: np.repeat(percentiles.index.to_numpy(), num_quantiles),
+            values_col: percentiles.to_numpy().ravel(),
+            "percentile": np.tile(percentiles.columns.to_numpy(), num_groups),
+        }
     )
-    percentiles["percentile"] = percentiles["level_1"].apply(lambda x: int(x * 100))
-    percentiles = percentiles.drop(columns=["level_1"])
 
-    return percentiles
 
+PERCENTILE_LINESTYLES = {
+    "decile": {
+        "color": "b",
+        "linestyle": "--",
+        "linewidth": 1,
+        "label": "Decile",
+    },
+    "median": {
+        "color": "b",
+        "linestyle": "-",
+        "linewidth": 1.5,
+        "label": "Median",
+    },
+    "percentile": {
+        "color": "b",
+        "linestyle": ":",
+        "linewidth": 0.8,
+        "label": "1st-9th, 91st-99th percentile",
+    },
+}
+
+
+def plot_percentiles(
+    ax, percentiles, show_outer_percentiles=False, linestyles=PERCENTILE_LINESTYLES
+):
+    """Draws a line for each column of a period x percentile frame.
+
+    The lines that share a style are drawn as a single LineCollection, rather than one
+    line per percentile. Each style appears once in the legend, in the order the styles
+    first appear.
+
+    Args:
+        ax: The axes to draw on.
+        percentiles: A frame from `compute_percentiles`, indexed by date.
+        show_outer_percentiles: Whether to give the percentiles below the first and
+            above the last decile their own style.
+        linestyles: The "decile", "median" and "percentile" styles.
+    """
+    import matplotlib
+    from matplotlib.collections import LineCollection
 
-def get_practice_deciles(measure_table, value_column):
-    measure_table["percentile"] = measure_table.groupby(["date"])[
-        value_column
-    ].transform(lambda x: pd.cut(x, 100, labels=range(1, 101)))
+    ax.xaxis.update_units(percentiles.index)
+    x = ax.xaxis.convert_units(percentiles.index)
 
-    return measure_table
+    lines = {}
+    for percentile in percentiles.columns:
+        if percentile == 50:
+            style = "median"
+        elif show_outer_percentiles and (percentile < 10 or percentile > 90):
+            style = "percentile"
+        else:
+            style = "decile"
+        lines.setdefault(style, []).append(percentile)
+
+    for style, columns in lines.items():
+        style = linestyles[style]
+        y = percentiles[columns].to_numpy(dtype=np.float64).T
+        segments = np.stack([np.broadcast_to(x, y.shape), y], axis=-1)
+        # lines have different caps and joins to collections by default
+        kind = "solid" if style["linestyle"] == "-" else "dash"
+        ax.add_collection(
+            LineCollection(
+                segments,
+                colors=style["color"],
+                linestyles=style["linestyle"],
+                linewidths=style["linewidth"],
+                capstyle=matplotlib.rcParams[f"lines.{kind}_capstyle"],
+                joinstyle=matplotlib.rcParams[f"lines.{kind}_joinstyle"],
+            )
+        )
+        # an empty line stands in for the collection in the legend, so that the
+        # legend looks the same as when each percentile was drawn as its own line
+        ax.plot(
+            [],
+            [],
+            color=style["color"],
+            linestyle=style["linestyle"],
+            linewidth=style["linewidth"],
+            label=style["label"],
+        )
 
 
 def deciles_chart(
@@ -451,73 +1304,34 @@ def deciles_chart(
     time_window="",
 ):
     """period_column must be dates / datetimes"""
+    import matplotlib
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-    df = compute_deciles(df, period_column, column, has_outer_percentiles=False)
+    deciles = compute_percentiles(df, period_column, column, DECILES)
 
     sns.set_style("whitegrid", {"grid.color": ".9"})
 
     fig, ax = plt.subplots(1, 1, figsize=(15, 8))
 
-    linestyles = {
-        "decile": {
-            "line": "b--",
-            "linewidth": 1,
-            "label": "Decile",
-        },
-        "median": {
-            "line": "b-",
-            "linewidth": 1.5,
-            "label": "Median",
-        },
-        "percentile": {
-            "line": "b:",
-            "linewidth": 0.8,
-            "label": "1st-9th, 91st-99th percentile",
-        },
-    }
-    label_seen = []
-    for percentile in range(1, 100):  # plot each decile line
-        data = df[df["percentile"] == percentile]
-        add_label = False
-
-        if percentile == 50:
-            style = linestyles["median"]
-            add_label = True
-
-        else:
-            style = linestyles["decile"]
-            if "decile" not in label_seen:
-                label_seen.append("decile")
-                add_label = True
-        if add_label:
-            label = style["label"]
-        else:
-            label = "_nolegend_"
-
-        ax.plot(
-            data[period_column],
-            data[column],
-            style["line"],
-            linewidth=style["linewidth"],
-            label=label,
-        )
+    plot_percentiles(ax, deciles)
     ax.set_ylabel(ylabel, size=15, alpha=0.6)
     if title:
         ax.set_title(title, size=14, wrap=True)
     # set ymax across all subplots as largest value across dataset
 
     ax.set_ylim(
-        [0, 100 if df[column].isnull().values.all() else df[column].max() * 1.05]
+        [0, 100 if deciles.isnull().values.all() else deciles.max().max() * 1.05]
     )
     ax.tick_params(labelsize=12)
     ax.set_xlim(
-        [df[period_column].min(), df[period_column].max()]
+        [deciles.index.min(), deciles.index.max()]
     )  # set x axis range as full date range
 
     plt.setp(ax.xaxis.get_majorticklabels(), rotation=90)
     ax.xaxis.set_major_formatter(matplotlib.dates.DateFormatter("%B %Y"))
 
-    plt.xticks(sorted(df[period_column].unique()), rotation=90)
+    plt.xticks(deciles.index, rotation=90)
 
     plt.vlines(
         x=[pd.to_datetime("2020-03-01")],
@@ -560,29 +1374,73 @@ def get_composite_indicator_counts(df, numerators, denominator: str, date: str):
     dataframe with the counts of individuals who have varying numbers of the indicators
     within each composite.
     """
-    indicator_num = df.loc[:, numerators].sum(axis=1)
-    count_df = indicator_num.value_counts().reset_index()
-    count_df = count_df.rename(
-        columns={"index": "num_indicators", 0: "count"}
-    ).sort_values(by="num_indicators")
+    composite_counts = get_composite_counts(
+        df, {"composite": (numerators, denominator)}, date
+    )
+    return composite_counts["composite"]
 
-    # drop count of individuals with no indicators within composite
-    count_df = count_df[count_df["num_indicators"] != 0]
 
-    count_df["date"] = date
-    count_df["denominator"] = df[denominator].sum()
+def get_composite_counts(df, composites, date: str):
+    """
+    Returns a dict of the `get_composite_indicator_counts` for each of composites, a
+    dict of name: (numerators, denominator), counting them all in one pass over df.
 
-    return count_df
+    The numerators are read once into a uint8 matrix, with a row for each numerator
+    that is 1 where it's 1. Each composite's count for every patient is the sum of the
+    rows of its numerators, and the counts of all the composites are tabulated
+    together with a single `np.bincount`.
+    """
+    numerators = list(
+        dict.fromkeys(
+            numerator
+            for composite_numerators, _ in composites.values()
+            for numerator in composite_numerators
+        )
+    )
+    matrix = np.empty((len(numerators), len(df)), dtype=np.uint8)
+    for row, numerator in zip(matrix, numerators):
+        np.equal(df[numerator].to_numpy(), 1, out=row.view(bool))
 
+    width = max([len(n) for n, _ in composites.values()], default=0) + 1
+    patient_counts = np.zeros(
+        (len(composites), len(df)), dtype=np.min_scalar_type(len(composites) * width)
+    )
+    for i, (composite_numerators, _) in enumerate(composites.values()):
+        for numerator in composite_numerators:
+            patient_counts[i] += matrix[numerators.index(numerator)]
+        # offset each composite's counts so that they're tabulated in their own bins
+        patient_counts[i] += i * width
+    histograms = np.bincount(
+        patient_counts.ravel(), minlength=len(composites) * width
+    ).reshape(len(composites), width)
+
+    composite_counts = {}
+    for (name, (composite_numerators, denominator)), histogram in zip(
+        composites.items(), histograms
+    ):
+        # `df.sum(axis=1)` is only int64 when all the numerators are ints, and the
+        # counts keep its dtype so that they're written in the same way
+        dtype = df.iloc[:1].loc[:, composite_numerators].sum(axis=1).dtype
+
+        # drop count of individuals with no indicators within composite
+        num_indicators = np.flatnonzero(histogram[1:]) + 1
+        count_df = pd.DataFrame(
+            {
+                "num_indicators": num_indicators.astype(dtype),
+                "count": histogram[num_indicators],
+            }
+        )
+        count_df["date"] = date
+        count_df["denominator"] = df[denominator].sum()
+        composite_counts[name] = count_df
+
+    return composite_counts
 
-def co_prescription(df, medications_x: str, medications_y: str) -> None:
-    """
-    Takes in an input.csv file containing necessary co-prescribing vars
-    and generates a new column indicating co-prescribing of medications_x
-    and medications_y.
-    """
 
-    columns = [
+def co_prescription_columns(medications_x: str, medications_y: str) -> list:
+    """Returns the columns `co_prescription` needs for medications_x and
+    medications_y."""
+    return [
         medications_x,
         medications_y,
         f"earliest_{medications_x}_month_3",
@@ -599,157 +1457,222 @@ def co_prescription(df, medications_x: str, medications_y: str) -> None:
         f"latest_{medications_y}_month_1",
     ]
 
-    # check df contains all necessary co-prescribing vars and convert to datetime
+
+# a prescription of medications_x and one of medications_y are co-prescribed if they
+# are less than CO_PRESCRIPTION_DAYS apart. Each window is the (bound, month) of the
+# x and y dates compared and whether the x date must be less than that many days
+# either side of ("within"), before ("after") or after ("before") the y date.
+CO_PRESCRIPTION_DAYS = 28
+CO_PRESCRIPTION_WINDOWS = [
+    (("earliest", 3), ("earliest", 3), "within"),
+    (("earliest", 3), ("latest", 3), "within"),
+    (("latest", 3), ("earliest", 3), "within"),
+    (("latest", 3), ("latest", 3), "within"),
+    (("latest", 3), ("earliest", 2), "after"),
+    (("earliest", 2), ("latest", 3), "before"),
+    (("earliest", 2), ("earliest", 2), "within"),
+    (("earliest", 2), ("latest", 2), "within"),
+    (("latest", 2), ("earliest", 2), "within"),
+    (("latest", 2), ("latest", 2), "within"),
+    (("latest", 2), ("earliest", 1), "after"),
+    (("earliest", 1), ("latest", 2), "before"),
+    (("earliest", 1), ("earliest", 1), "within"),
+    (("earliest", 1), ("latest", 1), "within"),
+    (("latest", 1), ("earliest", 1), "within"),
+    (("latest", 1), ("latest", 1), "within"),
+]
+
+
+def to_day_numbers(dates):
+    """Converts a Series of dates to int32 days since 1970-01-01.
+
+    Returns:
+        A tuple of the day numbers and a bool array of which dates are not missing.
+    """
+    if is_datetime64_any_dtype(dates):
+        dates = dates.to_numpy(dtype="datetime64[D]")
+    else:
+        # the same dates appear many times, so only parse each distinct one
+        codes, uniques = pd.factorize(dates)
+        dates = np.append(
+            pd.to_datetime(uniques).to_numpy(dtype="datetime64[D]"),
+            np.datetime64("NaT"),
+        )[codes]
+    return dates.view(np.int64).astype(np.int32), ~np.isnat(dates)
+
+
+def co_prescription_kernel(prescribed, x_dates, y_dates):
+    """Finds which patients were co-prescribed in any of `CO_PRESCRIPTION_WINDOWS`.
+
+    The windows are evaluated in turn into the same two buffers, so no temporary
+    arrays are allocated per window.
+
+    Args:
+        prescribed: bool array of the patients prescribed both medications.
+        x_dates, y_dates: dicts mapping each (bound, month) to the day numbers and
+            not missing mask returned by `to_day_numbers`.
+
+    Returns:
+        A bool array.
+    """
+    co_prescribed = np.zeros(len(prescribed), dtype=bool)
+    difference = np.empty(len(prescribed), dtype=np.int32)
+    in_window = np.empty(len(prescribed), dtype=bool)
+
+    for x_key, y_key, window in CO_PRESCRIPTION_WINDOWS:
+        x_days, x_valid = x_dates[x_key]
+        y_days, y_valid = y_dates[y_key]
+
+        np.subtract(x_days, y_days, out=difference)
+        if window == "within":
+            np.abs(difference, out=difference)
+            np.less(difference, CO_PRESCRIPTION_DAYS, out=in_window)
+        elif window == "after":
+            np.greater(difference, -CO_PRESCRIPTION_DAYS, out=in_window)
+        else:
+            np.less(difference, CO_PRESCRIPTION_DAYS, out=in_window)
+
+        # missing dates are never in a window
+        in_window &= x_valid
+        in_window &= y_valid
+        co_prescribed |= in_window
+
+    co_prescribed &= prescribed
+    return co_prescribed
+
+
+def co_prescription(df, medications_x: str, medications_y: str) -> None:
+    """
+    Takes in an input.csv file containing necessary co-prescribing vars
+    and generates a new column indicating co-prescribing of medications_x
+    and medications_y.
+    """
+
+    columns = co_prescription_columns(medications_x, medications_y)
+
+    # check df contains all necessary co-prescribing vars
     for column in columns:
         assert column in df.columns
 
-        if column not in [medications_x, medications_y]:
-            df[column] = pd.to_datetime(df[column])
-
-    df[f"co_prescribed_{medications_x}_{medications_y}"] = (
-        (df[f"{medications_x}"] == 1) & (df[f"{medications_y}"] == 1)
-    ) & (
-        (
-            (
-                df[f"earliest_{medications_x}_month_3"]
-                < (df[f"earliest_{medications_y}_month_3"] + td(days=28))
-            )
-            & (
-                df[f"earliest_{medications_x}_month_3"]
-                > (df[f"earliest_{medications_y}_month_3"] - td(days=28))
-            )
-        )
-        | (
-            (
-                df[f"earliest_{medications_x}_month_3"]
-                < (df[f"latest_{medications_y}_month_3"] + td(days=28))
-            )
-            & (
-                df[f"earliest_{medications_x}_month_3"]
-                > (df[f"latest_{medications_y}_month_3"] - td(days=28))
-            )
-        )
-        | (
-            (
-                df[f"latest_{medications_x}_month_3"]
-                < (df[f"earliest_{medications_y}_month_3"] + td(days=28))
-            )
-            & (
-                df[f"latest_{medications_x}_month_3"]
-                > (df[f"earliest_{medications_y}_month_3"] - td(days=28))
-            )
-        )
-        | (
-            (
-                df[f"latest_{medications_x}_month_3"]
-                < (df[f"latest_{medications_y}_month_3"] + td(days=28))
-            )
-            & (
-                df[f"latest_{medications_x}_month_3"]
-                > (df[f"latest_{medications_y}_month_3"] - td(days=28))
-            )
-        )
-        | (
-            df[f"latest_{medications_x}_month_3"]
-            > (df[f"earliest_{medications_y}_month_2"] - td(days=28))
-        )
-        | (
-            df[f"earliest_{medications_x}_month_2"]
-            < (df[f"latest_{medications_y}_month_3"] + td(days=28))
-        )
-        | (
-            (
-                df[f"earliest_{medications_x}_month_2"]
-                < (df[f"earliest_{medications_y}_month_2"] + td(days=28))
-            )
-            & (
-                df[f"earliest_{medications_x}_month_2"]
-                > (df[f"earliest_{medications_y}_month_2"] - td(days=28))
-            )
-        )
-        | (
-            (
-                df[f"earliest_{medications_x}_month_2"]
-                < (df[f"latest_{medications_y}_month_2"] + td(days=28))
-            )
-            & (
-                df[f"earliest_{medications_x}_month_2"]
-                > (df[f"latest_{medications_y}_month_2"] - td(days=28))
-            )
-        )
-        | (
-            (
-                df[f"latest_{medications_x}_month_2"]
-                < (df[f"earliest_{medications_y}_month_2"] + td(days=28))
-            )
-            & (
-                df[f"latest_{medications_x}_month_2"]
-                > (df[f"earliest_{medications_y}_month_2"] - td(days=28))
-            )
-        )
-        | (
-            (
-                df[f"latest_{medications_x}_month_2"]
-                < (df[f"latest_{medications_y}_month_2"] + td(days=28))
-            )
-            & (
-                df[f"latest_{medications_x}_month_2"]
-                > (df[f"latest_{medications_y}_month_2"] - td(days=28))
-            )
-        )
-        | (
-            df[f"latest_{medications_x}_month_2"]
-            > (df[f"earliest_{medications_y}_month_1"] - td(days=28))
-        )
-        | (
-            df[f"earliest_{medications_x}_month_1"]
-            < (df[f"latest_{medications_y}_month_2"] + td(days=28))
-        )
-        | (
-            (
-                df[f"earliest_{medications_x}_month_1"]
-                < (df[f"earliest_{medications_y}_month_1"] + td(days=28))
-            )
-            & (
-                df[f"earliest_{medications_x}_month_1"]
-                > (df[f"earliest_{medications_y}_month_1"] - td(days=28))
-            )
-        )
-        | (
-            (
-                df[f"earliest_{medications_x}_month_1"]
-                < (df[f"latest_{medications_y}_month_1"] + td(days=28))
-            )
-            & (
-                df[f"earliest_{medications_x}_month_1"]
-                > (df[f"latest_{medications_y}_month_1"] - td(days=28))
-            )
-        )
-        | (
-            (
-                df[f"latest_{medications_x}_month_1"]
-                < (df[f"earliest_{medications_y}_month_1"] + td(days=28))
-            )
-            & (
-                df[f"latest_{medications_x}_month_1"]
-                > (df[f"earliest_{medications_y}_month_1"] - td(days=28))
-            )
-        )
-        | (
-            (
-                df[f"latest_{medications_x}_month_1"]
-                < (df[f"latest_{medications_y}_month_1"] + td(days=28))
+    x_dates = {}
+    y_dates = {}
+    for bound in ["earliest", "latest"]:
+        for month in [3, 2, 1]:
+            x_dates[(bound, month)] = to_day_numbers(
+                df[f"{bound}_{medications_x}_month_{month}"]
             )
-            & (
-                df[f"latest_{medications_x}_month_1"]
-                > (df[f"latest_{medications_y}_month_1"] - td(days=28))
+            y_dates[(bound, month)] = to_day_numbers(
+                df[f"{bound}_{medications_y}_month_{month}"]
             )
+
+    prescribed = ((df[medications_x] == 1) & (df[medications_y] == 1)).to_numpy()
+
+    df[f"co_prescribed_{medications_x}_{medications_y}"] = co_prescription_kernel(
+        prescribed, x_dates, y_dates
+    ).astype(np.int64)
+
+
+INDICATOR_E_F_NUMERATORS = ["indicator_e_numerator", "indicator_f_numerator"]
+INDICATOR_E_F_COLUMNS = (
+    ["ppi"]
+    + co_prescription_columns("anticoagulant", "antiplatelet_including_aspirin")
+    + co_prescription_columns("aspirin", "antiplatelet_excluding_aspirin")
+)
+
+
+def add_indicator_e_f(df) -> None:
+    """Adds the indicator E and F numerator columns to df.
+
+    These depend on co-prescribing within the last three months, so aren't
+    calculated by the study definition. The co-prescribing vars in df are left
+    unchanged.
+    """
+    co_prescribing = df.loc[:, INDICATOR_E_F_COLUMNS]
+
+    # for indicator E
+    co_prescription(co_prescribing, "anticoagulant", "antiplatelet_including_aspirin")
+    df["indicator_e_numerator"] = (
+        (co_prescribing["anticoagulant"] == 1)
+        & (co_prescribing["ppi"] == 0)
+        & (
+            co_prescribing["co_prescribed_anticoagulant_antiplatelet_including_aspirin"]
+            == 1
         )
     )
 
-    df[f"co_prescribed_{medications_x}_{medications_y}"] = df[
-        f"co_prescribed_{medications_x}_{medications_y}"
-    ].map({False: 0, True: 1})
+    # for indicator F
+    co_prescription(co_prescribing, "aspirin", "antiplatelet_excluding_aspirin")
+    df["indicator_f_numerator"] = (
+        (co_prescribing["aspirin"] == 1)
+        & (co_prescribing["ppi"] == 0)
+        & (co_prescribing["co_prescribed_aspirin_antiplatelet_excluding_aspirin"] == 1)
+    )
+
+
+def has_indicator_e_f(monthly_file) -> bool:
+    """Checks if an input_filtered file was written by the fused filter stage and
+    so already contains the indicator E and F numerators."""
+    return not monthly_file.missing_columns(INDICATOR_E_F_NUMERATORS)
+
+
+def require_filtered_columns(manifest, columns):
+    """Checks the input_filtered files have `columns`, and that the indicator E
+    and F numerators are available for every month, either in the file itself or
+    in the matching indicator_e_f file.
+
+    Raises:
+        ValueError: if any columns or indicator_e_f files are missing.
+    """
+    manifest.require_columns("input_filtered", columns)
+
+    unfused = [
+        date
+        for date, input_file in manifest.iter_files("input_filtered")
+        if not has_indicator_e_f(input_file)
+    ]
+    missing = [date for date in unfused if manifest.get("indicator_e_f", date) is None]
+    if missing:
+        raise ValueError(f"Missing indicator_e_f files for: {', '.join(missing)}")
+    manifest.require_columns(
+        "indicator_e_f", ["patient_id"] + INDICATOR_E_F_NUMERATORS, dates=unfused
+    )
+
+
+def get_indicator_matrix(df, columns):
+    """Returns a boolean array with a row for each row of df and a column for each of
+    columns (which may repeat), that is True where the column is 1.
+
+    Each column is compared on its own, so that columns of different dtypes aren't
+    converted to a single object array first.
+    """
+    matrix = np.empty((len(df), len(columns)), dtype=bool)
+    for i, column in enumerate(columns):
+        matrix[:, i] = df[column].to_numpy() == 1
+    return matrix
+
+
+def read_filtered(manifest, date, input_file, columns):
+    """Reads `columns` and the indicator E and F numerators for a month.
+
+    Fused input_filtered files already hold the numerators. Otherwise they are
+    joined on from the month's indicator_e_f file.
+    """
+    if has_indicator_e_f(input_file):
+        return input_file.read(columns + INDICATOR_E_F_NUMERATORS)
+
+    df = input_file.read(columns)
+    indicator_e_f = manifest.get("indicator_e_f", date).read(
+        ["patient_id"] + INDICATOR_E_F_NUMERATORS
+    )
+    e_dict = dict(
+        zip(indicator_e_f["patient_id"], indicator_e_f["indicator_e_numerator"])
+    )
+    f_dict = dict(
+        zip(indicator_e_f["patient_id"], indicator_e_f["indicator_f_numerator"])
+    )
+    df["indicator_e_numerator"] = df["patient_id"].map(e_dict)
+    df["indicator_f_numerator"] = df["patient_id"].map(f_dict)
+    return df
 
 
 def drop_irrelevant_practices(df):
@@ -780,35 +1703,43 @@ def suppress_practice_measures(df, n, numerator, denominator, rate_column):
 
 
 def group_low_values(df, value_col, population_col, term_col):
-    def suppress(df):
-        suppressed_count = df.loc[df[value_col] <= 5, value_col].sum()
-        # population_suppressed_count = df.loc[df[value_col]<=5, population_col].sum()
-        population = df[population_col].mean()
-        if suppressed_count == 0:
-            pass
-
-        else:
-            df.loc[df[value_col] <= 5, value_col] = np.nan
-
-            while suppressed_count <= 5:
-                suppressed_count += df[value_col].min()
-                df.loc[df[value_col].idxmin(), value_col] = np.nan
-
-                # population_suppressed_count += df.loc[df[value_col].idxmin(), population_col]
-
-            df = df[df[value_col].notnull()]
-
-            other_row = {
-                term_col: "Other",
-                value_col: suppressed_count,
-                "date": df["date"].unique()[0],
-                population_col: population,
-            }
-            df = df.append(other_row, ignore_index=True)
-
-        return df
+    """Redacts low values of value_col within each date, replacing them with a single
+    "Other" row holding their total at the end of the date. The population of the
+    "Other" row is the mean of population_col for the date.
+    """
+    groups, dates = pd.factorize(df["date"], sort=True)
+    df = df[groups >= 0]
+    groups = groups[groups >= 0]
 
-    return df.groupby(by=["date"]).apply(suppress).reset_index(drop=True)
+    redact, redacted_dates, totals = get_suppression(
+        df[value_col].to_numpy(dtype=np.float64), groups, 5
+    )
+    if not redacted_dates.any():
+        return df.reset_index(drop=True)
+
+    population = df[population_col].to_numpy(dtype=np.float64)
+    has_population = ~np.isnan(population)
+    population_mean = np.bincount(
+        groups[has_population],
+        weights=population[has_population],
+        minlength=len(dates),
+    ) / np.bincount(groups[has_population], minlength=len(dates))
+
+    # missing values are dropped along with the redacted ones
+    keep = ~(redacted_dates[groups] & (redact | df[value_col].isna().to_numpy()))
+    other_rows = pd.DataFrame(
+        {
+            term_col: "Other",
+            value_col: totals[redacted_dates],
+            "date": dates[redacted_dates],
+            population_col: population_mean[redacted_dates],
+        }
+    )
+    df = pd.concat([df[keep], other_rows], ignore_index=True)
+    order = np.argsort(
+        np.r_[groups[keep], np.flatnonzero(redacted_dates)], kind="stable"
+    )
+    return df.take(order).reset_index(drop=True)
 
 
 def get_number_practices(df):
@@ -875,56 +1806,17 @@ def deciles_chart_subplots(
     time_window="",
 ):
     """period_column must be dates / datetimes"""
-    sns.set_style("whitegrid", {"grid.color": ".9"})
-
-    df = compute_deciles(df, period_column, column, has_outer_percentiles=False)
-    linestyles = {
-        "decile": {
-            "line": "b--",
-            "linewidth": 1,
-            "label": "Decile",
-        },
-        "median": {
-            "line": "b-",
-            "linewidth": 1.5,
-            "label": "Median",
-        },
-        "percentile": {
-            "line": "b:",
-            "linewidth": 0.8,
-            "label": "1st-9th, 91st-99th percentile",
-        },
-    }
-    label_seen = []
-    for percentile in range(1, 100):  # plot each decile line
-        data = df[df["percentile"] == percentile]
-        add_label = False
+    import matplotlib
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-        if percentile == 50:
-            style = linestyles["median"]
-            add_label = True
-        elif show_outer_percentiles and (percentile < 10 or percentile > 90):
-            style = linestyles["percentile"]
-            if "percentile" not in label_seen:
-                label_seen.append("percentile")
-                add_label = True
-        else:
-            style = linestyles["decile"]
-            if "decile" not in label_seen:
-                label_seen.append("decile")
-                add_label = True
-        if add_label:
-            label = style["label"]
-        else:
-            label = "_nolegend_"
+    sns.set_style("whitegrid", {"grid.color": ".9"})
 
-        ax.plot(
-            data[period_column],
-            data[column],
-            style["line"],
-            linewidth=style["linewidth"],
-            label=label,
-        )
+    quantiles = DECILES
+    if show_outer_percentiles:
+        quantiles = np.sort(np.concatenate([quantiles, OUTER_PERCENTILES]))
+    deciles = compute_percentiles(df, period_column, column, quantiles)
+    plot_percentiles(ax, deciles, show_outer_percentiles)
     ax.vlines(
         x=[pd.to_datetime("2020-03-01")],
         ymin=0,
@@ -950,15 +1842,15 @@ def deciles_chart_subplots(
 
     # set ymax across all subplots as largest value across dataset
     ax.set_ylim(
-        [0, df[column].max() * 1.05 if (df[column].max() * 1.05) < 100 else 100]
+        [0, deciles.max().max() * 1.05 if (deciles.max().max() * 1.05) < 100 else 100]
     )
     ax.tick_params(labelsize=18)
     ax.set_xlim(
-        [df[period_column].min(), df[period_column].max()]
+        [deciles.index.min(), deciles.index.max()]
     )  # set x axis range as full date range
     ax.tick_params(axis="x", labelrotation=90, size=15, labelsize=22)
     ax.xaxis.set_major_formatter(matplotlib.dates.DateFormatter("%B %Y"))
-    ax.set_xticks(sorted(df[period_column].unique()))
+    ax.set_xticks(deciles.index)
     if show_legend:
         ax.legend(
             bbox_to_anchor=(1.5, 1),  # arbitrary location in axes
@@ -974,11 +1866,165 @@ def deciles_chart_subplots(
     return plt
 
 
+def deciles_chart_panels(
+    panels, filename, nrows, ncols, figsize, bottom, removed_axes=()
+):
+    """Draws a grid of deciles_chart_subplots panels and saves it to filename.
+
+    Args:
+        panels: A list of (df, kwargs) pairs, one for each panel, where kwargs are
+            passed to `deciles_chart_subplots`. Panels fill the grid row by row.
+        filename: The path to save the figure to.
+        nrows: The number of rows in the grid.
+        ncols: The number of columns in the grid.
+        figsize: The size of the figure.
+        bottom: The position of the bottom edge of the panels, as a fraction of the
+            figure height.
+        removed_axes: The (row, column) positions in the grid to leave empty.
+    """
+    import matplotlib.pyplot as plt
+
+    fig, axs = plt.subplots(nrows, ncols, figsize=figsize, sharex="col")
+    axs = np.reshape(axs, (nrows, ncols))
+    for position in removed_axes:
+        fig.delaxes(axs[position])
+
+    positions = [
+        (i, j) for i in range(nrows) for j in range(ncols) if (i, j) not in removed_axes
+    ]
+    for position, (df, kwargs) in zip(positions, panels):
+        deciles_chart_subplots(df, ax=axs[position], **kwargs)
+
+    fig.subplots_adjust(bottom=bottom)
+    fig.savefig(filename)
+
+
+class GroupSumAccumulator:
+    """Accumulates the monthly sums of value columns for each group of key.
+
+    The sums are kept in a single array indexed by (date, group, column) that is
+    allocated up front and only grows if a month has more groups than any before it,
+    instead of keeping a DataFrame per month and measure. The array is only float if
+    a month has float sums, and the dtypes of each month's sums are kept so that
+    `get_sums` returns the same dtypes as the groupby.
+
+    Args:
+        key: The column to group by.
+        value_columns: The columns to sum.
+        dates: The dates of the months that will be added.
+    """
+
+    def __init__(self, key, value_columns, dates):
+        self.key = key
+        self.value_columns = list(value_columns)
+        self.dates = list(dates)
+        self.groups = {}
+        self.dtypes = {}
+        self.sums = np.zeros(
+            (len(self.dates), 0, len(self.value_columns)), dtype=np.int64
+        )
+
+    def add(self, date, df):
+        """Adds the sums for the month of date from df."""
+        self.add_sums(date, df.groupby(by=[self.key])[self.value_columns].sum())
+
+    def add_sums(self, date, sums):
+        """Adds the sums for the month of date, indexed by key, e.g. from
+        `get_sums`."""
+        sums = sums.loc[:, self.value_columns]
+        values = sums.to_numpy()
+
+        num_groups = len(sums)
+        if num_groups > self.sums.shape[1]:
+            padding = max(num_groups, 2 * self.sums.shape[1]) - self.sums.shape[1]
+            self.sums = np.pad(self.sums, ((0, 0), (0, padding), (0, 0)))
+        if values.dtype.kind == "f" and self.sums.dtype.kind != "f":
+            self.sums = self.sums.astype(np.float64)
+
+        self.sums[self.dates.index(date), :num_groups] = values
+        self.groups[date] = sums.index
+        self.dtypes[date] = sums.dtypes
+
+    def get_sums(self, date, columns=None):
+        """Returns the sums of `columns` (defaults to all the value columns) for the
+        month of date, the same as `df.groupby(key)[columns].sum()`."""
+        columns = self.value_columns if columns is None else columns
+        positions = [self.value_columns.index(column) for column in columns]
+        groups = self.groups[date]
+        return pd.DataFrame(
+            self.sums[self.dates.index(date), : len(groups)][:, positions],
+            index=groups,
+            columns=columns,
+        ).astype(self.dtypes[date][columns].to_dict())
+
+    def iter_frames(self, columns):
+        """Yields (date, DataFrame) pairs in date order. Each DataFrame has the key
+        and `columns`, the same as `df.groupby(key)[columns].sum().reset_index()`
+        for that month."""
+        for date in self.dates:
+            if date in self.groups:
+                yield date, self.get_sums(date, columns).reset_index()
+
+
+class PatientSet:
+    """A set of patient ids, kept as a sorted array of unique int64s rather than a
+    list or set of Python ints.
+
+    Ids are added a month at a time. Each month's ids are kept until they outnumber
+    the ids already in the set, and then merged into it, so that the set isn't
+    re-sorted for every month and holds at most a few times as many ids as it has
+    unique patients.
+
+    Args:
+        patient_ids: The ids to start with.
+    """
+
+    def __init__(self, patient_ids=()):
+        self.ids = np.unique(np.asarray(patient_ids, dtype=np.int64))
+        self.pending = []
+        self.num_pending = 0
+
+    def add(self, patient_ids):
+        """Adds patient_ids to the set."""
+        patient_ids = np.asarray(patient_ids, dtype=np.int64)
+        self.pending.append(patient_ids)
+        self.num_pending += len(patient_ids)
+        if self.num_pending > len(self.ids):
+            self._merge()
+
+    def _merge(self):
+        if self.pending:
+            self.ids = np.unique(np.concatenate([self.ids, *self.pending]))
+            self.pending = []
+            self.num_pending = 0
+
+    @classmethod
+    def union(cls, patient_sets):
+        """Returns a PatientSet of the patients in any of patient_sets."""
+        union = cls()
+        for patient_set in patient_sets:
+            patient_set._merge()
+            union.add(patient_set.ids)
+        union._merge()
+        return union
+
+    def __len__(self):
+        self._merge()
+        return len(self.ids)
+
+
 def update_demographics(demographics_df, df):
-    """Updates demographics_df with values from df."""
-    demographics_df = demographics_df.append(
-        df[demographics_df.columns]
-    ).drop_duplicates(subset="patient_id", keep="last")
+    """Updates demographics_df with values from df.
+
+    demographics_df has one row per patient, so only the rows of patients in df are
+    dropped from it before df is added, rather than deduplicating every row again.
+    """
+    rows = df.loc[:, demographics_df.columns].drop_duplicates(
+        subset="patient_id", keep="last"
+    )
+    demographics_df = pd.concat(
+        [demographics_df[~demographics_df["patient_id"].isin(rows["patient_id"])], rows]
+    )
     return demographics_df
 
 
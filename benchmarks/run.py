@@ -0,0 +1,352 @@
+"""Times each stage of the pipeline on synthetic data.
+
+The cohort is written by analysis/synthetic_cohort.py for each size (number of
+patients) and the practice-level measures by analysis/ehrQL/synthetic_measures.py,
+then each stage is run --repeat times on them. e.g.
+
+    python benchmarks/run.py --sizes 10k 1M --months 2
+
+The results are added to benchmarks/results/<machine>.json under the current commit,
+and compared with the latest results of another commit on the same machine (or
+--baseline). A stage is a regression if its fastest time is more than --threshold
+times the baseline's (and not only a few milliseconds slower), and the script exits
+with 1 if any stage is.
+
+These files aren't named test_*.py, so pytest doesn't collect them.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).parents[1]
+sys.path.insert(0, str(BASE_DIR / "analysis"))
+sys.path.insert(1, str(BASE_DIR / "analysis" / "ehrQL"))
+
+import filter_population  # noqa: E402
+import utilities  # noqa: E402
+from config import indicators_list  # noqa: E402
+from synthetic_cohort import generate_cohort  # noqa: E402
+from synthetic_measures import generate_measures  # noqa: E402
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+SIZES = {"10k": 10_000, "1M": 1_000_000, "10M": 10_000_000}
+
+# slowdowns of less than this are within the noise of timing the fastest stages
+MIN_REGRESSION_SECONDS = 0.01
+
+DEMOGRAPHICS = ["age_band", "sex", "region", "imd", "ethnicity"]
+
+# the stages, in the order they're run. Each is a function of a `BenchmarkData` that
+# does any setup and returns the function to time
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Times each stage of the pipeline on synthetic data"
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", choices=list(SIZES), default=["10k"], help="patients"
+    )
+    parser.add_argument("--months", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+    )
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument(
+        "--baseline", help="commit to compare with (defaults to the latest other one)"
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="don't add the results to the file"
+    )
+    return parser.parse_args()
+
+
+class BenchmarkData:
+    """The synthetic inputs of each stage for num_patients patients and num_months
+    months, written to directory. Each input is only made the first time a stage
+    needs it."""
+
+    def __init__(self, directory, num_patients, num_months):
+        self.directory = Path(directory)
+        self.num_patients = num_patients
+        self.dates = pd.date_range("2019-09-01", periods=num_months, freq="MS")
+        self._cache = {}
+
+    def _get(self, name, make):
+        if name not in self._cache:
+            self._cache[name] = make()
+        return self._cache[name]
+
+    def cohort(self):
+        """Writes the input files and returns the manifest of directory."""
+        return self._get("cohort", self._make_cohort)
+
+    def _make_cohort(self):
+        generate_cohort(self.dates, self.num_patients, self.directory)
+        return utilities.InputManifest(self.directory)
+
+    def joined(self):
+        """Writes the input_joined files and returns the manifest of directory."""
+        return self._get("joined", self._make_joined)
+
+    def _make_joined(self):
+        self.cohort()
+        utilities.join_ethnicity_region(self.directory)
+        return utilities.InputManifest(self.directory)
+
+    def filtered(self):
+        """Writes the input_filtered files and returns the manifest of directory."""
+        return self._get("filtered", self._make_filtered)
+
+    def _make_filtered(self):
+        run_filter_population(self.joined(), self.directory)
+        return utilities.InputManifest(self.directory)
+
+    def measures(self):
+        """Returns a practice-level measure table for the practices of the cohort,
+        as generate-measures writes one."""
+        return self._get("measures", self._make_measures)
+
+    def _make_measures(self):
+        measures = generate_measures(
+            self.dates,
+            np.arange(1, max(10, self.num_patients // 8000) + 1),
+            ["a"],
+            seed=0,
+            realistic=True,
+            zero_inflation=0.2,
+        )
+        return measures.rename(
+            columns={
+                "interval_start": "date",
+                "ratio": "value",
+                "numerator": "indicator_a_numerator",
+                "denominator": "indicator_a_denominator",
+            }
+        ).drop(columns=["measure", "interval_end"])
+
+
+def run_filter_population(manifest, directory):
+    with patch.object(filter_population, "OUTPUT_DIR", directory):
+        for date, input_file in manifest.iter_files("input_joined"):
+            filter_population.filter_population(date, input_file)
+
+
+@benchmark("join_ethnicity_region")
+def bench_join_ethnicity_region(data):
+    data.cohort()
+    return lambda: utilities.join_ethnicity_region(data.directory)
+
+
+@benchmark("filter_population")
+def bench_filter_population(data):
+    manifest = data.joined()
+    return lambda: run_filter_population(manifest, data.directory)
+
+
+@benchmark("co_prescription")
+def bench_co_prescription(data):
+    columns = utilities.co_prescription_columns(
+        "anticoagulant", "antiplatelet_including_aspirin"
+    )
+    frames = [
+        input_file.read(columns)
+        for _, input_file in data.joined().iter_files("input_joined")
+    ]
+
+    def run():
+        for df in frames:
+            utilities.co_prescription(
+                df, "anticoagulant", "antiplatelet_including_aspirin"
+            )
+
+    return run
+
+
+@benchmark("calculate_measures_aggregation")
+def bench_calculate_measures_aggregation(data):
+    value_columns = [
+        f"indicator_{i}_{part}"
+        for i in indicators_list
+        for part in ["numerator", "denominator"]
+        if i not in ["me_no_fbc", "me_no_lft"] or part == "numerator"
+    ] + ["indicator_me_denominator"]
+    frames = {
+        date: input_file.read(["patient_id"] + DEMOGRAPHICS + value_columns)
+        for date, input_file in data.filtered().iter_files("input_filtered")
+    }
+
+    def run():
+        for d in DEMOGRAPHICS:
+            accumulator = utilities.GroupSumAccumulator(d, value_columns, list(frames))
+            for date, df in frames.items():
+                accumulator.add(date, df)
+
+    return run
+
+
+@benchmark("redact_small_numbers")
+def bench_redact_small_numbers(data):
+    measures = data.measures()
+    return lambda: utilities.redact_small_numbers(
+        measures.copy(),
+        7,
+        "indicator_a_numerator",
+        "indicator_a_denominator",
+        "value",
+        "date",
+    )
+
+
+@benchmark("group_low_values")
+def bench_group_low_values(data):
+    measures = data.measures()
+    return lambda: utilities.group_low_values(
+        measures, "indicator_a_numerator", "indicator_a_denominator", "practice"
+    )
+
+
+@benchmark("compute_deciles")
+def bench_compute_deciles(data):
+    measures = data.measures()
+    return lambda: utilities.compute_deciles(measures, "date", "value")
+
+
+@benchmark("deciles_chart")
+def bench_deciles_chart(data):
+    matplotlib.use("Agg")
+    measures = data.measures()
+    filename = data.directory / "deciles_chart.png"
+    return lambda: utilities.deciles_chart(
+        measures, filename, period_column="date", column="value", ylabel="Rate"
+    )
+
+
+def time_benchmark(func, repeat):
+    """Returns the fastest and median of repeat timings of func, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": float(np.median(timings))}
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def find_regressions(results, baseline, threshold):
+    """Returns (stage, size, baseline min, min) for each of results whose fastest time
+    is more than threshold times its fastest time in baseline, and more than
+    `MIN_REGRESSION_SECONDS` slower."""
+    regressions = []
+    for stage, sizes in results.items():
+        for size, timing in sizes.items():
+            baseline_timing = baseline.get(stage, {}).get(size)
+            if baseline_timing is None:
+                continue
+            if (
+                timing["min"] > baseline_timing["min"] * threshold
+                and timing["min"] - baseline_timing["min"] > MIN_REGRESSION_SECONDS
+            ):
+                regressions.append((stage, size, baseline_timing["min"], timing["min"]))
+    return regressions
+
+
+def main():
+    args = parse_args()
+    months = f"x{args.months}"
+    results = {}
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            data = BenchmarkData(directory, SIZES[size], args.months)
+            for stage in args.stages:
+                func = BENCHMARKS[stage](data)
+                timing = time_benchmark(func, args.repeat)
+                results.setdefault(stage, {})[f"{size}{months}"] = timing
+                print(
+                    f"{stage:<32} {size + months:>8} "
+                    f"min {timing['min']:8.3f}s  median {timing['median']:8.3f}s",
+                    flush=True,
+                )
+
+    results_path = RESULTS_DIR / f"{platform.node() or 'machine'}.json"
+    history = json.loads(results_path.read_text()) if results_path.exists() else {}
+    commit = get_commit()
+
+    if args.baseline is not None:
+        baseline_commit = args.baseline
+    else:
+        others = [c for c in history if c != commit]
+        baseline_commit = others[-1] if others else None
+
+    regressions = []
+    if baseline_commit is not None:
+        regressions = find_regressions(
+            results, history.get(baseline_commit, {}).get("results", {}), args.threshold
+        )
+        print(f"\nCompared with {baseline_commit} (threshold {args.threshold}x)")
+        for stage, size, baseline_min, new_min in regressions:
+            print(
+                f"REGRESSION {stage} {size}: {baseline_min:.3f}s -> {new_min:.3f}s "
+                f"({new_min / baseline_min:.2f}x)"
+            )
+        if not regressions:
+            print("No regressions")
+
+    if not args.no_save:
+        entry = history.pop(commit, {"results": {}})
+        for stage, sizes in results.items():
+            entry["results"].setdefault(stage, {}).update(sizes)
+        entry["date"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        entry["python"] = platform.python_version()
+        entry["pandas"] = pd.__version__
+        # the latest commit is kept last
+        history[commit] = entry
+        RESULTS_DIR.mkdir(exist_ok=True)
+        results_path.write_text(json.dumps(history, indent=2) + "\n")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
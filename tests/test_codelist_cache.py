@@ -0,0 +1,77 @@
+import json
+
+import pandas as pd
+import analysis.codelist_cache as codelist_cache
+from unittest.mock import patch
+
+
+calls = []
+
+
+class Codelist(list):
+    system = None
+
+
+def codelist(codes, system):
+    codes = Codelist(codes)
+    codes.system = system
+    return codes
+
+
+def codelist_from_csv(filename, system, column, category_column=None):
+    calls.append(filename)
+    df = pd.read_csv(filename, dtype=str)
+    if category_column is None:
+        return codelist(df[column].tolist(), system)
+    return codelist(list(zip(df[column], df[category_column])), system)
+
+
+def test_load_codelist(tmp_path):
+    calls.clear()
+    csv = tmp_path / "codelist.csv"
+    csv.write_text("code,term\n123,a\n456,b\n")
+    cache_dir = tmp_path / "cache"
+
+    def load():
+        return codelist_cache.load_codelist(codelist_from_csv, codelist, csv, cache_dir, system="snomed", column="code")
+
+    with patch.object(codelist_cache, "_codelists", {}):
+        assert load() == ["123", "456"]
+        assert load() == ["123", "456"]
+        assert len(calls) == 1
+
+    #test that the cache is json rather than a pickle
+    (cache_path,) = cache_dir.iterdir()
+    assert json.loads(cache_path.read_text()) == {"codes": ["123", "456"]}
+
+    #test that another process loads the codelist from the cache
+    with patch.object(codelist_cache, "_codelists", {}):
+        loaded = load()
+        assert loaded == ["123", "456"]
+        assert loaded.system == "snomed"
+        assert len(calls) == 1
+
+    #test that the codelist is parsed again when the csv changes
+    csv.write_text("code,term\n789,c\n")
+    with patch.object(codelist_cache, "_codelists", {}):
+        assert load() == ["789"]
+        assert len(calls) == 2
+
+
+def test_load_codelist_categories(tmp_path):
+    calls.clear()
+    csv = tmp_path / "codelist.csv"
+    csv.write_text("code,group\n123,1\n456,2\n")
+
+    def load():
+        return codelist_cache.load_codelist(codelist_from_csv, codelist, csv, tmp_path / "cache", system="ctv3", column="code", category_column="group")
+
+    with patch.object(codelist_cache, "_codelists", {}):
+        assert load() == [("123", "1"), ("456", "2")]
+
+    #test that the categories are loaded from the cache
+    with patch.object(codelist_cache, "_codelists", {}):
+        loaded = load()
+        assert loaded == [("123", "1"), ("456", "2")]
+        assert isinstance(loaded, Codelist) and loaded.system == "ctv3"
+        assert len(calls) == 1
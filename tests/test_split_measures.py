@@ -0,0 +1,33 @@
+import pandas as pd
+from pandas import testing
+
+from analysis.ehrQL.split_measures import split_measures
+
+
+def test_split_measures(tmp_path):
+    measures = pd.DataFrame(
+        {
+            "measure": ["indicator_a", "indicator_b", "indicator_a", "indicator_b"],
+            "interval_start": ["2020-01-01", "2020-01-01", "2020-02-01", "2020-02-01"],
+            "ratio": ["0.5", "0.25", "", "1.0"],
+            "numerator": ["1", "1", "0", "2"],
+            "denominator": ["2", "4", "0", "2"],
+            # quoted values can span lines
+            "region": ["North East", "North\nWest", "London", "South, West"],
+        }
+    )
+    measures.to_csv(tmp_path / "measures.csv", index=False)
+
+    assert split_measures(tmp_path / "measures.csv", tmp_path) == ["a", "b"]
+
+    for indicator in ["a", "b"]:
+        testing.assert_frame_equal(
+            pd.read_csv(
+                tmp_path / indicator / "measures.csv",
+                dtype=str,
+                keep_default_na=False,
+            ),
+            measures[measures["measure"] == f"indicator_{indicator}"].reset_index(
+                drop=True
+            ),
+        )
@@ -0,0 +1,50 @@
+import pandas as pd
+from pandas import testing
+
+from analysis.synthetic_cohort import generate_cohort
+
+
+def test_generate_cohort(tmp_path):
+    generate_cohort(
+        ["2020-01-01", "2020-02-01"], 1000, tmp_path, num_practices=3, chunk_size=300
+    )
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "input_2020-01-01.feather",
+        "input_2020-02-01.feather",
+        "input_ethnicity.feather",
+    ]
+    ethnicity = pd.read_feather(tmp_path / "input_ethnicity.feather")
+    assert ethnicity["patient_id"].tolist() == list(range(1, 1001))
+
+    df = pd.read_feather(tmp_path / "input_2020-01-01.feather")
+    assert df["patient_id"].tolist() == list(range(1, 1001))
+    assert set(df["practice"]) <= {1, 2, 3}
+
+    # numerators are a subset of their denominators
+    for indicator in ["a", "b", "c", "d", "g", "i", "k", "li", "am"]:
+        numerator = df[f"indicator_{indicator}_numerator"]
+        assert (numerator <= df[f"indicator_{indicator}_denominator"]).all()
+    assert (df["indicator_me_no_fbc_numerator"] <= df["indicator_me_denominator"]).all()
+    assert (
+        df["all_composite_denominator"] >= df["gi_bleed_composite_denominator"]
+    ).all()
+
+    # prescriptions are in the month before the index date that they're for
+    latest = pd.to_datetime(df["latest_anticoagulant_month_1"])
+    assert latest.dropna().between("2019-12-01", "2019-12-31").all()
+    testing.assert_series_equal(
+        df["anticoagulant"] == 1,
+        df[[f"earliest_anticoagulant_month_{m}" for m in (1, 2, 3)]]
+        .notna()
+        .any(axis=1),
+        check_names=False,
+    )
+
+    # the same seed gives the same cohort
+    generate_cohort(
+        ["2020-01-01"], 1000, tmp_path / "again", num_practices=3, chunk_size=300
+    )
+    testing.assert_frame_equal(
+        df, pd.read_feather(tmp_path / "again" / "input_2020-01-01.feather")
+    )
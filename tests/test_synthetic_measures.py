@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas import testing
+
+from analysis.ehrQL.synthetic_measures import generate_measures
+
+
+@pytest.mark.parametrize("realistic", [False, True])
+def test_generate_measures(realistic):
+    months = ["2020-02-01", "2020-01-01", "2020-03-01"]
+    measures = generate_measures(
+        months, [30, 10, 20], ["a", "b"], seed=1, realistic=realistic
+    )
+
+    assert len(measures) == 2 * 3 * 3
+    testing.assert_frame_equal(
+        measures,
+        measures.sort_values(["measure", "interval_start", "practice"]),
+    )
+    assert measures["measure"].astype(str).unique().tolist() == [
+        "indicator_a",
+        "indicator_b",
+    ]
+    assert measures["practice"].unique().tolist() == [10, 20, 30]
+    assert (
+        measures["interval_end"] == measures["interval_start"] + pd.offsets.MonthEnd(0)
+    ).all()
+
+    assert (measures["numerator"] <= measures["denominator"]).all()
+    testing.assert_series_equal(
+        measures["ratio"],
+        (measures["numerator"] / measures["denominator"]).fillna(0),
+        check_names=False,
+    )
+
+    # the same seed gives the same measures
+    testing.assert_frame_equal(
+        measures,
+        generate_measures(
+            months, [30, 10, 20], ["a", "b"], seed=1, realistic=realistic
+        ),
+    )
+
+
+def test_generate_measures_zero_inflation():
+    measures = generate_measures(
+        ["2020-01-01"], np.arange(1, 101), ["a"], seed=1, zero_inflation=1.0
+    )
+    assert (measures["numerator"] == 0).all()
+    assert (measures["ratio"] == 0).all()
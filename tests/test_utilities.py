@@ -1,5 +1,7 @@
 import tempfile
 import shutil
+import subprocess
+import sys
 import pandas as pd
 import numpy as np
 import pytest
@@ -148,7 +150,10 @@ def test_join_ethnicity_region(tmp_path, input_file, input_file_ethnicity):
         input_file_ethnicity.to_feather(utilities.OUTPUT_DIR / 'input_ethnicity.feather')
        
         utilities.join_ethnicity_region(utilities.OUTPUT_DIR)
-        merged_df = pd.read_feather(utilities.OUTPUT_DIR / 'input_2020-01-01.feather')
+        merged_df = pd.read_feather(utilities.OUTPUT_DIR / 'input_joined_2020-01-01.feather')
+
+        #test that the input file is left unchanged
+        testing.assert_frame_equal(pd.read_feather(utilities.OUTPUT_DIR / 'input_2020-01-01.feather'), input_file)
       
         #test that ethnicity vars match corresponding patient_ids
         testing.assert_series_equal(merged_df['ethnicity'], pd.Series([1, 2, 2, 1, 3], name='ethnicity'))
@@ -157,6 +162,23 @@ def test_join_ethnicity_region(tmp_path, input_file, input_file_ethnicity):
         testing.assert_series_equal(merged_df['region'], pd.Series(['East of England', 'East of England', 'East of England', 'North West', 'North West'], name='region'))
         
 
+@pytest.mark.parametrize(
+    "keys",
+    [
+        pd.Series([3, 1, 7, 2, 1]),
+        pd.Series(["E02003251", None, "E02002586", "E02000001", "E02003251"]),
+    ],
+)
+def test_sorted_lookup(keys):
+    lookup_keys = pd.Series([1, 2, 3, 2]) if is_numeric_dtype(keys) else pd.Series(["E02003251", "E02002586", "E02002586"])
+    lookup_values = pd.Series(range(len(lookup_keys)))
+
+    #test that the lookup matches mapping with a dict, including missing and duplicate keys
+    testing.assert_series_equal(
+        utilities.SortedLookup(lookup_keys, lookup_values).map(keys),
+        keys.map(dict(zip(lookup_keys, lookup_values))),
+    )
+
 @pytest.fixture
 def counts_table():
    
@@ -255,6 +277,135 @@ def test_compute_deciles(measure_table, has_outer_percentiles, num_rows):
     assert is_numeric_dtype(obs.percentile)
     assert is_numeric_dtype(obs.value)
 
+
+def test_compute_percentiles():
+    measure_table = pd.DataFrame(
+        {
+            "date": pd.to_datetime(
+                ["2021-02-01"] * 3 + ["2021-01-01"] * 5 + ["2021-03-01", None]
+            ),
+            "value": [1.0, np.nan, 4.0, 5.0, 3.0, 2.0, 2.0, 8.0, np.nan, 7.0],
+        }
+    )
+    quantiles = np.concatenate([utilities.DECILES, utilities.OUTER_PERCENTILES])
+
+    obs = utilities.compute_percentiles(measure_table, "date", "value", quantiles)
+
+    # Pandas interpolates between values in the same way, and keeps the date
+    # without any values.
+    exp = (
+        measure_table.groupby("date")["value"]
+        .quantile(pd.Series(quantiles))
+        .unstack()
+        .loc[:, quantiles]
+        .set_axis(obs.columns, axis=1)
+    )
+    testing.assert_frame_equal(obs, exp, check_names=False)
+    assert list(obs.columns) == [int(q * 100) for q in quantiles]
+    assert obs.loc["2021-03-01"].isnull().all()
+
+
+def test_plot_percentiles():
+    percentiles = pd.DataFrame(
+        np.arange(30, dtype=float).reshape(2, 15),
+        index=pd.to_datetime(["2021-01-01", "2021-02-01"]),
+        columns=[5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 95, 96, 97, 98, 99],
+    )
+    fig, ax = utilities.plt.subplots()
+
+    utilities.plot_percentiles(ax, percentiles, show_outer_percentiles=True)
+
+    # One collection for each style, holding a line for each percentile
+    assert [len(c.get_segments()) for c in ax.collections] == [6, 8, 1]
+    assert ax.get_legend_handles_labels()[1] == [
+        "1st-9th, 91st-99th percentile",
+        "Decile",
+        "Median",
+    ]
+    utilities.plt.close(fig)
+
+
+def save_figure(path, linewidth):
+    utilities.plt.rcParams["lines.linewidth"] = linewidth
+    fig, ax = utilities.plt.subplots()
+    ax.plot([1, 2], [1, 2])
+    fig.savefig(path)
+    return path.name
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_run_figures(tmp_path, max_workers):
+    figures = utilities.plt.get_fignums()
+    linewidth = utilities.plt.rcParams["lines.linewidth"]
+    jobs = [
+        (save_figure, (tmp_path / f"plot_{i}.png",), dict(linewidth=i))
+        for i in range(3)
+    ]
+
+    obs = utilities.run_figures(jobs, max_workers=max_workers)
+
+    assert obs == ["plot_0.png", "plot_1.png", "plot_2.png"]
+    assert all((tmp_path / name).exists() for name in obs)
+    # Jobs close their figures and don't change the settings of later jobs
+    assert utilities.plt.get_fignums() == figures
+    assert utilities.plt.rcParams["lines.linewidth"] == linewidth
+
+
+def save_chart(df, filename, title=""):
+    fig, ax = utilities.plt.subplots()
+    ax.plot(df["value"])
+    ax.set_title(title)
+    fig.savefig(filename)
+    return title
+
+
+def test_run_figures_cache(tmp_path, measure_table):
+    filename = tmp_path / "plot.png"
+    job = (save_chart, (measure_table,), dict(filename=filename, title="a"))
+
+    assert utilities.run_figures([job], max_workers=1) == ["a"]
+    assert (tmp_path / utilities.FIGURE_CACHE_FILE).exists()
+
+    # The order of the rows doesn't matter
+    shuffled = measure_table.sample(frac=1, random_state=1)
+    job = (save_chart, (shuffled,), dict(filename=filename, title="a"))
+    assert utilities.run_figures([job], max_workers=1) == [None]
+
+    # Changed parameters, changed data and missing files are all drawn again
+    job = (save_chart, (measure_table,), dict(filename=filename, title="b"))
+    assert utilities.run_figures([job], max_workers=1) == ["b"]
+    changed = measure_table.assign(value=measure_table["value"] + 1)
+    job = (save_chart, (changed,), dict(filename=filename, title="b"))
+    assert utilities.run_figures([job], max_workers=1) == ["b"]
+    filename.unlink()
+    assert utilities.run_figures([job], max_workers=1) == ["b"]
+    assert utilities.run_figures([job], max_workers=1, use_cache=False) == ["b"]
+
+
+def test_get_figure_key(measure_table):
+    job = (save_chart, (measure_table,), dict(title="a"))
+    key = utilities.get_figure_key(*job)
+
+    assert utilities.get_figure_key(*job) == key
+
+    # The key changes with the chart styles and with func
+    with patch.dict(utilities.PERCENTILE_LINESTYLES["median"], color="r"):
+        assert utilities.get_figure_key(*job) != key
+    assert utilities.get_figure_key(save_figure, *job[1:]) != key
+
+
+def test_import_without_plotting():
+    # stages that don't plot import utilities without matplotlib or seaborn
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, utilities; print(sorted(m for m in ['matplotlib', 'seaborn'] if m in sys.modules))"],
+        cwd=Path(utilities.__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+
 def test_get_composite_indicator_counts(input_file, multiple_indicator_list):
     composite_results = utilities.get_composite_indicator_counts(
         input_file, multiple_indicator_list, "composite_denominator", "2020-10-10")
@@ -270,6 +421,38 @@ def test_get_composite_indicator_counts(input_file, multiple_indicator_list):
         )
     )
 
+
+def test_get_composite_counts(input_file, multiple_indicator_list):
+    df = input_file.copy()
+    df["variable_b"] = df["variable_b"].astype(bool)
+    composites = {
+        "all": (multiple_indicator_list, "composite_denominator"),
+        "a_b": (["variable_a", "variable_b"], "composite_denominator"),
+        "d": (["variable_d"], "composite_denominator"),
+    }
+
+    composite_counts = utilities.get_composite_counts(df, composites, "2020-10-10")
+
+    assert list(composite_counts) == ["all", "a_b", "d"]
+    for name, (numerators, denominator) in composites.items():
+        # the same counts, with the same dtypes, as counting each composite on its own
+        expected = df.loc[:, numerators].sum(axis=1).value_counts()
+        expected = expected[expected.index != 0].sort_index()
+        testing.assert_frame_equal(
+            composite_counts[name],
+            pd.DataFrame(
+                {
+                    "num_indicators": expected.index.to_numpy(),
+                    "count": expected.to_numpy(),
+                    "date": "2020-10-10",
+                    "denominator": df[denominator].sum(),
+                }
+            ),
+        )
+    assert composite_counts["a_b"]["num_indicators"].dtype == np.float64
+    assert composite_counts["d"]["num_indicators"].dtype == np.int64
+
+
 def test_co_prescription(input_file):
     """
     Patient 1 is prescribed x in month 1 and 3 and y in month 2. y overlaps with x in month 1.
@@ -287,6 +470,19 @@ def test_co_prescription(input_file):
     )
 
 
+def test_co_prescription_string_dates(input_file):
+    """Dates are read from the cohortextractor feathers as strings."""
+    date_columns = input_file.columns[input_file.columns.str.contains("_month_")]
+    input_file[date_columns] = input_file[date_columns].apply(lambda c: c.dt.strftime("%Y-%m-%d"))
+
+    utilities.co_prescription(input_file, 'medications_x', 'medications_y')
+
+    testing.assert_series_equal(
+        input_file['co_prescribed_medications_x_medications_y'],
+        pd.Series([1, 0, 0, 1, 0], name='co_prescribed_medications_x_medications_y'),
+    )
+
+
 @pytest.fixture
 def measure_table_for_deciles():
     """Returns a measure table that could have been read by calling `load_and_drop`."""
@@ -334,3 +530,241 @@ def test_group_low_values(composite_indicator_table):
 
     testing.assert_frame_equal(obs, exp)
     
+
+def test_get_suppression():
+    values = np.array([3, 9, 7, 7, 20, 2, 0, 8, np.nan, 4])
+    groups = np.array([0, 0, 0, 0, 0, 1, 1, 1, 2, 2])
+
+    redact, redacted_groups, totals = utilities.get_suppression(values, groups, 5)
+
+    #the smallest remaining value is also redacted, the first of any ties
+    np.testing.assert_array_equal(redact, [True, False, True, False, False, True, True, True, False, True])
+    np.testing.assert_array_equal(redacted_groups, [True, True, True])
+    np.testing.assert_array_equal(totals, [10, 10, 4])
+
+
+def test_group_low_values_all_redacted():
+    table = pd.DataFrame(
+        {
+            "num_indicators": pd.Series([1, 2]),
+            "count": pd.Series([4, 3]),
+            "date": pd.Series(["2019-01-01", "2019-01-01"]),
+            "denominator": pd.Series([500, 500]),
+        }
+    )
+
+    obs = utilities.group_low_values(table, 'count', 'denominator', 'num_indicators')
+
+    exp = pd.DataFrame(
+        {
+            "num_indicators": pd.Series(['Other']),
+            "count": pd.Series([7]).astype(float),
+            "date": pd.Series(["2019-01-01"]),
+            "denominator": pd.Series([500]).astype(float),
+        }
+    )
+    testing.assert_frame_equal(obs, exp)
+
+
+def test_input_manifest(tmp_path, input_file):
+    input_file.to_feather(tmp_path / 'input_2020-02-01.feather')
+    input_file.iloc[:3].to_feather(tmp_path / 'input_2020-01-01.feather')
+    input_file.to_feather(tmp_path / 'input_filtered_2020-01-01.feather')
+    input_file.to_feather(tmp_path / 'input_ethnicity.feather')
+
+    manifest = utilities.InputManifest(tmp_path)
+    assert not (tmp_path / utilities.MANIFEST_FILE).exists()
+    utilities.InputManifest(tmp_path, save_cache=True)
+
+    # files are ordered by date and other feathers are ignored
+    assert manifest.dates("input") == ["2020-01-01", "2020-02-01"]
+    assert manifest.dates("input_filtered") == ["2020-01-01"]
+    assert manifest.dates("indicator_e_f") == []
+
+    date, monthly_file = next(manifest.iter_files("input"))
+    assert monthly_file.path == tmp_path / 'input_2020-01-01.feather'
+    assert monthly_file.num_rows == 3
+    assert monthly_file.columns == list(input_file.columns)
+    assert monthly_file.schema["patient_id"] == "int64"
+
+    # metadata is reused from the cache for unchanged files
+    with patch.object(utilities, "read_feather_metadata") as read_metadata:
+        assert utilities.InputManifest(tmp_path).get("input", "2020-02-01").num_rows == 5
+        read_metadata.assert_not_called()
+
+
+def test_monthly_file_read_columns(tmp_path, input_file):
+    input_file.to_feather(tmp_path / 'input_2020-01-01.feather')
+    input_file.drop(columns=["disease"]).to_feather(tmp_path / 'input_2020-02-01.feather')
+
+    manifest = utilities.InputManifest(tmp_path)
+    monthly_file = manifest.get("input", "2020-01-01")
+
+    df = monthly_file.read(["variable_a", "patient_id"])
+    testing.assert_frame_equal(df, input_file.loc[:, ["variable_a", "patient_id"]])
+
+    with pytest.raises(ValueError, match="missing columns: disease"):
+        manifest.get("input", "2020-02-01").read(["patient_id", "disease"])
+
+    # fails before any month is read if a column is missing from one of them
+    with pytest.raises(ValueError, match="input_2020-02-01.feather: disease"):
+        manifest.require_columns("input", ["patient_id", "disease"])
+    manifest.require_columns("input", ["patient_id", "variable_a"])
+
+
+def test_read_filtered(tmp_path):
+    filtered = pd.DataFrame(
+        {
+            'patient_id': pd.Series([1, 2, 3]),
+            'practice': pd.Series([1, 1, 2]),
+        }
+    )
+    indicator_e_f = pd.DataFrame(
+        {
+            'patient_id': pd.Series([3, 1, 2]),
+            'indicator_e_numerator': pd.Series([True, False, True]),
+            'indicator_f_numerator': pd.Series([False, False, True]),
+        }
+    )
+    expected = filtered.assign(
+        indicator_e_numerator=[False, True, True],
+        indicator_f_numerator=[False, True, False],
+    )
+
+    # written by filter_population and calculate_numerators
+    filtered.to_feather(tmp_path / 'input_filtered_2020-01-01.feather')
+    indicator_e_f.to_feather(tmp_path / 'indicator_e_f_2020-01-01.feather')
+    # written by filter_population --fused
+    expected.to_feather(tmp_path / 'input_filtered_2020-02-01.feather')
+
+    manifest = utilities.InputManifest(tmp_path)
+    utilities.require_filtered_columns(manifest, ['patient_id', 'practice'])
+
+    for date, input_file in manifest.iter_files("input_filtered"):
+        df = utilities.read_filtered(manifest, date, input_file, ['patient_id', 'practice'])
+        testing.assert_frame_equal(df, expected)
+
+    (tmp_path / 'indicator_e_f_2020-01-01.feather').unlink()
+    with pytest.raises(ValueError, match="indicator_e_f files for: 2020-01-01"):
+        utilities.require_filtered_columns(utilities.InputManifest(tmp_path), ['patient_id'])
+
+
+def copy_month(date, monthly_file):
+    monthly_file.read().to_feather(monthly_file.path.with_name(f'copy_{date}.feather'))
+    return date
+
+
+def test_incremental_stage_update(tmp_path, input_file):
+    input_file.to_feather(tmp_path / 'input_2020-01-01.feather')
+    input_file.to_feather(tmp_path / 'input_2020-02-01.feather')
+
+    def update(definition="v1"):
+        stage = utilities.IncrementalStage("copy", "copy_{date}.feather", definition, tmp_path)
+        return stage.update(
+            utilities.InputManifest(tmp_path).iter_files("input"), lambda monthly_files: utilities.run_monthly(copy_month, monthly_files)
+        )
+
+    assert update() == ["2020-01-01", "2020-02-01"]
+    assert (tmp_path / 'copy_2020-02-01.feather').exists()
+
+    #test that up to date months are skipped and new months are processed
+    input_file.to_feather(tmp_path / 'input_2020-03-01.feather')
+    assert update() == ["2020-03-01"]
+    assert update() == []
+
+    #test that months are processed again when their input, output or definition changes
+    input_file.iloc[:3].to_feather(tmp_path / 'input_2020-01-01.feather')
+    (tmp_path / 'copy_2020-02-01.feather').unlink()
+    assert update() == ["2020-01-01", "2020-02-01"]
+    assert update("v2") == ["2020-01-01", "2020-02-01", "2020-03-01"]
+
+
+def test_check_extracted_inputs(tmp_path, input_file):
+    input_file.to_feather(tmp_path / 'input_2020-01-01.feather')
+    utilities.check_extracted_inputs(utilities.InputManifest(tmp_path).iter_files("input"), "v1", tmp_path)
+
+    #test that a month extracted with an earlier definition must be extracted again
+    input_file.to_feather(tmp_path / 'input_2020-02-01.feather')
+    with pytest.raises(ValueError, match="delete to extract again: input_2020-01-01.feather$"):
+        utilities.check_extracted_inputs(utilities.InputManifest(tmp_path).iter_files("input"), "v2", tmp_path)
+
+    input_file.iloc[:3].to_feather(tmp_path / 'input_2020-01-01.feather')
+    utilities.check_extracted_inputs(utilities.InputManifest(tmp_path).iter_files("input"), "v2", tmp_path)
+
+
+def test_get_indicator_matrix():
+    df = pd.DataFrame(
+        {
+            'indicator_a_numerator': pd.Series([1, 0, 1]),
+            'indicator_e_numerator': pd.Series([True, np.nan, False], dtype=object),
+            'indicator_me_denominator': pd.Series([0.0, 1.0, np.nan]),
+        }
+    )
+    matrix = utilities.get_indicator_matrix(
+        df, ['indicator_a_numerator', 'indicator_e_numerator', 'indicator_me_denominator', 'indicator_me_denominator']
+    )
+    np.testing.assert_array_equal(
+        matrix, [[True, True, False, False], [False, False, True, True], [True, False, False, False]]
+    )
+
+
+def test_group_sum_accumulator():
+    months = {
+        "2020-01-01": pd.DataFrame({"region": ["b", "a", "b"], "numerator": [1, 0, 1], "denominator": [1, 1, 1]}),
+        "2020-02-01": pd.DataFrame({"region": ["c", "a", "b", np.nan], "numerator": [0, 1, 1, 1], "denominator": [1, 1, 1, 1]}),
+    }
+    accumulator = utilities.GroupSumAccumulator("region", ["numerator", "denominator"], list(months))
+    for date, df in months.items():
+        accumulator.add(date, df)
+
+    #test that each month matches a groupby of that month, including groups that only appear in later months
+    for date, frame in accumulator.iter_frames(["denominator", "numerator"]):
+        testing.assert_frame_equal(
+            frame, months[date].groupby(by=["region"])[["denominator", "numerator"]].sum().reset_index()
+        )
+
+
+def test_group_sum_accumulator_mixed_dtypes():
+    months = {
+        "2020-01-01": pd.DataFrame({"region": ["b", "a", "b"], "numerator": [1, 0, 1], "denominator": [1, 1, 1]}),
+        "2020-02-01": pd.DataFrame({"region": ["a", "b"], "numerator": [0.5, 1.0], "denominator": [1, 1]}),
+        "2020-03-01": pd.DataFrame({"region": ["a", "c"], "numerator": [2, 3], "denominator": [1, 1]}),
+    }
+    accumulator = utilities.GroupSumAccumulator("region", ["numerator", "denominator"], list(months))
+    for date, df in months.items():
+        accumulator.add(date, df)
+
+    #test that a month with float sums doesn't make the other months' sums floats
+    for date, frame in accumulator.iter_frames(["numerator", "denominator"]):
+        expected = months[date].groupby(by=["region"])[["numerator", "denominator"]].sum().reset_index()
+        testing.assert_frame_equal(frame, expected)
+        assert frame.to_csv(index=False) == expected.to_csv(index=False)
+
+
+def test_patient_set():
+    rng = np.random.default_rng(0)
+    months = [rng.integers(0, 1000, size) for size in [0, 50, 400, 10, 700]]
+
+    patient_set = utilities.PatientSet()
+    for patient_ids in months:
+        patient_set.add(pd.Series(patient_ids))
+
+    #test that patients are counted once, however many months they are in
+    assert len(patient_set) == len(np.unique(np.concatenate(months)))
+
+    #test that a union counts patients in more than one set once
+    other = utilities.PatientSet([1, 2, 1000, 1001])
+    assert len(utilities.PatientSet.union([patient_set, other])) == len(
+        np.union1d(np.concatenate(months), [1, 2, 1000, 1001])
+    )
+    assert len(utilities.PatientSet.union([])) == 0
+
+
+def test_update_demographics():
+    demographics_df = pd.DataFrame(columns=["patient_id", "sex"])
+    demographics_df = utilities.update_demographics(demographics_df, pd.DataFrame({"patient_id": [1, 2, 3], "sex": ["F", "M", "F"], "age": [1, 2, 3]}))
+    demographics_df = utilities.update_demographics(demographics_df, pd.DataFrame({"patient_id": [4, 2, 4], "sex": ["M", "F", "F"], "age": [1, 2, 3]}))
+
+    #test that the latest row for each patient is kept
+    assert demographics_df["patient_id"].tolist() == [1, 3, 2, 4]
+    assert demographics_df["sex"].tolist() == ["F", "F", "F", "F"]
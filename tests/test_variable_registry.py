@@ -0,0 +1,225 @@
+import itertools
+import runpy
+import sys
+import types
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from analysis.ehrQL.variable_registry import VariableRegistry
+
+EHRQL_DIR = Path(__file__).parents[1] / "analysis" / "ehrQL"
+
+
+class Series:
+    """Stands in for an ehrQL table, frame or series. Each one has a serial number,
+    and records the serial numbers of the ones it is built from (and its own)."""
+
+    _serials = itertools.count()
+
+    def __init__(self, *parents):
+        self.serial = next(self._serials)
+        self.ancestors = frozenset([self.serial]).union(
+            *(parent.ancestors for parent in parents if isinstance(parent, Series))
+        )
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Series(self)
+
+    def __call__(self, *args, **kwargs):
+        return Series(self, *args, *kwargs.values())
+
+    def __hash__(self):
+        return id(self)
+
+
+for _operator in [
+    "and",
+    "or",
+    "invert",
+    "lt",
+    "le",
+    "gt",
+    "ge",
+    "eq",
+    "ne",
+    "add",
+    "sub",
+    "rand",
+    "ror",
+    "radd",
+    "rsub",
+]:
+    setattr(Series, f"__{_operator}__", lambda self, *args: Series(self, *args))
+
+
+class Dataset:
+    """Stands in for an ehrQL Dataset, keeping its variables in the order they're
+    added."""
+
+    def __init__(self):
+        object.__setattr__(self, "variables", {})
+
+    def __setattr__(self, name, value):
+        self.variables[name] = value
+
+    def configure_dummy_dataset(self, **kwargs):
+        pass
+
+    def define_population(self, population):
+        pass
+
+
+class Measures:
+    def __init__(self):
+        self.measures = {}
+
+    def define_measure(self, name, **kwargs):
+        self.measures[name] = kwargs
+
+
+@pytest.fixture
+def variables():
+    variables = VariableRegistry()
+    for name in ["age", "practice", "ppi", "oral_nsaid", "asthma"]:
+        variables.add(name, Series())
+    variables.add("latest_asthma", Series(), internal=True)
+    variables.add("unused", Series())
+
+    variables.derive("population_filter", lambda v: v.age & v.practice)
+    variables.derive("a_denominator", lambda v: v.population_filter & ~v.ppi)
+    variables.derive("a_numerator", lambda v: v.a_denominator & v.oral_nsaid)
+    variables.derive(
+        "g_denominator",
+        lambda v: v.population_filter & v.asthma & (v.latest_asthma < v.age),
+    )
+    variables.derive("g_numerator", lambda v: v.g_denominator)
+    return variables
+
+
+@pytest.mark.parametrize(
+    "measure, expected",
+    [
+        (
+            "a",
+            [
+                "age",
+                "practice",
+                "ppi",
+                "oral_nsaid",
+                "population_filter",
+                "a_denominator",
+                "a_numerator",
+            ],
+        ),
+        (
+            "g",
+            [
+                "age",
+                "practice",
+                "asthma",
+                "population_filter",
+                "g_denominator",
+                "g_numerator",
+            ],
+        ),
+    ],
+)
+def test_update_dataset(variables, measure, expected):
+    dataset = SimpleNamespace()
+    names = ["practice", f"{measure}_numerator", f"{measure}_denominator"]
+    variables.update_dataset(dataset, names)
+
+    assert list(vars(dataset)) == expected
+
+    # test that internal variables are dependencies but aren't added to the dataset
+    if measure == "g":
+        assert "latest_asthma" in variables.get_dependencies(names)
+
+
+def test_update_dataset_every_variable(variables):
+    dataset = SimpleNamespace()
+    variables.update_dataset(dataset)
+
+    assert list(vars(dataset)) == [
+        "age",
+        "practice",
+        "ppi",
+        "oral_nsaid",
+        "asthma",
+        "unused",
+        "population_filter",
+        "a_denominator",
+        "a_numerator",
+        "g_denominator",
+        "g_numerator",
+    ]
+
+
+@pytest.fixture
+def run_measure_definition(monkeypatch):
+    """Returns a function that runs measure_definition.py with its arguments, with
+    stand-ins for ehrql, and returns its globals."""
+    ehrql = types.ModuleType("ehrql")
+    ehrql.INTERVAL = Series()
+    ehrql.months = Series()
+    ehrql.Dataset = Dataset
+    ehrql.Measures = Measures
+    codes = types.ModuleType("ehrql.codes")
+    codes.codelist_from_csv = lambda filename, column: [filename]
+    core = types.ModuleType("ehrql.tables.beta.core")
+    core.clinical_events = Series()
+    core.medications = Series()
+    core.patients = Series()
+    tpp = types.ModuleType("ehrql.tables.beta.tpp")
+    tpp.practice_registrations = Series()
+    for module in [ehrql, codes, core, tpp]:
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+
+    monkeypatch.setenv("OPENSAFELY_BACKEND", "expectations")
+    monkeypatch.syspath_prepend(str(EHRQL_DIR))
+    modules = set(sys.modules)
+
+    def run(*args):
+        monkeypatch.setattr(sys, "argv", ["measure_definition.py", *args])
+        return runpy.run_path(str(EHRQL_DIR / "measure_definition.py"))
+
+    yield run
+
+    # the ehrQL modules are imported by name from EHRQL_DIR, so they're forgotten
+    # rather than shadowing other modules with the same names
+    for name in set(sys.modules) - modules:
+        del sys.modules[name]
+
+
+def test_measure_definition_dataset(run_measure_definition):
+    internal = ["registered", "latest_asthma_date", "latest_asthma_resolved_date"]
+
+    every_variable = run_measure_definition()["dataset"].variables
+    assert not set(internal) & set(every_variable)
+
+    measure_variables = run_measure_definition()["measure_variables"]
+    for measure, (numerator, denominator) in measure_variables.items():
+        definition = run_measure_definition("--measures", measure)
+        dataset = definition["dataset"].variables
+        variables = definition["variables"]
+
+        assert list(definition["measures"].measures) == [f"indicator_{measure}"]
+        assert {"registered_practice_id", numerator, denominator} <= set(dataset)
+        assert not set(internal) & set(dataset)
+
+        # every variable that the numerator or denominator is built from is kept
+        ancestors = (
+            getattr(variables, numerator).ancestors
+            | getattr(variables, denominator).ancestors
+        )
+        needed = {
+            name
+            for name in every_variable
+            if getattr(variables, name).serial in ancestors
+        }
+        assert needed <= set(dataset), measure
+        assert len(dataset) < len(every_variable)